@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Benchmarks for piprot.
+
+Measures requirements file parsing, version selection and full runs of
+piprot's main() against a local HTTP server that stands in for PyPI
+(piprot.test.fakeindex), and
+reports the wall time, requests per second and peak memory of each.
+
+Peak memory is the process' maximum RSS so far, pass --tracemalloc to run
+every benchmark a second time and report the peak memory allocated by Python
+during that benchmark instead.
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --packages 500 --jobs 16 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TRACEMALLOC = False
+
+from piprot.piprot import (  # noqa: E402
+    get_latest_version,
+    main,
+    parse_req_file,
+    parse_version,
+    write_snapshot,
+)
+from piprot.test.fakeindex import FakeIndex  # noqa: E402
+
+
+def generate_versions(count, seed=0):
+    """returns count version strings, with some prereleases mixed in"""
+    rand = random.Random(seed)
+    versions = []
+    major, minor, patch = 0, 0, 0
+    while len(versions) < count:
+        step = rand.random()
+        if step < 0.05:
+            major, minor, patch = major + 1, 0, 0
+        elif step < 0.3:
+            minor, patch = minor + 1, 0
+        else:
+            patch += 1
+        version = "{}.{}.{}".format(major, minor, patch)
+        if rand.random() < 0.1:
+            version += rand.choice(["a1", "b2", "rc1", ".dev0"])
+        versions.append(version)
+    rand.shuffle(versions)
+    return versions
+
+
+def generate_project(name, releases):
+    """returns a PyPI-style project JSON document"""
+    start = 1262304000  # 2010-01-01
+    documents = {}
+    for i, version in enumerate(releases):
+        upload_time = time.strftime(
+            "%Y-%m-%dT%H:%M:%S", time.gmtime(start + i * 86400)
+        )
+        documents[version] = [
+            {
+                "filename": "{}-{}.tar.gz".format(name, version),
+                "upload_time": upload_time,
+                "upload_time_iso_8601": upload_time + ".000000Z",
+                "size": 1024,
+                "yanked": False,
+            }
+        ]
+    return {"info": {"name": name, "version": releases[-1]}, "releases": documents}
+
+
+def generate_requirements(directory, packages, files=10):
+    """writes a tree of requirements files that include each other with -r,
+    returning the path of the top level file"""
+    os.makedirs(directory, exist_ok=True)
+    names = ["package-{}".format(i) for i in range(packages)]
+    per_file = max(1, packages // files)
+    paths = []
+    for n in range(files):
+        path = os.path.join(directory, "requirements-{}.txt".format(n))
+        with open(path, "w") as f:
+            f.write("# generated requirements {}\n".format(n))
+            for name in names[n * per_file : (n + 1) * per_file]:
+                f.write("{}==0.0.1\n".format(name))
+        paths.append(path)
+
+    top = os.path.join(directory, "requirements.txt")
+    with open(top, "w") as f:
+        for path in paths:
+            f.write("-r {}\n".format(os.path.basename(path)))
+    return top
+
+
+def generate_lockfile(path, lines, hashes=4):
+    """writes a pip-compile --generate-hashes style lockfile of about lines
+    lines, returning the number of requirements in it"""
+    rand = random.Random(0)
+    written = 0
+    count = 0
+    with open(path, "w") as f:
+        f.write("#\n# This file is autogenerated by pip-compile\n#\n")
+        while written < lines:
+            f.write("package-{}==1.{}.0 \\\n".format(count, count % 10))
+            for n in range(hashes):
+                f.write(
+                    "    --hash=sha256:{:064x}{}\n".format(
+                        rand.getrandbits(256), " \\" if n < hashes - 1 else ""
+                    )
+                )
+            f.write("    # via -r requirements.in\n")
+            written += hashes + 2
+            count += 1
+    return count
+
+
+def measure(name, func, requests=None):
+    """run func, printing its wall time, peak memory and (if requests is
+    given) the number of requests per second it made"""
+    before = requests() if requests else 0
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    if TRACEMALLOC:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        # kilobytes on linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    line = "{:<40} {:>9.3f}s {:>9.1f}MB".format(name, elapsed, peak / 1024 / 1024)
+    if requests:
+        made = requests() - before
+        if TRACEMALLOC:
+            made //= 2
+        line += " {:>9.1f} req/s ({} requests)".format(made / elapsed, made)
+    print(line)
+
+
+def bench_parse(directory, packages):
+    top = generate_requirements(directory, packages)
+
+    def run():
+        with open(top) as f:
+            parse_req_file(f)
+
+    measure("parse_req_file ({} requirements)".format(packages), run)
+
+
+def bench_parse_lockfile(directory, lines):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "requirements.lock")
+    count = generate_lockfile(path, lines)
+
+    def run():
+        with open(path) as f:
+            assert len(parse_req_file(f)) == count
+
+    measure("parse_req_file ({} hashed lines)".format(lines), run)
+
+
+def bench_versions(count):
+    versions = generate_versions(count)
+
+    def parse():
+        parse_version.cache_clear()
+        for version in versions:
+            parse_version(version)
+
+    measure("parse_version ({} versions)".format(count), parse)
+    measure(
+        "get_latest_version ({} versions)".format(count),
+        lambda: get_latest_version(versions),
+    )
+
+
+def bench_main(directory, packages, releases, jobs, latency):
+    names = ["package-{}".format(i) for i in range(packages)]
+    projects = {
+        name: generate_project(name, generate_versions(releases, seed=i))
+        for i, name in enumerate(names)
+    }
+    top = generate_requirements(directory, packages)
+
+    def run(index, jobs, slim, engine, offline=None):
+        with open(top) as f, contextlib.redirect_stdout(io.StringIO()):
+            try:
+                main(
+                    [f],
+                    index_url=index.url,
+                    jobs=jobs,
+                    slim=slim,
+                    engine=engine,
+                    offline=offline,
+                )
+            except SystemExit:
+                pass
+
+    with FakeIndex(projects, latency=latency) as index:
+        for slim in (False, True):
+            runs = [(n, "threads") for n in sorted({1, jobs})] + [(jobs, "asyncio")]
+            for n, engine in runs:
+                measure(
+                    "main ({} packages, jobs={}{}{})".format(
+                        packages,
+                        n,
+                        ", slim" if slim else "",
+                        ", asyncio" if engine == "asyncio" else "",
+                    ),
+                    lambda: run(index, n, slim, engine),
+                    requests=lambda: index.requests,
+                )
+
+        snapshot = os.path.join(directory, "snapshot.db")
+        write_snapshot(snapshot, names, index_url=index.url, jobs=jobs)
+        measure(
+            "main ({} packages, offline)".format(packages),
+            lambda: run(index, jobs, False, "threads", snapshot),
+            requests=lambda: index.requests,
+        )
+
+
+def run_benchmarks():
+    parser = argparse.ArgumentParser(description="piprot benchmarks")
+    parser.add_argument("--requirements", type=int, default=20000)
+    parser.add_argument("--lockfile-lines", type=int, default=50000)
+    parser.add_argument("--versions", type=int, default=10000)
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--releases", type=int, default=200)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="seconds per fake PyPI request"
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="report the peak memory allocated by Python in each benchmark",
+    )
+    args = parser.parse_args()
+
+    global TRACEMALLOC
+    TRACEMALLOC = args.tracemalloc
+
+    directory = tempfile.mkdtemp()
+    try:
+        bench_parse(os.path.join(directory, "parse"), args.requirements)
+        bench_parse_lockfile(os.path.join(directory, "lock"), args.lockfile_lines)
+        bench_versions(args.versions)
+        bench_main(
+            os.path.join(directory, "main"),
+            args.packages,
+            args.releases,
+            args.jobs,
+            args.latency,
+        )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,257 @@
+"""
+asyncio HTTP client for looking up many packages from a single thread
+
+AsyncSession is the asyncio counterpart of thttp.Session: it speaks HTTP/1.1
+over keep-alive connections opened with asyncio.open_connection and returns
+the same thttp.Response tuples. EventLoopThread runs an event loop in the
+background so that the (synchronous) rest of piprot can hand it coroutines.
+"""
+import asyncio
+import functools
+import ssl
+import threading
+from urllib.error import URLError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+from piprot.thttp import (
+    Response,
+    decode_content,
+    prepare_request,
+    redirect_headers,
+    request,
+)
+
+
+class AsyncSession(object):
+    """
+    Makes requests over persistent connections that are pooled per host.
+    AsyncSession.request() takes the same arguments as thttp.Session.request()
+    and returns the same Response tuple, but has to be awaited. Cookies are
+    not supported.
+
+    Requests that need to go through a proxy are passed to thttp.request() in
+    a worker thread.
+    """
+
+    max_redirects = 10
+    max_idle = 10
+
+    def __init__(self, verify=True, timeout=None):
+        self.verify = verify
+        self.timeout = timeout or 60
+        self.ctx = ssl.create_default_context()
+        if not verify:  # ignore ssl errors
+            self.ctx.check_hostname = False
+            self.ctx.verify_mode = ssl.CERT_NONE
+        self.pool = {}
+
+    async def close(self):
+        pool, self.pool = self.pool, {}
+        for connections in pool.values():
+            for _, writer in connections:
+                writer.close()
+
+    async def get_connection(self, key):
+        idle = self.pool.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer), True
+            writer.close()
+
+        scheme, host, port = key
+        if scheme == "https":
+            conn = await asyncio.open_connection(
+                host, port or 443, ssl=self.ctx, server_hostname=host
+            )
+        else:
+            conn = await asyncio.open_connection(host, port or 80)
+        return conn, False
+
+    def release_connection(self, key, conn):
+        idle = self.pool.setdefault(key, [])
+        if len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def read_response(self, reader, method):
+        """returns (status, headers, content, keep_alive) read from reader"""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by the server")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        status = int(status)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1" and "close" not in headers.get(
+            "connection", ""
+        ).lower()
+
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            content = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if not size:
+                    # skip any trailers
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            content = b"".join(chunks)
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        return status, headers, content, keep_alive
+
+    async def send(self, method, url, headers, data, timeout):
+        """
+        Sends a request over a pooled connection, returning (status, content,
+        headers). A reused connection that has been closed by the server is
+        retried once on a fresh connection.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        selector = parts.path or "/"
+        if parts.query:
+            selector += "?" + parts.query
+
+        head = "{} {} HTTP/1.1\r\n".format(method, selector)
+        head += "".join("{}: {}\r\n".format(k, v) for k, v in headers.items())
+        if data is not None:
+            head += "content-length: {}\r\n".format(len(data))
+        message = head.encode("latin-1") + b"\r\n" + (data or b"")
+
+        async def exchange():
+            while True:
+                try:
+                    conn, reused = await self.get_connection(key)
+                except OSError as e:
+                    raise URLError(e)
+
+                reader, writer = conn
+                try:
+                    writer.write(message)
+                    await writer.drain()
+                    return conn, await self.read_response(reader, method)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused:
+                        continue
+                    raise URLError(e)
+                except BaseException:
+                    writer.close()
+                    raise
+
+        # connecting (and the TLS handshake) counts towards the timeout too
+        conn, response = await asyncio.wait_for(exchange(), timeout)
+        status, resp_headers, content, keep_alive = response
+        if keep_alive:
+            self.release_connection(key, conn)
+        else:
+            conn[1].close()
+        return status, content, resp_headers
+
+    async def request(
+        self,
+        url,
+        params={},
+        json=None,
+        data=None,
+        headers={},
+        method="GET",
+        redirect=True,
+        basic_auth=None,
+        timeout=None,
+    ):
+        timeout = timeout or self.timeout
+
+        parts = urlsplit(url)
+        if parts.scheme in getproxies() and not proxy_bypass(parts.hostname):
+            return await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    request,
+                    url,
+                    params=params,
+                    json=json,
+                    data=data,
+                    headers=headers,
+                    method=method,
+                    verify=self.verify,
+                    redirect=redirect,
+                    basic_auth=basic_auth,
+                    timeout=timeout,
+                ),
+            )
+
+        url, data, headers, method = prepare_request(
+            url, params, json, data, headers, method, basic_auth
+        )
+        headers.setdefault("user-agent", "Python-thttp")
+        headers.setdefault("host", urlsplit(url).netloc)
+        if data is not None:
+            headers.setdefault("content-type", "application/x-www-form-urlencoded")
+
+        for _ in range(self.max_redirects + 1):
+            status, content, resp_headers = await self.send(
+                method, url, headers, data, timeout
+            )
+
+            if not (redirect and status in (301, 302, 303, 307, 308)):
+                break
+            if "location" not in resp_headers:
+                break
+
+            location = urljoin(url, resp_headers["location"])
+            headers = redirect_headers(headers, url, location)
+            url = location
+            if status in (301, 302, 303) and method not in ("GET", "HEAD"):
+                method, data = "GET", None
+                headers.pop("content-type", None)
+
+        content, json = decode_content(resp_headers, content)
+        return Response(None, content, json, status, url, resp_headers, None)
+
+
+async def create_semaphore(value):
+    """returns an asyncio.Semaphore, created on the running event loop"""
+    return asyncio.Semaphore(value)
+
+
+class EventLoopThread(object):
+    """Runs an asyncio event loop in a daemon thread, submit() schedules a
+    coroutine on it and returns a concurrent.futures.Future for its result.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        return self.submit(coroutine).result()
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,407 @@
+"""
+on-disk and in-memory caches for PyPI responses
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from stat import S_ISREG
+
+from piprot.thttp import Response
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_STATE_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def default_cache_dir():
+    """returns $XDG_CACHE_HOME/piprot, falling back to ~/.cache/piprot"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "piprot")
+
+
+class DiskCache(object):
+    """
+    Stores successful responses on disk, one file per URL. Each file holds a
+    line of JSON metadata (url, headers) followed by the raw response body.
+
+    The file's mtime is the time the response was last known to be fresh, so
+    a successful revalidation only needs to touch the file. When the cache
+    grows beyond max_size bytes the least recently refreshed entries are
+    removed.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.path = path or default_cache_dir()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size = None
+        self.lock = threading.Lock()
+
+    def path_for(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.path, name)
+
+    def get(self, url):
+        """returns a (response, fresh) tuple, or (None, False) on a miss"""
+        path = self.path_for(url)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                content = f.read()
+            age = time.time() - os.path.getmtime(path)
+        except (IOError, OSError, ValueError):
+            return None, False
+
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+
+        response = Response(
+            None, content, data, 200, meta["url"], meta["headers"], None
+        )
+        return response, age < self.ttl
+
+    def set(self, url, response):
+        meta = json.dumps({"url": url, "headers": response.headers})
+        path = self.path_for(url)
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(meta.encode("utf-8") + b"\n")
+            f.write(response.content)
+
+        with self.lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            if self.size is not None:
+                self.size += os.path.getsize(path) - old_size
+            self.prune()
+
+    def touch(self, url):
+        try:
+            os.utime(self.path_for(url), None)
+        except OSError:
+            pass
+
+    def expire(self, url):
+        """Mark the entry for url stale, it's revalidated the next time it's
+        requested"""
+        try:
+            os.utime(self.path_for(url), (0, 0))
+        except OSError:
+            pass
+
+    def delete(self, url):
+        path = self.path_for(url)
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            if self.size is not None:
+                self.size -= size
+
+    def entries(self):
+        """returns a list of (mtime, size, path) for every entry in the cache"""
+        entries = []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return entries
+
+        for name in names:
+            # entries are named with a bare hash, skip .tmp and other files
+            if "." in name:
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # e.g. another cache in a sub-directory
+            if not S_ISREG(stat.st_mode):
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def items(self):
+        """yields (url, headers, mtime) for every entry in the cache, reading
+        just their metadata"""
+        for mtime, _, path in self.entries():
+            try:
+                with open(path, "rb") as f:
+                    meta = json.loads(f.readline().decode("utf-8"))
+            except (IOError, OSError, ValueError):
+                continue
+            yield meta["url"], meta["headers"], mtime
+
+    def prune(self):
+        """remove the oldest entries until the cache fits in max_size"""
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+
+        if self.size <= self.max_size:
+            return
+
+        for _, size, path in sorted(self.entries()):
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def request(self, url, request, headers={}):
+        """
+        Fetch url using the request function, answering from the cache while
+        entries are fresh and revalidating stale entries with their ETag or
+        Last-Modified header.
+        """
+        cached, fresh = self.get(url)
+        if cached and fresh:
+            return cached
+        response = request(url, headers=self.conditional_headers(cached, headers))
+        return self.update(url, cached, response)
+
+    def conditional_headers(self, cached, headers={}):
+        """returns headers with the validators of a cached response added"""
+        headers = dict(headers)
+        if cached:
+            if "etag" in cached.headers:
+                headers["If-None-Match"] = cached.headers["etag"]
+            if "last-modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers["last-modified"]
+        return headers
+
+    def update(self, url, cached, response):
+        """store the response to a (possibly conditional) request for url,
+        returning the response to use"""
+        if response.status == 304 and cached:
+            self.touch(url)
+            return cached
+
+        if response.status == 200 and response.content:
+            self.set(url, response)
+        return response
+
+
+class AliasMap(object):
+    """
+    Remembers the name each project was actually found under when looking it
+    up by its own name needed a redirect. With a path the aliases are loaded
+    from, and saved back to, a JSON file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.aliases = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        if path:
+            try:
+                with open(path) as f:
+                    self.aliases = json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def get(self, name, default=None):
+        return self.aliases.get(name, default)
+
+    def set(self, name, alias):
+        with self.lock:
+            if self.aliases.get(name) != alias:
+                self.aliases[name] = alias
+                self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.aliases, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+
+class StateFile(object):
+    """
+    What the last check found for each (package, pinned version): the
+    latest version, both release dates and the X-PyPI-Last-Serial of the
+    response, saved to a JSON file. Entries are used for ttl seconds, after
+    that the package is looked up again.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_STATE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        try:
+            with open(path) as f:
+                self.entries = json.load(f).get("packages", {})
+        except (IOError, OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def key(name, version):
+        return "{}=={}".format(name, version)
+
+    def get(self, name, version, now=None):
+        """returns the entry for name==version, or None if there isn't a
+        fresh one"""
+        now = time.time() if now is None else now
+        entry = self.entries.get(self.key(name, version))
+        if entry and now - entry.get("checked", 0) < self.ttl:
+            return entry
+        return None
+
+    def set(self, name, version, latest_version, version_date, latest_date, serial):
+        """Record a check, dates are ISO 8601 strings"""
+        with self.lock:
+            self.entries[self.key(name, version)] = {
+                "latest_version": latest_version,
+                "version_date": version_date,
+                "latest_date": latest_date,
+                "serial": serial,
+                "checked": time.time(),
+            }
+            self.dirty = True
+
+    def sync(self, changed, since, synced=None):
+        """Forget the entries for projects in changed, a dict of name to the
+        serial of its latest change (see piprot.sync), that were recorded
+        before that change. The rest are marked as checked now if they're
+        known to be up to date as of the serial since: their serial is at
+        least since or they were checked after the last sync, at the time
+        synced (if known). Older entries, and those without a serial, are left to
+        expire."""
+        now = time.time()
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                serial = entry.get("serial")
+                if serial is None:
+                    continue
+                if changed.get(key.partition("==")[0], 0) > serial:
+                    del self.entries[key]
+                elif serial >= since or (
+                    synced is not None and entry.get("checked", 0) >= synced
+                ):
+                    entry["checked"] = now
+            self.dirty = True
+
+    def save(self):
+        """Write the entries that haven't expired back to the file"""
+        if not self.dirty:
+            return
+
+        now = time.time()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self.lock:
+            entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if now - entry.get("checked", 0) < self.ttl
+            }
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"packages": entries}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+
+class MemoryCache(object):
+    """
+    A thread-safe, in-memory LRU of up to max_size entries that can be used
+    as the responses of a PackageStore shared by many checks. Entries older
+    than ttl seconds are treated as missing. on_evict, if given, is called
+    with the key of each entry that is dropped to make room or because it
+    expired.
+    """
+
+    def __init__(self, max_size=10000, ttl=DEFAULT_TTL, on_evict=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        evicted = []
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                evicted.append(self.entries.popitem(last=False)[0])
+        for old_key in evicted:
+            self.evicted(old_key)
+
+    def get(self, key, default=None, count=True):
+        expired = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] >= self.ttl:
+                del self.entries[key]
+                entry, expired = None, True
+            if entry is not None:
+                self.entries.move_to_end(key)
+            if count:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        if expired:
+            self.evicted(key)
+        return default if entry is None else entry[1]
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def update(self, items):
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def evicted(self, key):
+        if self.on_evict is not None:
+            self.on_evict(key)
@@ -0,0 +1,150 @@
+"""
+parsers for lockfiles and pyproject.toml
+
+Each parser takes an open file and returns the same list of (requirement,
+version, ignore) tuples as parse_req_file(), with every package listed once:
+
+- Pipfile.lock     the "default" and "develop" packages
+- poetry.lock      every [[package]] from an index
+- uv.lock          every [[package]] from an index (not the project itself)
+- pyproject.toml   pinned PEP 621 dependencies, optional dependencies and
+                   PEP 735 dependency groups
+
+poetry.lock and uv.lock are read one line at a time. pyproject.toml needs
+tomllib (Python 3.11+) or tomli, without them it isn't in READABLE_LOCKFILES.
+"""
+import json
+import os
+import re
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+from piprot.reqfile import Requirement, canonicalize_name, parse_line
+
+# name = "value" at the top level of a [[package]] table
+LOCK_KEY = re.compile(r"^(name|version|source|type) = (.*?)\s*$")
+# sources that aren't a package index, these packages can't be looked up
+LOCAL_SOURCE = re.compile(
+    r'\b(editable|virtual|path|directory|git|url|file) =|^"(git|directory|file|url)"$'
+)
+
+
+class PackageList(object):
+    """Collects (name, version, False) tuples, keeping the first of each
+    project"""
+
+    def __init__(self):
+        self.seen = set()
+        self.packages = []
+
+    def add(self, name, version):
+        if not (name and version) or canonicalize_name(name) in self.seen:
+            return
+        self.seen.add(canonicalize_name(name))
+        self.packages.append((name, version, False))
+
+    def add_package(self, package):
+        """adds a package read from a lockfile, unless it's a local one"""
+        if package and not package.get("local"):
+            self.add(package.get("name"), package.get("version"))
+
+
+def parse_pipfile_lock(lock_file):
+    """returns the pinned packages of a Pipfile.lock"""
+    lock = json.load(lock_file)
+    packages = PackageList()
+    for section in ("default", "develop"):
+        for name, details in lock.get(section, {}).items():
+            version = details.get("version", "")
+            if version.startswith("=="):
+                packages.add(name, version.lstrip("="))
+    return packages.packages
+
+
+def parse_package_lock(lock_file):
+    """returns the packages of a poetry.lock or uv.lock, both list them as
+    [[package]] tables with a name and version"""
+    packages = PackageList()
+    package = None  # the [[package]] being read
+    table = None  # and the sub-table of it, e.g. [package.source]
+
+    for line in lock_file:
+        if line.startswith("["):
+            header = line.strip()
+            if header == "[[package]]":
+                packages.add_package(package)
+                package, table = {}, None
+            elif package is not None and header.lstrip("[").startswith("package."):
+                table = header
+            else:
+                packages.add_package(package)
+                package = None
+            continue
+
+        match = LOCK_KEY.match(line)
+        if package is None or not match:
+            continue
+
+        key, value = match.groups()
+        if table is None and key in ("name", "version") and value.startswith('"'):
+            package[key] = json.loads(value)
+        elif (table is None and key == "source") or (
+            table == "[package.source]" and key == "type"
+        ):
+            package["local"] = bool(LOCAL_SOURCE.search(value))
+
+    packages.add_package(package)
+    return packages.packages
+
+
+def parse_pyproject(pyproject_file):
+    """returns the pinned dependencies of a pyproject.toml"""
+    if tomllib is None:
+        raise ImportError(
+            "Reading pyproject.toml needs Python 3.11+ or tomli (pip install tomli)"
+        )
+
+    content = pyproject_file.read()
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    document = tomllib.loads(content)
+
+    project = document.get("project", {})
+    specifiers = list(project.get("dependencies", []))
+    for group in project.get("optional-dependencies", {}).values():
+        specifiers.extend(group)
+    for group in document.get("dependency-groups", {}).values():
+        # entries can also be {include-group = "..."} tables
+        specifiers.extend(spec for spec in group if isinstance(spec, str))
+
+    packages = PackageList()
+    for spec in specifiers:
+        record = parse_line(0, spec, spec)
+        if isinstance(record, Requirement):
+            packages.add(record.name, record.version)
+    return packages.packages
+
+
+LOCKFILE_PARSERS = {
+    "Pipfile.lock": parse_pipfile_lock,
+    "poetry.lock": parse_package_lock,
+    "uv.lock": parse_package_lock,
+    "pyproject.toml": parse_pyproject,
+}
+# the names of the files that can be read with the installed packages
+READABLE_LOCKFILES = tuple(
+    name for name in LOCKFILE_PARSERS if tomllib or name != "pyproject.toml"
+)
+
+
+def get_lockfile_parser(path):
+    """returns the parser for a lockfile path (or URL), None for anything
+    else"""
+    name = os.path.basename(path.split("?")[0])
+    return LOCKFILE_PARSERS.get(name)
@@ -5,80 +5,220 @@ piprot - How rotten are your requirements?
 from __future__ import print_function
 
 import argparse
+import asyncio
+import configparser
+import contextlib
+import fnmatch
+import io
 import json
 import operator
 import os
 import re
 import sys
+import threading
 import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
-from piprot.thttp import request, HTTPError
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit
+
+from piprot.aio import AsyncSession, EventLoopThread, create_semaphore
+from piprot.lockfiles import READABLE_LOCKFILES, get_lockfile_parser
+from piprot.reqfile import (
+    URL,
+    Include,
+    IncludeResolver,
+    Requirement,
+    canonicalize_name,
+    get_include_path,
+    parse_requirements,
+)
+from piprot.retry import (
+    DEFAULT_RETRIES,
+    AsyncRetryingSession,
+    RetryingSession,
+    RetryPolicy,
+)
+from piprot.snapshot import Snapshot
+from piprot.sync import (
+    ChangelogError,
+    expire_changed,
+    get_changes,
+    get_last_serial,
+    load_serial,
+    save_serial,
+)
+from piprot.thttp import request, HTTPError, Response, Session
 
 from six.moves import input
 
 from . import __version__
-from .providers.github import build_github_url, get_requirements_file_from_url
+from .cache import (
+    DEFAULT_STATE_TTL,
+    DEFAULT_TTL,
+    AliasMap,
+    DiskCache,
+    MemoryCache,
+    StateFile,
+    default_cache_dir,
+)
+from .providers.github import (
+    GITHUB_API_BASE,
+    GITHUB_RAW_BASE,
+    AsyncGithubSession,
+    GithubError,
+    GithubSession,
+    build_github_url,
+    build_github_url_async,
+    get_org_requirements_files,
+    get_requirements_file_from_url,
+    get_requirements_files,
+    get_requirements_file_from_url_async,
+)
 
 
 VERSION = __version__
 PYPI_BASE_URL = "https://pypi.org/pypi"
+PYPI_SIMPLE_URL = "https://pypi.org/simple"
+SIMPLE_JSON = "application/vnd.pypi.simple.v1+json"
+SDIST_EXTENSIONS = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".zip")
+DEFAULT_JOBS = 8
+OUTPUT_FORMATS = ("text", "json", "ndjson")
+ENGINES = ("threads", "asyncio")
+# the files piprot checks when none are given, in order of preference
+DEFAULT_FILES = ("requirements.txt",) + READABLE_LOCKFILES
+GITHUB_SOURCE = re.compile(
+    r"^github:(?P<repo>[^@:]+)(?:@(?P<branch>[^:]+))?(?::(?P<path>.+))?$"
+)
+GITHUB_ORG_SOURCE = re.compile(r"^github-org:(?P<org>[^/:@]+)$")
+# raised by requests that fail to connect or time out, after any retries
+REQUEST_ERRORS = (OSError, asyncio.TimeoutError)
+
+
+PEP440_VERSION = re.compile(
+    r"""
+    ^v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?:[-_.]?(?P<pre_l>alpha|a|beta|b|preview|pre|c|rc)[-_.]?(?P<pre_n>[0-9]+)?)?
+    (?:-(?P<post_n1>[0-9]+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>[0-9]+)?)?
+    (?:[-_.]?(?P<dev_l>dev)[-_.]?(?P<dev_n>[0-9]+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    $
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
+LEGACY_PRERELEASE = re.compile(r"(a|b|c|rc|alpha|beta|pre|preview|dev|svn|git)")
+PRERELEASE_RANKS = {"a": 0, "alpha": 0, "b": 1, "beta": 1}
 
 
 class PiprotVersion(object):
-    def __init__(self, version, parts=[]):
-        self.parts = [int(re.sub(r"\D", "", p) or 0) for p in parts]
-        self.version = version
+    """An immutable, parsed version.
+
+    Everything needed to compare versions is worked out once, up front, and
+    kept in `key`, so comparisons are plain tuple comparisons. Versions that
+    follow PEP 440 sort the way pip sorts them (epochs, pre, post and dev
+    releases, local versions). Anything else falls back to comparing the
+    numbers in each dot separated part, and sorts before a PEP 440 version
+    with the same numbers.
+    """
+
+    __slots__ = ("version", "release", "prerelease", "key")
+
+    def __init__(self, version):
+        version = version.strip()
+        match = PEP440_VERSION.match(version)
+
+        if match:
+            release = tuple(int(p) for p in match.group("release").split("."))
+            epoch = int(match.group("epoch") or 0)
+            pre_l, dev_l = match.group("pre_l"), match.group("dev_l")
+            post_n = match.group("post_n1") or match.group("post_n2")
+            post = match.group("post_l") or match.group("post_n1")
+            local = match.group("local")
+
+            if pre_l:
+                pre_n = int(match.group("pre_n") or 0)
+                pre = (PRERELEASE_RANKS.get(pre_l.lower(), 2), pre_n)
+            elif dev_l and not post:
+                # 1.0.dev1 comes before 1.0a1
+                pre = (-1, 0)
+            else:
+                pre = (3, 0)
+
+            tail = (
+                1,
+                pre,
+                int(post_n or 0) if post else -1,
+                (0, int(match.group("dev_n") or 0)) if dev_l else (1, 0),
+                tuple(
+                    (1, int(p), "") if p.isdigit() else (0, 0, p.lower())
+                    for p in re.split(r"[-_.]", local)
+                )
+                if local
+                else (),
+            )
+            prerelease = bool(pre_l or dev_l)
+        else:
+            parts = version.replace("-", ".").split(".")
+            if len(parts) > 5:
+                parts = []
+            release = tuple(int(re.sub(r"\D", "", p) or 0) for p in parts)
+            epoch = 0
+            prerelease = bool(LEGACY_PRERELEASE.search(version))
+            tail = (0, int(not prerelease))
+
+        trimmed = release
+        while trimmed and trimmed[-1] == 0:
+            trimmed = trimmed[:-1]
+
+        setattr_ = super(PiprotVersion, self).__setattr__
+        setattr_("version", version)
+        setattr_("release", release)
+        setattr_("prerelease", prerelease)
+        setattr_("key", (epoch, trimmed, tail))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PiprotVersion is immutable")
+
+    @property
+    def parts(self):
+        return list(self.release)
 
     def __str__(self):
         return str(self.version)
 
-    def __cmp__(self, other):
-        if self.version == other.version:
-            return 0
-
-        our_parts = self.parts
-        other_parts = other.parts
+    def __repr__(self):
+        return "PiprotVersion({!r})".format(self.version)
 
-        # ensure both _parts_ lists have the same length
-        while len(our_parts) > len(other_parts):
-            other_parts.append(0)
+    def __hash__(self):
+        return hash(self.key)
 
-        while len(other_parts) > len(our_parts):
-            our_parts.append(0)
-
-        for us, them in zip(self.parts, other.parts):
-            if us != them:
-                return us - them
+    def __eq__(self, other):
+        return self.key == other.key
 
-        if self.is_prerelease():
-            return -1
+    def __ne__(self, other):
+        return self.key != other.key
 
-        if other.is_prerelease():
-            return 1
+    def __lt__(self, other):
+        return self.key < other.key
 
-        # um, yeah
-        return 0
+    def __le__(self, other):
+        return self.key <= other.key
 
-    def __lt__(self, other):
-        return self.__cmp__(other) < 0
+    def __gt__(self, other):
+        return self.key > other.key
 
-    def __eq__(self, other):
-        return self.__cmp__(other) == 0
+    def __ge__(self, other):
+        return self.key >= other.key
 
     def is_prerelease(self):
-        return bool(
-            re.search(r"(a|b|c|rc|alpha|beta|pre|preview|dev|svn|git)", self.version)
-        )
+        return self.prerelease
 
 
+@lru_cache(maxsize=65536)
 def parse_version(version):
-    version = version.strip().replace("-", ".")
-    parts = version.split(".")
-
-    if len(parts) > 0 and len(parts) < 6:
-        # well, that was (fairly) easy
-        return PiprotVersion(version, parts)
     return PiprotVersion(version)
 
 
@@ -90,47 +230,758 @@ def get_pypi_url(requirement, version=None, base_url=PYPI_BASE_URL):
     return "{base}/{req}/json".format(base=base_url, req=requirement, version=version)
 
 
-def parse_req_file(req_file, verbatim=False):
-    """Take a file and return a dict of (requirement, versions, ignore) based
-    on the files requirements specs.
+def get_pypi_release_url(requirement, version, base_url=PYPI_BASE_URL):
     """
-    req_list = []
-    requirements = req_file.readlines()
-    for requirement in requirements:
-        requirement_no_comments = requirement.split("#")[0].strip()
-
-        # if matching requirement line (Thing==1.2.3), update dict, continue
-        req_match = re.match(
-            r"\s*(?P<package>[^\s\[\]]+)(?P<extras>\[\S+\])?==(?P<version>\S+)",
-            requirement_no_comments,
+    Get the PyPI url for the JSON of a single release of a requirement. Unlike
+    the project JSON, this only lists the files of that release.
+    """
+    return "{base}/{req}/{version}/json".format(
+        base=base_url, req=requirement, version=version
+    )
+
+
+def get_index_urls(index_url):
+    """
+    Get the (JSON API, Simple API) base urls of a package index. The index url
+    can be the root of the index or the url of either API, so
+    'https://pypi.org', 'https://pypi.org/pypi' and 'https://pypi.org/simple'
+    all return ('https://pypi.org/pypi', 'https://pypi.org/simple').
+
+    Only indexes laid out like PyPI, with both APIs under the same root, are
+    supported: a devpi index's '.../+simple/' url can't be described.
+    """
+    root = re.sub(r"/(pypi|simple)$", "", index_url.rstrip("/"))
+    return root + "/pypi", root + "/simple"
+
+
+def get_renamed_url(url, response):
+    """Return the JSON url that a project JSON url redirects to, given the
+    response to a HEAD request for the project page, or None"""
+    if response.status in (301, 302, 307, 308) and "location" in response.headers:
+        renamed_url = urljoin(url, response.headers["location"]).rstrip("/")
+        if not renamed_url.endswith("/json"):
+            renamed_url += "/json"
+        return renamed_url
+    return None
+
+
+def get_simple_url(requirement, simple_url=PYPI_SIMPLE_URL):
+    """
+    Get the Simple API (PEP 503 / PEP 691) url for a given requirement. The
+    default simple url is 'https://pypi.org/simple'
+    """
+    return "{base}/{req}/".format(base=simple_url, req=requirement)
+
+
+def get_file_version(filename):
+    """Return the version in the name of a distribution file (a wheel, egg or
+    sdist), or None"""
+    if filename.endswith((".whl", ".egg")):
+        parts = filename.split("-")
+        return parts[1] if len(parts) > 2 else None
+    for extension in SDIST_EXTENSIONS:
+        if filename.endswith(extension):
+            name, _, version = filename[: -len(extension)].rpartition("-")
+            return version if name else None
+    return None
+
+
+def get_simple_versions(project):
+    """Return the versions of a project from its PEP 691 Simple API JSON: its
+    "versions" (PEP 700), or the versions in the names of its files"""
+    if "versions" in project:
+        return list(project["versions"])
+    files = project.get("files", [])
+    versions = (get_file_version(f.get("filename", "")) for f in files)
+    return list(OrderedDict.fromkeys(v for v in versions if v))
+
+
+def get_latest_version(versions):
+    """Return the latest version from an iterable of version strings, ignoring
+    prereleases unless there is nothing else to pick from.
+    """
+    parsed = [(parse_version(v), v) for v in versions]
+    stable = [(p.key, v) for p, v in parsed if not p.prerelease]
+
+    # if we don't have a stable version, let's pick up a prerelease one
+    candidates = stable or [(p.key, v) for p, v in parsed]
+    if not candidates:
+        return None
+    return max(candidates, key=operator.itemgetter(0))[1]
+
+
+class PackageStore(object):
+    """Keeps the PyPI JSON response for each project seen during a run so
+    that every project is only fetched once, no matter how many times (or in
+    how many requirements files) it is referenced.
+
+    With slim=True the full project JSON isn't downloaded at all. The release
+    list comes from the Simple API and upload times from the JSON of just the
+    releases that are needed (the latest one and the pinned ones). These are
+    combined into a response that looks like a (much smaller) project JSON.
+
+    Packages are looked up on the index at base_url / simple_url, then on each
+    of the extra_index_urls in turn until one of them has the package. routes
+    maps package name patterns (like 'acme-*') to the index url that those
+    packages should be looked up on, skipping all of the other indexes.
+
+    Projects are looked up by their PEP 503 name. If an index redirects that
+    name elsewhere (e.g. the project was renamed) the new name is kept in
+    aliases, an AliasMap, and used for any later lookups.
+
+    Responses are kept in a dict unless another mapping is given, such as a
+    MemoryCache to bound a store that lives for a long time. Responses may
+    disappear from it at any time, forget() is called for those it evicts.
+
+    With a RetryPolicy, policy, requests are retried and rate limits waited
+    out (see piprot.retry). timeout is the number of seconds to wait for each
+    response.
+
+    With a Snapshot, snapshot, every package is looked up in it instead of
+    on an index and no requests are made at all.
+    """
+
+    def __init__(
+        self,
+        base_url=PYPI_BASE_URL,
+        cache=None,
+        session=None,
+        slim=False,
+        simple_url=PYPI_SIMPLE_URL,
+        extra_index_urls=(),
+        routes=None,
+        aliases=None,
+        responses=None,
+        policy=None,
+        timeout=None,
+        snapshot=None,
+    ):
+        self.base_url = base_url
+        self.simple_url = simple_url
+        self.extra_indexes = [get_index_urls(url) for url in extra_index_urls]
+        self.routes = [
+            (canonicalize_name(pattern), get_index_urls(url))
+            for pattern, url in (routes or {}).items()
+        ]
+        self.cache = cache
+        self.policy = policy
+        self.timeout = timeout
+        self.session = session or Session(timeout=timeout)
+        if policy is not None:
+            self.session = RetryingSession(self.session, policy)
+        self.slim = slim and snapshot is None
+        self.snapshot = snapshot
+        self.aliases = aliases if aliases is not None else AliasMap()
+        self.responses = responses if responses is not None else {}
+        self.sources = {}
+        self.partial = set()
+        self.fetched = {}
+        self.loop = None
+        self.async_session = None
+        self.lock = threading.Lock()
+
+    def key(self, requirement):
+        return canonicalize_name(requirement)
+
+    def resolve(self, requirement):
+        """Return the name to look requirement up with: its PEP 503 name, or
+        the name it was found under last time if it had to be redirected.
+        """
+        name = canonicalize_name(requirement)
+        return self.aliases.get(name, name)
+
+    def learn(self, name, url):
+        """Remember the name a project was found under if a lookup for name
+        had to follow a redirect to url.
+        """
+        parts = [p for p in urlsplit(url).path.split("/") if p]
+        if len(parts) >= 2 and parts[-1] == "json":
+            found = canonicalize_name(parts[-2])
+            if found != name:
+                self.aliases.set(name, found)
+
+    def request(self, url, headers={}):
+        if self.cache is not None:
+            return self.cache.request(url, self.session.request, headers=headers)
+        return self.session.request(url, headers=headers)
+
+    async def request_async(self, url, headers={}):
+        if self.cache is None:
+            return await self.async_session.request(url, headers=headers)
+
+        cached, fresh = self.cache.get(url)
+        if cached and fresh:
+            return cached
+        response = await self.async_session.request(
+            url, headers=self.cache.conditional_headers(cached, headers)
         )
-        req_ignore = requirement.strip().endswith("  # norot")
+        return self.cache.update(url, cached, response)
+
+    def indexes(self, requirement):
+        """Return the (base_url, simple_url) of each index to look for
+        requirement on, in order.
+        """
+        name = canonicalize_name(requirement)
+        for pattern, index in self.routes:
+            if fnmatch.fnmatchcase(name, pattern):
+                return [index]
+        return [(self.base_url, self.simple_url)] + self.extra_indexes
+
+    def fetch(self, requirement, versions=()):
+        if self.snapshot is not None:
+            return self.snapshot.response(self.key(requirement))
+        name = self.resolve(requirement)
+        for base_url, simple_url in self.indexes(name):
+            if self.slim:
+                response = self.fetch_slim(name, versions, base_url, simple_url)
+            else:
+                response = self.fetch_json(name, base_url)
+            if response.status != 404:
+                break
+        return response
+
+    async def fetch_async(self, requirement, versions=()):
+        if self.snapshot is not None:
+            return self.snapshot.response(self.key(requirement))
+        name = self.resolve(requirement)
+        for base_url, simple_url in self.indexes(name):
+            if self.slim:
+                response = await self.fetch_slim_async(
+                    name, versions, base_url, simple_url
+                )
+            else:
+                response = await self.fetch_json_async(name, base_url)
+            if response.status != 404:
+                break
+        return response
+
+    def fetch_json(self, name, base_url=PYPI_BASE_URL):
+        url = get_pypi_url(name, base_url=base_url)
+        response = self.request(url)
+
+        # see if the url is 404'ing because the project has been renamed
+        if response.status == 404:
+            res = self.session.request(
+                url.rpartition("/")[0], method="HEAD", redirect=False
+            )
+            renamed_url = get_renamed_url(url, res)
+            if renamed_url:
+                response = self.request(renamed_url)
+
+        if response.status == 200:
+            self.learn(name, response.url or url)
+        return response
+
+    async def fetch_json_async(self, name, base_url=PYPI_BASE_URL):
+        url = get_pypi_url(name, base_url=base_url)
+        response = await self.request_async(url)
 
-        if req_match:
-            req_list.append(
-                (req_match.group("package"), req_match.group("version"), req_ignore)
+        if response.status == 404:
+            res = await self.async_session.request(
+                url.rpartition("/")[0], method="HEAD", redirect=False
             )
-        elif requirement_no_comments.startswith("-r"):
-            try:
-                base_dir = os.path.dirname(os.path.abspath(req_file.name))
-            except AttributeError:
+            renamed_url = get_renamed_url(url, res)
+            if renamed_url:
+                response = await self.request_async(renamed_url)
+
+        if response.status == 200:
+            self.learn(name, response.url or url)
+        return response
+
+    def fetch_slim(
+        self, requirement, versions=(), base_url=PYPI_BASE_URL, simple_url=None
+    ):
+        response = self.request(
+            get_simple_url(requirement, simple_url or get_index_urls(base_url)[1]),
+            headers={"Accept": SIMPLE_JSON},
+        )
+        if response.status != 200:
+            return response
+
+        # indexes that don't speak PEP 691 answer with HTML, use the project
+        # JSON for those (and projects with no versions to be found) instead
+        if not response.json or not get_simple_versions(response.json):
+            return self.fetch_json(requirement, base_url)
+
+        response, wanted = self.slim_response(requirement, response, versions, base_url)
+        self.fetch_releases(requirement, response, wanted)
+        return response
+
+    async def fetch_slim_async(
+        self, requirement, versions=(), base_url=PYPI_BASE_URL, simple_url=None
+    ):
+        response = await self.request_async(
+            get_simple_url(requirement, simple_url or get_index_urls(base_url)[1]),
+            headers={"Accept": SIMPLE_JSON},
+        )
+        if response.status != 200:
+            return response
+        if not response.json or not get_simple_versions(response.json):
+            return await self.fetch_json_async(requirement, base_url)
+
+        response, wanted = self.slim_response(requirement, response, versions, base_url)
+        await self.fetch_releases_async(requirement, response, wanted)
+        return response
+
+    def slim_response(self, requirement, response, versions, base_url):
+        """Turn a PEP 691 Simple API response into a project JSON style
+        response without any upload times, returning it and the versions
+        whose upload times are needed.
+        """
+        self.sources[self.key(requirement)] = base_url
+        self.partial.add(self.key(requirement))
+        releases = {v: [] for v in get_simple_versions(response.json)}
+        wanted = set(versions)
+        wanted.add(get_latest_version(releases))
+
+        response = Response(
+            response.request,
+            b"",
+            {"info": {}, "releases": releases},
+            response.status,
+            response.url,
+            response.headers,
+            None,
+        )
+        return response, wanted
+
+    def missing_releases(self, requirement, response, versions):
+        """Return the (version, url) of each of versions that a slim response
+        doesn't have the upload time of yet. Versions are only marked as
+        fetched once their release has been added (see add_release()), so a
+        concurrent lookup fetches them too rather than reading an empty release.
+        """
+        key = self.key(requirement)
+        releases = response.json["releases"]
+        fetched = self.fetched.get(key, ())
+        missing = []
+        for version in versions:
+            if version not in releases or version in fetched:
+                continue
+            url = get_pypi_release_url(
+                self.resolve(requirement), version, self.sources[key]
+            )
+            missing.append((version, url))
+        return missing
+
+    def add_release(self, requirement, response, version, release):
+        """Fill in the upload time of version in a slim response, marking it
+        as fetched"""
+        if release.status == 200 and release.json:
+            response.json["releases"][version] = [
+                {"upload_time": f["upload_time"]}
+                for f in release.json.get("urls", [])[:1]
+            ]
+            self.fetched.setdefault(self.key(requirement), set()).add(version)
+
+    def fetch_releases(self, requirement, response, versions):
+        """Fill in the upload times of versions in a slim response"""
+        for version, url in self.missing_releases(requirement, response, versions):
+            self.add_release(requirement, response, version, self.request(url))
+
+    async def fetch_releases_async(self, requirement, response, versions):
+        missing = self.missing_releases(requirement, response, versions)
+        releases = await asyncio.gather(
+            *[self.request_async(url) for _, url in missing]
+        )
+        for (version, _), release in zip(missing, releases):
+            self.add_release(requirement, response, version, release)
+
+    def lookup(self, requirement, versions=()):
+        """Return the response for requirement, fetching it (or any versions
+        that are missing from a slim response) if needed. A lookup that can't
+        connect or times out returns an error response, see get_error_response().
+        """
+        key = self.key(requirement)
+        response = self.responses.get(key)
+        try:
+            if response is None:
+                return self.fetch(requirement, versions)
+            if key in self.partial:
+                self.fetch_releases(requirement, response, versions)
+        except REQUEST_ERRORS as e:
+            return get_error_response(e)
+        return response
+
+    async def lookup_async(self, requirement, versions=(), semaphore=None):
+        """lookup() for the asyncio engine, fetching at most as many packages
+        at a time as semaphore allows"""
+        if semaphore is not None:
+            async with semaphore:
+                return await self.lookup_async(requirement, versions)
+
+        key = self.key(requirement)
+        response = self.responses.get(key)
+        try:
+            if response is None:
+                return await self.fetch_async(requirement, versions)
+            if key in self.partial:
+                await self.fetch_releases_async(requirement, response, versions)
+        except REQUEST_ERRORS as e:
+            return get_error_response(e)
+        return response
+
+    def keep(self, key, response):
+        """Store a successful response for key, failures (an error status or
+        a failed connection) are only returned, so the next lookup retries"""
+        if response.status == 200:
+            self.responses[key] = response
+        return response
+
+    def release(self, key):
+        """Forget the response for key, freeing its memory"""
+        self.responses.pop(key, None)
+        self.forget(key)
+
+    def forget(self, key):
+        """Forget what is known about a slim response that was dropped"""
+        self.partial.discard(key)
+        self.sources.pop(key, None)
+        self.fetched.pop(key, None)
+
+    def use(self, key, remaining, release, held):
+        """Return the response for key from held, counting down the number of
+        times it is still needed and dropping it (and releasing it from the
+        store if asked to) after the last use.
+        """
+        response = held[key]
+        remaining[key] -= 1
+        if not remaining[key]:
+            del held[key]
+            if release:
+                self.release(key)
+        return response
+
+    def pending(self, requirements):
+        """Group (requirement, version) pairs by package, returning a dict of
+        key -> (requirement, versions) in the order they first appear.
+        """
+        pending = OrderedDict()
+        for requirement, version in requirements:
+            key = self.key(requirement)
+            pending.setdefault(key, (requirement, set()))
+            if version:
+                pending[key][1].add(version)
+        return pending
+
+    def event_loop(self):
+        """Return the EventLoopThread that the asyncio engine runs on, and
+        the AsyncSession it uses, creating them the first time"""
+        with self.lock:
+            if self.loop is None:
+                self.loop = EventLoopThread()
+                self.async_session = AsyncSession(timeout=self.timeout)
+                if self.policy is not None:
+                    self.async_session = AsyncRetryingSession(
+                        self.async_session, self.policy
+                    )
+            return self.loop
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.run(self.async_session.close())
+            self.loop.close()
+            self.loop = None
+        self.session.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    def stream(self, requirements, jobs=DEFAULT_JOBS, release=False, engine="threads"):
+        """Yield a (requirement, version, response) tuple for each
+        (requirement, version) pair, in order, as soon as its response is
+        available.
+
+        Lookups run up to `jobs` at a time and only a small window of them is
+        started ahead of the one being yielded, so finished responses don't
+        pile up waiting for a slow one. With release=True each response is
+        dropped from the store once the last requirement that uses it has been
+        yielded.
+
+        engine is "threads" to run the lookups in a thread pool or "asyncio"
+        to run them all on one thread, on an event loop, which is cheaper for
+        a large number of jobs.
+        """
+        requirements = list(requirements)
+        pending = self.pending(requirements)
+        remaining = Counter(self.key(requirement) for requirement, _ in requirements)
+        # responses are held here until their last use, the store's responses
+        # may be evicted by other streams in the meantime
+        held = {}
+
+        if jobs <= 1:
+            for requirement, version in requirements:
+                key = self.key(requirement)
+                if key not in held:
+                    held[key] = self.keep(key, self.lookup(*pending[key]))
+                yield requirement, version, self.use(key, remaining, release, held)
+            return
+
+        with contextlib.ExitStack() as stack:
+            if engine == "asyncio":
+                loop = self.event_loop()
+                semaphore = loop.run(create_semaphore(jobs))
+
+                def start(key):
+                    lookup = self.lookup_async(*pending[key], semaphore=semaphore)
+                    return loop.submit(lookup)
+
+            else:
+                executor = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+
+                def start(key):
+                    return executor.submit(self.lookup, *pending[key])
+
+            futures = {}
+            keys = iter(pending)
+
+            def submit():
+                key = next(keys, None)
+                if key is not None:
+                    futures[key] = start(key)
+
+            for _ in range(jobs * 2):
+                submit()
+
+            for requirement, version in requirements:
+                key = self.key(requirement)
+                if key in futures:
+                    held[key] = self.keep(key, futures.pop(key).result())
+                    submit()
+                yield requirement, version, self.use(key, remaining, release, held)
+
+
+def get_config_path():
+    """Return the path of the first config file that exists out of piprot.ini
+    in the current directory and $XDG_CONFIG_HOME/piprot/piprot.ini
+    """
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(
+        os.path.expanduser("~"), ".config"
+    )
+    for path in ("piprot.ini", os.path.join(config_home, "piprot", "piprot.ini")):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_config(path):
+    """Read the index settings from a config file like (each index laid out
+    like PyPI, see get_index_urls()):
+
+        [piprot]
+        index-url = https://mirror.example.com/root/pypi
+        extra-index-url =
+            https://pypi.acme.example.com
+
+        [routes]
+        acme-* = https://pypi.acme.example.com
+
+    Returns a dict with index_url, extra_index_urls and routes.
+    """
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(path)
+
+    config = {"index_url": None, "extra_index_urls": [], "routes": {}}
+    if parser.has_section("piprot"):
+        config["index_url"] = parser.get("piprot", "index-url", fallback=None)
+        config["extra_index_urls"] = parser.get(
+            "piprot", "extra-index-url", fallback=""
+        ).split()
+    if parser.has_section("routes"):
+        config["routes"] = dict(parser.items("routes"))
+    return config
+
+
+def parse_routes(routes):
+    """Turn a list of 'pattern=url' strings into a dict"""
+    parsed = {}
+    for route in routes:
+        pattern, _, url = route.partition("=")
+        if not url:
+            raise ValueError("Routes look like PATTERN=URL, not {}".format(route))
+        parsed[pattern.strip()] = url.strip()
+    return parsed
+
+
+def parse_req_file(req_file, verbatim=False, resolver=None, url=None):
+    """Take a file and return a list of (requirement, version, ignore) tuples
+    for its pinned requirements (see piprot.reqfile), following -r includes.
+    Requirements that aren't pinned take their version from -c constraint
+    files. With verbatim every other line is kept as (None, line, False).
+
+    Included files are read with resolver (an IncludeResolver), pass the same
+    one to each call to read shared includes once. A file is only expanded
+    the first time it's included, so cycles and repeated includes are
+    skipped. The includes of a file fetched from url are fetched relative to
+    it, if resolver can fetch URLs.
+    """
+    resolver = resolver or IncludeResolver()
+    req_list = []
+    constraints = {}
+    seen = set()
+
+    def walk(records, parent, constraint=False):
+        for record in records:
+            if isinstance(record, Requirement) and record.name:
+                if constraint:
+                    if record.version:
+                        constraints[canonicalize_name(record.name)] = record.version
+                elif record.version:
+                    req_list.append((record.name, record.version, record.ignore))
+                elif not record.url:
+                    # resolved once every constraint has been read
+                    req_list.append(record)
+                elif verbatim:
+                    req_list.extend(verbatim_lines(record))
+                continue
+
+            if not isinstance(record, Include):
+                if verbatim and not constraint:
+                    req_list.extend(verbatim_lines(record))
+                continue
+
+            if parent is None or (URL.match(parent) and resolver.fetch is None):
                 print(
-                    "Recursive requirements are not supported in URL based " "lookups"
+                    "Recursive requirements are not supported in URL based lookups",
+                    file=sys.stderr,
                 )
                 continue
 
-            # replace the -r and ensure there are no leading spaces
-            file_name = requirement_no_comments.replace("-r", "").strip()
-            new_path = os.path.join(base_dir, file_name)
+            if verbatim and not constraint:
+                req_list.append((None, record.text, record.ignore))
+
+            new_path = get_include_path(parent, record.path)
+            location = new_path if URL.match(new_path) else os.path.realpath(new_path)
+            key = (location, constraint or record.constraint)
+            if key in seen:
+                continue
+            seen.add(key)
+
             try:
-                if verbatim:
-                    req_list.append((None, requirement, req_ignore))
-                req_list.extend(parse_req_file(open(new_path), verbatim=verbatim))
+                records = resolver.parse(new_path)
             except IOError:
-                print("Failed to import {}".format(file_name))
+                print("Failed to import {}".format(record.path), file=sys.stderr)
+                continue
+            walk(records, new_path, key[1])
+
+    if url:
+        parent = url
+        seen.add((url, False))
+    else:
+        try:
+            parent = os.path.abspath(req_file.name)
+            seen.add((os.path.realpath(req_file.name), False))
+        except AttributeError:
+            parent = None
+    walk(parse_requirements(req_file), parent)
+
+    requirements = []
+    for entry in req_list:
+        if not isinstance(entry, Requirement):
+            requirements.append(entry)
+        elif canonicalize_name(entry.name) in constraints:
+            version = constraints[canonicalize_name(entry.name)]
+            requirements.append(Constrained(entry, version))
         elif verbatim:
-            req_list.append((None, requirement, req_ignore))
-    return req_list
+            requirements.extend(verbatim_lines(entry))
+    return requirements
+
+
+class Constrained(tuple):
+    """a (requirement, version, ignore) entry for an unpinned requirement
+    whose version comes from a -c constraint, text keeps its own line"""
+
+    def __new__(cls, record, version):
+        entry = super(Constrained, cls).__new__(
+            cls, (record.name, version, record.ignore)
+        )
+        entry.text = record.text
+        return entry
+
+
+def verbatim_lines(record):
+    """returns the (None, line, False) entries for a record's lines"""
+    return [(None, line, False) for line in record.text.splitlines(True)]
+
+
+def get_github_session(
+    store,
+    token=None,
+    api_url=GITHUB_API_BASE,
+    raw_url=GITHUB_RAW_BASE,
+    asynchronous=False,
+):
+    """Return a GithubSession for store's session (or an AsyncGithubSession
+    for its async session) that sends token. If store has a disk cache,
+    GitHub responses are kept in a github directory in it and always
+    revalidated with their ETag.
+    """
+    cache = None
+    if store.cache is not None:
+        cache = DiskCache(os.path.join(store.cache.path, "github"), ttl=0)
+    if asynchronous:
+        return AsyncGithubSession(store.async_session, token, cache, api_url, raw_url)
+    return GithubSession(store.session, token, cache, api_url, raw_url)
+
+
+def get_url_resolver(session=None):
+    """Return an IncludeResolver that fetches the files included by remote
+    requirements files with session"""
+    return IncludeResolver(
+        fetch=lambda url: get_requirements_file_from_url(url, session=session)
+    )
+
+
+def get_included_urls(url, resolver):
+    """Return the urls of every requirements file that the one at url
+    includes with -r, directly or through another include"""
+    included, pending = set(), [url]
+    while pending:
+        parent = pending.pop()
+        try:
+            records = resolver.parse(parent)
+        except IOError:
+            continue
+        for record in records:
+            if isinstance(record, Include) and not record.constraint:
+                child = get_include_path(parent, record.path)
+                if child not in included:
+                    included.add(child)
+                    pending.append(child)
+    return included
+
+
+def get_root_files(files, resolver):
+    """Return the (url, content) of each of files that isn't already checked
+    through another's -r include, so no requirement is reported twice. Files
+    that include each other (a cycle) are checked once, through the first.
+    """
+    included = set()
+    for url, _ in files:
+        included.update(get_included_urls(url, resolver) - {url})
+    # files nobody includes come first, their includes cover the rest
+    ordered = [f for f in files if f[0] not in included]
+    ordered += [f for f in files if f[0] in included]
+
+    reached, roots = set(), []
+    for url, content in ordered:
+        if url not in reached:
+            reached.update(get_included_urls(url, resolver) | {url})
+            roots.append((url, content))
+    return roots
+
+
+def parse_file(req_file, name=None, verbatim=False, resolver=None):
+    """Parse a requirements file with parse_req_file(), or a lockfile with its
+    parser (see piprot.lockfiles) when name, or the file's name, is that of a
+    lockfile or pyproject.toml. name can be a URL.
+    """
+    name = str(name or getattr(req_file, "name", ""))
+    parser = get_lockfile_parser(name)
+    if parser:
+        return parser(req_file)
+    url = name if URL.match(name) else None
+    return parse_req_file(req_file, verbatim=verbatim, resolver=resolver, url=url)
 
 
 def get_version_and_release_date(
@@ -142,16 +993,16 @@ def get_version_and_release_date(
     asynchronous lookups.
     """
     if not response:
-        url = get_pypi_url(requirement, version)
+        url = get_pypi_url(canonicalize_name(requirement), version)
         response = request(url)
 
-    # see if the url is 404'ing because it has been redirected
-    if response.status == 404:
-        root_url = url.rpartition("/")[0]
-        res = request(root_url, method="HEAD")
-        if res.status == 301:
-            new_location = res.headers["location"] + "/json"
-            response = request(new_location)
+        # see if the url is 404'ing because it has been redirected
+        if response.status == 404:
+            root_url = url.rpartition("/")[0]
+            res = request(root_url, method="HEAD", redirect=False)
+            if res.status == 301:
+                new_location = urljoin(root_url, res.headers["location"])
+                response = request(new_location.rstrip("/") + "/json")
 
     if response.status != 200:
         if version:
@@ -179,32 +1030,15 @@ def get_version_and_release_date(
     response = response.json
 
     try:
-        if version:
-            if version in response["releases"]:
-                release_date = response["releases"][version][0]["upload_time"]
-            else:
-                return None, None
+        if not version:
+            version = response["info"].get("stable_version") or get_latest_version(
+                response["releases"].keys()
+            )
+
+        if version in response["releases"]:
+            release_date = response["releases"][version][0]["upload_time"]
         else:
-            version = response["info"].get("stable_version")
-
-            if not version:
-                versions = {
-                    v: parse_version(v)
-                    for v in response["releases"].keys()
-                    if not parse_version(v).is_prerelease()
-                }
-
-                # if we still don't have a version, let's pick up a prerelease one
-                if not versions:
-                    versions = {
-                        v: parse_version(v) for v in response["releases"].keys()
-                    }
-
-                if versions:
-                    version = max(versions.items(), key=operator.itemgetter(1))[0]
-                    release_date = response["releases"][str(version)][0]["upload_time"]
-                else:
-                    return None, None
+            return None, None
 
         return version, datetime.fromtimestamp(
             time.mktime(time.strptime(release_date, "%Y-%m-%dT%H:%M:%S"))
@@ -215,90 +1049,375 @@ def get_version_and_release_date(
         return None, None
 
 
-def main(
-    req_files,
+NOT_FOUND = "not found on the package index"
+
+
+class Result(object):
+    """The outcome of checking a requirement: its pinned and latest versions
+    with their release dates, or the reason they couldn't be found in error.
+    """
+
+    __slots__ = (
+        "package",
+        "version",
+        "version_date",
+        "latest_version",
+        "latest_date",
+        "ignored",
+        "error",
+    )
+
+    def __init__(
+        self,
+        package,
+        version,
+        version_date=None,
+        latest_version=None,
+        latest_date=None,
+        ignored=False,
+        error=None,
+    ):
+        self.package = package
+        self.version = version
+        self.version_date = version_date
+        self.latest_version = latest_version
+        self.latest_date = latest_date
+        self.ignored = ignored
+        self.error = error
+
+    def __repr__(self):
+        return "<Result {}=={} latest={}>".format(
+            self.package, self.version, self.latest_version
+        )
+
+    @property
+    def days_behind(self):
+        """days between the pinned and latest releases, None if unknown"""
+        if self.version_date and self.latest_date:
+            return (self.latest_date - self.version_date).days
+        return None
+
+    @property
+    def out_of_date(self):
+        return bool(self.latest_version) and self.version != self.latest_version
+
+    def as_dict(self):
+        """returns the result as a dict that can be serialised to JSON, with
+        ISO 8601 dates"""
+        return {
+            "package": self.package,
+            "version": self.version,
+            "version_date": self.version_date and self.version_date.isoformat(),
+            "latest_version": self.latest_version,
+            "latest_date": self.latest_date and self.latest_date.isoformat(),
+            "days_behind": self.days_behind,
+            "ignored": self.ignored,
+            "error": self.error,
+        }
+
+
+def describe_error(error):
+    """Return a message for a request error, some (timeouts) have none"""
+    return str(error) or type(error).__name__
+
+
+def get_error_response(error):
+    """Return a response for a lookup that failed with error (see
+    REQUEST_ERRORS), which has no status and the message as its content"""
+    content = describe_error(error).encode("utf-8")
+    return Response(None, content, None, None, None, {}, None)
+
+
+def get_result(requirement, version, response=None):
+    """Return the Result for a requirement given its response from PyPI"""
+    result = Result(requirement, version)
+
+    if response is None or response.status != 200:
+        status = response.status if response is not None else None
+        if status == 404:
+            result.error = NOT_FOUND
+        elif status is None and response is not None:
+            result.error = "lookup failed ({})".format(response.content.decode("utf-8"))
+        else:
+            result.error = "lookup failed (status {})".format(status)
+        return result
+
+    result.latest_version, result.latest_date = get_version_and_release_date(
+        requirement, response=response
+    )
+    _, result.version_date = get_version_and_release_date(
+        requirement, version, response=response
+    )
+
+    if not result.latest_date:
+        result.error = "no release information"
+    elif not result.version_date:
+        result.error = "version {} not found".format(version)
+    return result
+
+
+def get_serial(response):
+    """Return the X-PyPI-Last-Serial of a response as an int, or None"""
+    serial = (response.headers or {}).get("x-pypi-last-serial", "")
+    return int(serial) if serial.isdigit() else None
+
+
+def get_state_result(requirement, version, entry):
+    """Return the Result for a requirement from its StateFile entry"""
+    return Result(
+        requirement,
+        version,
+        datetime.fromisoformat(entry["version_date"]),
+        entry["latest_version"],
+        datetime.fromisoformat(entry["latest_date"]),
+    )
+
+
+def build_store(
+    cache_dir=None,
+    cache_ttl=DEFAULT_TTL,
+    slim=False,
+    index_url=None,
+    extra_index_urls=(),
+    index_routes=None,
+    max_packages=None,
+    memory_ttl=DEFAULT_TTL,
+    retries=DEFAULT_RETRIES,
+    timeout=None,
+    max_per_host=None,
+    offline=None,
+):
+    """Create the PackageStore for a run from main()'s settings. With
+    max_packages the store keeps at most that many responses in memory, each
+    for up to memory_ttl seconds, for stores that are used for a long time.
+    Failed requests are retried up to retries times and no more than
+    max_per_host requests are made to a host at once. offline is the path of
+    a snapshot to look every package up in instead (see piprot.snapshot).
+    """
+    cache, aliases = None, AliasMap()
+    if cache_dir:
+        cache = DiskCache(cache_dir, ttl=cache_ttl)
+        aliases = AliasMap(os.path.join(cache_dir, "aliases.json"))
+    responses = None
+    if max_packages:
+        responses = MemoryCache(max_packages, ttl=memory_ttl)
+    base_url, simple_url = get_index_urls(index_url or PYPI_BASE_URL)
+    store = PackageStore(
+        base_url=base_url,
+        simple_url=simple_url,
+        extra_index_urls=extra_index_urls,
+        routes=index_routes,
+        cache=cache,
+        aliases=aliases,
+        slim=slim,
+        responses=responses,
+        policy=RetryPolicy(retries=retries, max_per_host=max_per_host),
+        timeout=timeout,
+        snapshot=Snapshot(offline) if offline else None,
+    )
+    if responses is not None:
+        responses.on_evict = store.forget
+    return store
+
+
+def get_lookups(requirements):
+    """Return the (requirement, version) pairs that need to be looked up for
+    a list of parsed requirements, skipping comments and ignored lines.
+    """
+    return [
+        (req, version) for req, version, ignore in requirements if req and not ignore
+    ]
+
+
+class Checker(object):
+    """Checks requirements against PyPI (or the configured indexes) and
+    returns Result objects, without printing or exiting.
+
+    A Checker keeps its PackageStore, and with it the HTTP connections, the
+    disk cache and every response already fetched, from one check to the next
+    so it's meant to be created once and reused:
+
+        checker = Checker(jobs=16)
+        for result in checker.check(["requests==2.4.3", "six==1.8.0"]):
+            print(result.package, result.days_behind)
+
+    Responses are kept until clear() is called. engine is passed to
+    PackageStore.stream() and the other keyword arguments to build_store().
+
+    With a StateFile, state, a requirement whose pinned version was checked
+    recently is answered from it without a lookup, and every lookup is
+    recorded in it. save() writes it back.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        jobs=DEFAULT_JOBS,
+        engine="threads",
+        state=None,
+        **store_settings
+    ):
+        self.store = store if store is not None else build_store(**store_settings)
+        self.jobs = jobs
+        self.engine = engine
+        self.state = state
+
+    def parse(self, requirements):
+        """Return parsed requirements (see parse_req_file()) from a file, the
+        text of a requirements file, a list of lines or already parsed
+        requirements.
+        """
+        if isinstance(requirements, str):
+            requirements = io.StringIO(requirements)
+        elif isinstance(requirements, (list, tuple)):
+            if all(isinstance(line, tuple) for line in requirements):
+                return list(requirements)
+            requirements = io.StringIO("\n".join(requirements))
+        return parse_req_file(requirements)
+
+    def stream(self, requirements, release=False):
+        """Yield a Result for each requirement, in order, as soon as it has
+        been looked up. With release=True responses are dropped once they
+        have been used instead of being kept for later checks.
+        """
+        requirements = self.parse(requirements)
+        known = {}
+        if self.state is not None:
+            for req, version in get_lookups(requirements):
+                entry = self.state.get(self.store.key(req), version)
+                if entry is not None:
+                    known[(self.store.key(req), version)] = entry
+
+        lookups = self.store.stream(
+            [
+                (req, version)
+                for req, version in get_lookups(requirements)
+                if (self.store.key(req), version) not in known
+            ],
+            jobs=self.jobs,
+            release=release,
+            engine=self.engine,
+        )
+        for req, version, ignore in requirements:
+            if not req:
+                continue
+            if ignore:
+                yield Result(req, version, ignored=True)
+                continue
+
+            entry = known.get((self.store.key(req), version))
+            if entry is not None:
+                yield get_state_result(req, version, entry)
+                continue
+
+            req, version, response = next(lookups)
+            result = get_result(req, version, response)
+            if self.state is not None and not result.error:
+                self.state.set(
+                    self.store.key(req),
+                    version,
+                    result.latest_version,
+                    result.version_date.isoformat(),
+                    result.latest_date.isoformat(),
+                    get_serial(response),
+                )
+            yield result
+
+    def check(self, requirements):
+        """Return a list with the Result of each requirement"""
+        results = list(self.stream(requirements))
+        self.save()
+        return results
+
+    def save(self):
+        """Save what has been learned (renamed projects and the state file)
+        for later runs"""
+        self.store.aliases.save()
+        if self.state is not None:
+            self.state.save()
+
+    def clear(self):
+        """Forget the responses fetched so far, the next check fetches (or
+        revalidates) them again"""
+        self.store.responses.clear()
+        self.store.sources.clear()
+        self.store.partial.clear()
+        self.store.fetched.clear()
+
+    def close(self):
+        self.clear()
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def report_requirements(
+    requirements,
+    results,
     verbose=False,
     outdated=False,
     latest=False,
     verbatim=False,
-    repo=None,
-    path="requirements.txt",
-    token=None,
-    branch="master",
-    url=None,
-    delay=None,
+    write_record=None,
 ):
-    """Given a list of requirements files reports which requirements are out
-    of date.
+    """Print the report for a list of parsed requirements, taking the Result
+    of each requirement from results (as yielded by Checker.stream()).
+    Returns a (total_time_delta, max_outdated_time) tuple in days.
 
-    Everything is rather somewhat obvious:
-    - verbose makes things a little louder
-    - outdated forces piprot to only report out of date packages
-    - latest outputs the requirements line with the latest version
-    - verbatim outputs the requirements file as-is - with comments showing the
-      latest versions (can be used with latest to output the latest with the
-      old version in the comment)
-    - delay specifies a timerange during an outdated package is allowed
+    If write_record is given it's called with each Result.as_dict() instead
+    of printing the text report.
     """
-    requirements = []
-
-    if repo:
-        github_url = build_github_url(repo, branch, path, token)
-        req_file = get_requirements_file_from_url(github_url)
-        requirements.extend(parse_req_file(req_file))
-    elif url:
-        req_file = get_requirements_file_from_url(url)
-        requirements.extend(parse_req_file(req_file))
-    else:
-        for req_file in req_files:
-            requirements.extend(parse_req_file(req_file, verbatim=verbatim))
-            req_file.close()
-
     total_time_delta = 0
     max_outdated_time = 0
-    results = []
 
-    for req, version, ignore in requirements:
+    for entry in requirements:
+        req, version, ignore = entry
         if verbatim and not req:
-            results.append(version)
-        elif req:
-            results.append(
-                {
-                    "req": req,
-                    "version": version,
-                    "ignore": ignore,
-                    "latest": request(get_pypi_url(req)),
-                    "specified": request(get_pypi_url(req, version)),
-                }
-            )
-
-    for result in results:
-        if isinstance(result, str):
-            print(result.replace("\n", ""))
+            print(version.replace("\n", ""))
             continue
-
-        if result["ignore"]:
-            if verbatim:
-                print("{}=={}  # norot".format(result["req"], result["version"]))
-            else:
-                print("Ignoring updates for {}. ".format(result["req"]))
+        elif not req:
             continue
 
-        req = result["req"]
-        version = result["version"]
-
-        latest_version, latest_release_date = get_version_and_release_date(
-            req, verbose=verbose, response=result["latest"]
-        )
-        specified_version, specified_release_date = get_version_and_release_date(
-            req, version, response=result["specified"]
-        )
+        result = next(results)
+        req, version = result.package, result.version
+        if isinstance(entry, Constrained):
+            # keep the line as written, the version is only from a constraint
+            line = entry.text.rstrip("\n")
+        else:
+            line = "{}=={}".format(req, version)
+        latest_version = result.latest_version
+        time_delta = result.days_behind
 
-        if latest_release_date and specified_release_date:
-            time_delta = (latest_release_date - specified_release_date).days
+        if time_delta is not None:
             total_time_delta = total_time_delta + time_delta
             max_outdated_time = max(time_delta, max_outdated_time)
 
+        if write_record:
+            write_record(result.as_dict())
+            continue
+
+        if result.ignored:
+            if verbatim and isinstance(entry, Constrained):
+                print(line)  # already has its norot comment
+            elif verbatim:
+                print("{}  # norot".format(line))
+            else:
+                print("Ignoring updates for {}. ".format(req))
+            continue
+
+        if verbose and result.error == NOT_FOUND:
+            print(
+                "{} isn't on PyPI. Check that the project "
+                "still exists!".format(req)
+            )
+        elif verbose and not result.latest_date:
+            print("Error checking {}: {}".format(req, result.error))
+
+        if time_delta is not None:
             if verbose:
                 if time_delta > 0:
                     print(
@@ -313,22 +1432,49 @@ def main(
                 elif not outdated:
                     print("{} ({}) is up to date".format(req, version))
 
-            if latest and latest_version != specified_version:
-                print(
-                    "{}=={}  # Updated from {}".format(
-                        req, latest_version, specified_version
-                    )
-                )
-            elif verbatim and latest_version != specified_version:
-                print(
-                    "{}=={}  # Latest {}".format(req, specified_version, latest_version)
-                )
+            if latest and latest_version != version:
+                print("{}=={}  # Updated from {}".format(req, latest_version, version))
+            elif verbatim and latest_version != version:
+                print("{}  # Latest {}".format(line, latest_version))
             elif verbatim:
-                print("{}=={}".format(req, specified_version))
+                print(line)
 
         elif verbatim:
-            print("{}=={}  # Error checking latest version".format(req, version))
+            print("{}  # Error checking latest version".format(line))
+
+    return total_time_delta, max_outdated_time
+
+
+def is_out_of_date(total_time_delta, max_outdated_time, delay=None):
+    """Return True if requirements this far behind should fail the run"""
+    if delay is None:
+        return total_time_delta > 0
+    return max_outdated_time > int(delay)
 
+
+def get_summary(total_time_delta, max_outdated_time, delay=None):
+    """Return the machine-readable summary of a report"""
+    return {
+        "days_out_of_date": total_time_delta,
+        "max_days_out_of_date": max_outdated_time,
+        "out_of_date": is_out_of_date(total_time_delta, max_outdated_time, delay),
+    }
+
+
+def get_record_writer(output_format, records):
+    """Return the write_record function for report_requirements(): ndjson
+    records are printed as soon as they're ready, json records are collected
+    in records to be printed as one document at the end.
+    """
+    if output_format == "ndjson":
+        return lambda record: print(json.dumps(record), flush=True)
+    return records.append
+
+
+def report_summary(total_time_delta, max_outdated_time, delay=None, verbatim=False):
+    """Print the closing line of a report, returning True if the requirements
+    are out of date (taking the allowed delay into account).
+    """
     verbatim_str = ""
     if verbatim:
         verbatim_str = "# Generated with piprot {}\n# ".format(VERSION)
@@ -338,14 +1484,14 @@ def main(
             "{}Your requirements are {} "
             "days out of date".format(verbatim_str, total_time_delta)
         )
-        sys.exit(1)
+        return True
     elif delay is not None and max_outdated_time > int(delay):
         print(
             "{}At least one of your dependencies is {} "
             "days out of date which is more than the allowed"
             "{} days.".format(verbatim_str, max_outdated_time, delay)
         )
-        sys.exit(1)
+        return True
     elif delay is not None and max_outdated_time <= int(delay):
         print(
             "{}All of your dependencies are at most {} "
@@ -356,12 +1502,804 @@ def main(
             "{}Looks like you've been keeping up to date, "
             "time for a delicious beverage!".format(verbatim_str)
         )
+    return False
+
+
+def main(
+    req_files,
+    verbose=False,
+    outdated=False,
+    latest=False,
+    verbatim=False,
+    repo=None,
+    path="requirements.txt",
+    token=None,
+    branch="master",
+    url=None,
+    delay=None,
+    store=None,
+    jobs=DEFAULT_JOBS,
+    cache_dir=None,
+    cache_ttl=DEFAULT_TTL,
+    slim=False,
+    index_url=None,
+    extra_index_urls=(),
+    index_routes=None,
+    github_api_url=GITHUB_API_BASE,
+    github_raw_url=GITHUB_RAW_BASE,
+    output_format="text",
+    engine="threads",
+    retries=DEFAULT_RETRIES,
+    timeout=None,
+    max_per_host=None,
+    offline=None,
+    state=None,
+    state_ttl=DEFAULT_STATE_TTL,
+    all_files=False,
+):
+    """Given a list of requirements files reports which requirements are out
+    of date.
+
+    Everything is rather somewhat obvious:
+    - verbose makes things a little louder
+    - outdated forces piprot to only report out of date packages
+    - latest outputs the requirements line with the latest version
+    - verbatim outputs the requirements file as-is - with comments showing the
+      latest versions (can be used with latest to output the latest with the
+      old version in the comment)
+    - delay specifies a timerange during an outdated package is allowed
+    - store is the PackageStore used to look up packages (a fresh one is
+      created for each run by default)
+    - jobs is the number of PyPI lookups to run concurrently
+    - cache_dir enables the on-disk cache of PyPI responses in that directory,
+      responses younger than cache_ttl seconds are used without revalidation
+    - slim looks up release dates with the Simple API and per-release JSON
+      instead of downloading the full project JSON
+    - index_url is the package index to use instead of PyPI, packages that
+      aren't found there are looked for on each of the extra_index_urls
+    - index_routes maps package name patterns to the index to use for them
+    - github_api_url and github_raw_url are used instead of GitHub for --github
+    - all_files checks every requirements file and lockfile in the repo
+      rather than just path, see get_requirements_files()
+    - output_format is "text", or "json" / "ndjson" for a record per
+      requirement (see Result.as_dict())
+    - engine is "threads" or "asyncio", see PackageStore.stream(). It only
+      applies to the lookups, the repo or url is fetched synchronously first
+    - retries is the number of times a failed request is retried, timeout
+      the seconds to wait for a response and max_per_host caps the number of
+      concurrent requests to each host
+    - offline is the path of a snapshot to look packages up in instead of
+      the package index, see piprot.snapshot
+    - state is the path of a StateFile, pinned versions checked less than
+      state_ttl seconds ago aren't looked up again
+    """
+    requirements = []
+
+    # only drop responses once they're used when nobody else can see the store
+    release = store is None
+    checker = Checker(
+        store,
+        jobs=jobs,
+        engine=engine,
+        cache_dir=cache_dir,
+        cache_ttl=cache_ttl,
+        slim=slim,
+        index_url=index_url,
+        extra_index_urls=extra_index_urls,
+        index_routes=index_routes,
+        retries=retries,
+        timeout=timeout,
+        max_per_host=max_per_host,
+        offline=offline,
+        state=StateFile(state, state_ttl) if state else None,
+    )
+    store = checker.store
+
+    github = get_github_session(store, token, github_api_url, github_raw_url)
+    remote = get_url_resolver(github)
+    try:
+        if repo and all_files:
+            files = get_requirements_files(
+                repo,
+                branch,
+                token,
+                session=github,
+                api_url=github_api_url,
+                raw_url=github_raw_url,
+                jobs=jobs,
+            )
+            for file_url, content in files:
+                remote.add(file_url, content)
+            for file_url, content in get_root_files(files, remote):
+                requirements.extend(
+                    parse_file(io.StringIO(content), file_url, resolver=remote)
+                )
+        elif repo:
+            github_url = build_github_url(
+                repo,
+                branch,
+                path,
+                token,
+                session=github,
+                api_url=github_api_url,
+                raw_url=github_raw_url,
+            )
+            req_file = get_requirements_file_from_url(github_url, session=github)
+            requirements.extend(parse_file(req_file, github_url, resolver=remote))
+        elif url:
+            req_file = get_requirements_file_from_url(url, session=store.session)
+            requirements.extend(parse_file(req_file, url, resolver=remote))
+    except GithubError as e:
+        if release:
+            checker.close()
+        sys.exit(str(e))
+    except REQUEST_ERRORS as e:
+        if release:
+            checker.close()
+        sys.exit("Failed to fetch the requirements: {}".format(describe_error(e)))
+
+    if not (repo or url):
+        resolver = IncludeResolver()
+        for req_file in req_files:
+            requirements.extend(
+                parse_file(req_file, verbatim=verbatim, resolver=resolver)
+            )
+            req_file.close()
+
+    records = []
+    write_record = None
+    if output_format != "text":
+        write_record = get_record_writer(output_format, records)
+
+    total_time_delta, max_outdated_time = report_requirements(
+        requirements,
+        checker.stream(requirements, release=release),
+        verbose=verbose,
+        outdated=outdated,
+        latest=latest,
+        verbatim=verbatim,
+        write_record=write_record,
+    )
+
+    checker.save()
+    if release:
+        store.close()
+
+    if write_record:
+        summary = get_summary(total_time_delta, max_outdated_time, delay)
+        if output_format == "json":
+            print(json.dumps(dict(summary, requirements=records), indent=2))
+        if summary["out_of_date"]:
+            sys.exit(1)
+    elif report_summary(total_time_delta, max_outdated_time, delay, verbatim):
+        sys.exit(1)
+
+
+def read_manifest(manifest):
+    """Read a batch manifest, a file listing one requirements source per line:
+
+        requirements/base.txt
+        https://example.com/requirements.txt
+        github:owner/repo
+        github:owner/repo@branch:requirements/prod.txt
+        github-org:organisation
+
+    Blank lines and comments are skipped. Relative paths are made relative to
+    the manifest's directory.
+    """
+    try:
+        base_dir = os.path.dirname(os.path.abspath(manifest.name))
+    except AttributeError:
+        base_dir = os.getcwd()
+
+    sources = []
+    for line in manifest:
+        source = line.split("#")[0].strip()
+        if not source:
+            continue
+        if not re.match(r"^(github:|github-org:|https?://)", source):
+            source = os.path.join(base_dir, source)
+        sources.append(source)
+    return sources
+
+
+def load_source(
+    source,
+    token=None,
+    session=None,
+    github_api_url=GITHUB_API_BASE,
+    github_raw_url=GITHUB_RAW_BASE,
+    resolver=None,
+):
+    """Return the parsed requirements of a batch manifest source, includes
+    are read with resolver (see parse_req_file())"""
+    github = GITHUB_SOURCE.match(source)
+    if github:
+        url = build_github_url(
+            github.group("repo"),
+            github.group("branch"),
+            github.group("path"),
+            token,
+            session=session,
+            api_url=github_api_url,
+            raw_url=github_raw_url,
+        )
+        req_file = get_requirements_file_from_url(url, session=session)
+        return parse_file(req_file, url, resolver=resolver)
+
+    if re.match(r"^https?://", source):
+        req_file = get_requirements_file_from_url(source, session=session)
+        return parse_file(req_file, source, resolver=resolver)
+
+    try:
+        with open(source) as req_file:
+            return parse_file(req_file, resolver=resolver)
+    except IOError:
+        print("Failed to open {}".format(source), file=sys.stderr)
+        return []
+
+
+def load_org_sources(
+    sources,
+    session,
+    resolver,
+    github_api_url=GITHUB_API_BASE,
+    github_raw_url=GITHUB_RAW_BASE,
+    jobs=DEFAULT_JOBS,
+):
+    """Replace each github-org:organisation in sources with a
+    github:owner/repo:path source for every requirements file in the
+    organisation's repos (see get_org_requirements_files()).
+
+    Returns the new list of sources and a dict of the parsed requirements of
+    the ones that were added, which have already been fetched.
+    """
+    expanded = []
+    loaded = {}
+    for source in sources:
+        org = GITHUB_ORG_SOURCE.match(source)
+        if not org:
+            expanded.append(source)
+            continue
+
+        try:
+            files = get_org_requirements_files(
+                org.group("org"),
+                session=session,
+                api_url=github_api_url,
+                raw_url=github_raw_url,
+                jobs=jobs,
+            )
+        except REQUEST_ERRORS + (GithubError,) as e:
+            print(
+                "Failed to load {}: {}".format(source, describe_error(e)),
+                file=sys.stderr,
+            )
+            continue
+
+        for _, _, url, content in files:
+            resolver.add(url, content)
+        for repo, path, url, content in files:
+            name = "github:{}:{}".format(repo, path)
+            loaded[name] = parse_file(io.StringIO(content), url, resolver=resolver)
+            expanded.append(name)
+    return expanded, loaded
+
+
+async def load_sources_async(
+    sources,
+    token=None,
+    session=None,
+    github_api_url=GITHUB_API_BASE,
+    github_raw_url=GITHUB_RAW_BASE,
+    resolver=None,
+):
+    """Return the parsed requirements of each of sources (see load_source()),
+    fetching the remote ones concurrently with an AsyncSession"""
+
+    async def load(source):
+        try:
+            return await fetch(source)
+        except REQUEST_ERRORS + (GithubError,) as e:
+            print(
+                "Failed to load {}: {}".format(source, describe_error(e)),
+                file=sys.stderr,
+            )
+            return []
+
+    async def fetch(source):
+        github = GITHUB_SOURCE.match(source)
+        if github:
+            url = await build_github_url_async(
+                github.group("repo"),
+                github.group("branch"),
+                github.group("path"),
+                token,
+                session=session,
+                api_url=github_api_url,
+                raw_url=github_raw_url,
+            )
+        elif re.match(r"^https?://", source):
+            url = source
+        else:
+            return load_source(source, resolver=resolver)
+        req_file = await get_requirements_file_from_url_async(url, session)
+        return parse_file(req_file, url, resolver=resolver)
+
+    return await asyncio.gather(*[load(source) for source in sources])
+
+
+def batch(
+    manifest,
+    verbose=False,
+    outdated=False,
+    latest=False,
+    token=None,
+    delay=None,
+    store=None,
+    jobs=DEFAULT_JOBS,
+    github_api_url=GITHUB_API_BASE,
+    github_raw_url=GITHUB_RAW_BASE,
+    output_format="text",
+    engine="threads",
+    state=None,
+    state_ttl=DEFAULT_STATE_TTL,
+    **store_settings
+):
+    """Report on every requirements source listed in a manifest (see
+    read_manifest()), with a separate report for each source.
+
+    Every package is looked up once, no matter how many sources use it, so the
+    number of requests grows with the number of unique packages rather than
+    with the number of sources. Exits with status 1 if any of the sources are
+    out of date. The other arguments are the same as main()'s, json and ndjson
+    records have an extra "source" key.
+    """
+    release = store is None
+    checker = Checker(
+        store,
+        jobs=jobs,
+        engine=engine,
+        state=StateFile(state, state_ttl) if state else None,
+        **store_settings
+    )
+    store = checker.store
+
+    github = get_github_session(store, token, github_api_url, github_raw_url)
+    source_settings = {
+        "github_api_url": github_api_url,
+        "github_raw_url": github_raw_url,
+        "resolver": get_url_resolver(github),
+    }
+    sources, loaded = load_org_sources(
+        read_manifest(manifest), github, jobs=jobs, **source_settings
+    )
+    remaining = [source for source in sources if source not in loaded]
+    if engine == "asyncio":
+        loop = store.event_loop()
+        async_github = get_github_session(
+            store, token, github_api_url, github_raw_url, asynchronous=True
+        )
+        results = loop.run(
+            load_sources_async(remaining, token, async_github, **source_settings)
+        )
+    else:
+        results = []
+        for source in remaining:
+            try:
+                results.append(load_source(source, token, github, **source_settings))
+            except REQUEST_ERRORS + (GithubError,) as e:
+                print(
+                    "Failed to load {}: {}".format(source, describe_error(e)),
+                    file=sys.stderr,
+                )
+                results.append([])
+    loaded.update(zip(remaining, results))
+    sources = [(source, loaded[source]) for source in sources]
+
+    results = checker.stream(
+        [line for _, requirements in sources for line in requirements],
+        release=release,
+    )
+
+    failed = False
+    records = []
+    summaries = []
+    for n, (source, requirements) in enumerate(sources):
+        if output_format != "text":
+            writer = get_record_writer(output_format, records)
+            total_time_delta, max_outdated_time = report_requirements(
+                requirements,
+                results,
+                write_record=lambda record: writer(dict(record, source=source)),
+            )
+            summary = get_summary(total_time_delta, max_outdated_time, delay)
+            summaries.append(dict(summary, source=source))
+            failed = summary["out_of_date"] or failed
+            continue
+
+        if n:
+            print("")
+        print("# {}".format(source))
+        total_time_delta, max_outdated_time = report_requirements(
+            requirements, results, verbose=verbose, outdated=outdated, latest=latest
+        )
+        failed = report_summary(total_time_delta, max_outdated_time, delay) or failed
+
+    checker.save()
+    if release:
+        store.close()
+
+    if output_format == "json":
+        print(
+            json.dumps(
+                {"out_of_date": failed, "sources": summaries, "requirements": records},
+                indent=2,
+            )
+        )
+
+    if failed:
+        sys.exit(1)
+
+
+def write_snapshot(path, names, store=None, jobs=DEFAULT_JOBS, **store_settings):
+    """Look up each of names and save their releases to the snapshot at path
+    (see piprot.snapshot), adding to it if it already exists. The other
+    arguments are the same as Checker's.
+
+    Returns the number of packages saved and a list of the names that
+    couldn't be found.
+    """
+    release = store is None
+    checker = Checker(store, jobs=jobs, **store_settings)
+    names = OrderedDict((canonicalize_name(name), name) for name in names)
+    snapshot = Snapshot(path, create=True)
+    saved, missing = 0, []
+    try:
+        lookups = checker.store.stream(
+            [(name, None) for name in names.values()],
+            jobs,
+            release=True,
+            engine=checker.engine,
+        )
+        for name, _, response in lookups:
+            if response.status == 200 and response.json:
+                snapshot.add(canonicalize_name(name), response.json)
+                saved += 1
+            else:
+                missing.append(name)
+        snapshot.save()
+    finally:
+        snapshot.close()
+        if release:
+            checker.close()
+    return saved, missing
+
+
+def snapshot(argv=None):
+    """Parse the `piprot snapshot` command line and write a snapshot of the
+    packages in the given requirements files (or lockfiles) for --offline"""
+    parser = argparse.ArgumentParser(
+        prog="piprot snapshot",
+        description="Save the release data of packages for piprot --offline.",
+    )
+    parser.add_argument(
+        "file",
+        nargs="*",
+        type=argparse.FileType(),
+        help="requirements file(s) or lockfiles to take the packages from",
+    )
+    parser.add_argument(
+        "-p",
+        "--package",
+        action="append",
+        default=[],
+        help="A package to save, can be supplied more than once.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="The snapshot file to write, an existing one is added to.",
+    )
+    add_store_arguments(parser)
+    args = parser.parse_args(argv)
+
+    names = list(args.package)
+    resolver = IncludeResolver()
+    for req_file in args.file:
+        requirements = parse_file(req_file, resolver=resolver)
+        names.extend(req for req, _, _ in requirements if req)
+        req_file.close()
+    if not names:
+        parser.error("no packages to save")
+
+    # the snapshot needs every release's upload time
+    settings = dict(get_store_settings(args), slim=False, offline=None)
+    saved, missing = write_snapshot(
+        args.output, names, jobs=args.jobs, engine=args.engine, **settings
+    )
+    for name in missing:
+        print("{} isn't on the package index".format(name))
+    print("Saved {} packages to {}".format(saved, args.output))
+
+
+def sync_cache(store, since=None, state=None, refresh=False, jobs=DEFAULT_JOBS):
+    """Bring the disk cache of store (and the StateFile state) up to date
+    with the changes on its index since the serial it was last synced at, or
+    since, see piprot.sync. With refresh the expired responses are fetched
+    again straight away, jobs at a time.
+
+    Returns the index's serial, a dict of the changed projects and a list of
+    the expired urls. The first sync of a cache expires every response in it
+    (and returns None for the changes) as their age isn't known.
+    """
+    cache_dir = store.cache.path
+    last_serial, synced = load_serial(cache_dir, store.base_url)
+    if since is None:
+        since = last_serial
+
+    if since is None:
+        changed, serial = None, get_last_serial(store.session, store.base_url)
+    else:
+        changed, serial = get_changes(store.session, store.base_url, since)
+    # any response fetched from now on has every change up to serial
+    now = time.time()
+
+    expired = expire_changed(
+        store.cache, changed, store.base_url, store.simple_url, since, synced
+    )
+    if state is not None and changed is not None:
+        state.sync(changed, since, synced)
+        state.save()
+
+    if refresh and expired:
+
+        def fetch(url):
+            # Simple API responses are cached in their PEP 691 form
+            if url.startswith(store.simple_url):
+                return store.request(url, headers={"Accept": SIMPLE_JSON})
+            return store.request(url)
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(fetch, expired))
+
+    save_serial(cache_dir, store.base_url, serial, now)
+    return serial, changed, expired
+
+
+def sync(argv=None):
+    """Parse the `piprot sync` command line and sync the disk cache with the
+    package index's changelog"""
+    parser = argparse.ArgumentParser(
+        prog="piprot sync",
+        description="Expire the cached responses for the packages that have "
+        "changed on the package index since the last sync, and mark the rest "
+        "fresh.",
+    )
+    parser.add_argument(
+        "--since",
+        type=int,
+        metavar="SERIAL",
+        help="Sync with the changes since SERIAL rather than since the last "
+        "sync.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Fetch the expired responses again now rather than when they're "
+        "next needed.",
+    )
+    parser.add_argument(
+        "--state",
+        metavar="FILE",
+        help="Also forget the changed packages in a --state file.",
+    )
+    add_store_arguments(parser)
+    args = parser.parse_args(argv)
+
+    settings = get_store_settings(args)
+    if args.no_cache or args.offline:
+        parser.error("there's no cache to sync with --no-cache or --offline")
+    cache_dir = settings["cache_dir"] or default_cache_dir()
+    store = build_store(**dict(settings, cache_dir=cache_dir))
+    state = StateFile(args.state) if args.state else None
+    try:
+        serial, changed, expired = sync_cache(
+            store, args.since, state, args.refresh, args.jobs
+        )
+    except REQUEST_ERRORS + (ChangelogError,) as e:
+        sys.exit(
+            "Couldn't read the changelog of {}: {}".format(
+                store.base_url, describe_error(e)
+            )
+        )
+    finally:
+        store.close()
+
+    if changed is None:
+        print(
+            "Recorded serial {}, {} cached responses {}".format(
+                serial, len(expired), "refreshed" if args.refresh else "expired"
+            )
+        )
+        return
+    print(
+        "Synced to serial {}: {} changed projects, {} cached responses {}".format(
+            serial,
+            len(changed),
+            len(expired),
+            "refreshed" if args.refresh else "expired",
+        )
+    )
+
+
+def add_store_arguments(parser):
+    """Add the options for looking packages up (concurrency, indexes and
+    caching) to an ArgumentParser, see get_store_settings().
+    """
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Number of PyPI lookups to run concurrently "
+        "(default {}).".format(DEFAULT_JOBS),
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="threads",
+        help="Run concurrent lookups in a thread pool (threads, the default) "
+        "or on a single thread with asyncio, for large numbers of --jobs. "
+        "Only --batch downloads requirements files with asyncio, --github and "
+        "--url fetch theirs before the lookups start.",
+    )
+
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="Number of times to retry a failed request, with backoff "
+        "(default {}).".format(DEFAULT_RETRIES),
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Seconds to wait for each response (default 60).",
+    )
+
+    parser.add_argument(
+        "--max-per-host",
+        type=int,
+        help="Maximum number of concurrent requests to a single host.",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--index-url",
+        help="Base URL of the package index to use instead of PyPI, which "
+        "serves the JSON API under /pypi and the Simple API under /simple.",
+    )
+
+    parser.add_argument(
+        "--extra-index-url",
+        action="append",
+        default=[],
+        help="Package index to try when a package isn't on the index url, can "
+        "be supplied more than once.",
+    )
+
+    parser.add_argument(
+        "--route",
+        action="append",
+        default=[],
+        metavar="PATTERN=URL",
+        help="Only look up packages matching PATTERN (e.g. 'acme-*') on the "
+        "index at URL, can be supplied more than once.",
+    )
+
+    parser.add_argument(
+        "--config",
+        help="Config file with index settings (defaults to piprot.ini or "
+        "$XDG_CONFIG_HOME/piprot/piprot.ini).",
+    )
+
+    parser.add_argument(
+        "--slim",
+        action="store_true",
+        help="Only download the release list and the JSON of the releases "
+        "that are needed, rather than the full project JSON.",
+    )
+
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Cache PyPI responses on disk (in {}).".format(default_cache_dir()),
+    )
+
+    parser.add_argument(
+        "--cache-dir", help="Cache PyPI responses on disk in this directory."
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=DEFAULT_TTL,
+        help="Seconds before a cached response is revalidated with PyPI "
+        "(default {}).".format(DEFAULT_TTL),
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use the on-disk cache, even if --cache or --cache-dir "
+        "are given.",
+    )
+
+    parser.add_argument(
+        "--offline",
+        metavar="SNAPSHOT",
+        help="Look packages up in a snapshot made with `piprot snapshot` "
+        "instead of on the package index.",
+    )
+
+
+def get_store_settings(args):
+    """Return the build_store() keyword arguments for the options added by
+    add_store_arguments(), merged with the config file's settings.
+    """
+    config = {"index_url": None, "extra_index_urls": [], "routes": {}}
+    config_path = args.config or get_config_path()
+    if config_path:
+        config = load_config(config_path)
+
+    try:
+        routes = dict(config["routes"], **parse_routes(args.route))
+    except ValueError as e:
+        sys.exit(str(e))
+
+    cache_dir = None
+    if not args.no_cache:
+        if args.cache_dir:
+            cache_dir = args.cache_dir
+        elif args.cache:
+            cache_dir = default_cache_dir()
+
+    if args.offline and not os.path.isfile(args.offline):
+        sys.exit("No snapshot at {}".format(args.offline))
+
+    return {
+        "cache_dir": cache_dir,
+        "cache_ttl": args.cache_ttl,
+        "slim": args.slim,
+        "index_url": args.index_url or config["index_url"],
+        "extra_index_urls": args.extra_index_url or config["extra_index_urls"],
+        "index_routes": routes,
+        "retries": args.retries,
+        "timeout": args.timeout,
+        "max_per_host": args.max_per_host,
+        "offline": args.offline,
+    }
 
 
 def piprot():
     """Parse the command line arguments and jump into the piprot() function
     (unless the user just wants the post request hook).
     """
+    if sys.argv[1:2] == ["serve"]:
+        from piprot.server import serve
+
+        return serve(sys.argv[2:])
+
+    if sys.argv[1:2] == ["snapshot"]:
+        return snapshot(sys.argv[2:])
+
+    if sys.argv[1:2] == ["sync"]:
+        return sync(sys.argv[2:])
+
     cli_parser = argparse.ArgumentParser(
         epilog="Here's hoping your requirements are nice and fresh!"
     )
@@ -420,6 +2358,13 @@ def piprot():
         "-p", "--path", help="Path to requirements file in remote repository."
     )
 
+    cli_parser.add_argument(
+        "--all-files",
+        action="store_true",
+        help="With --github, check every requirements file and lockfile in "
+        "the repository (found with one request) instead of just --path.",
+    )
+
     cli_parser.add_argument(
         "-d",
         "--delay",
@@ -429,8 +2374,48 @@ def piprot():
 
     cli_parser.add_argument("-u", "--url", help="URL to requirements file.")
 
-    # if there is a requirements.txt file, use it by default. Otherwise print
-    # usage if there are no arguments.
+    cli_parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="text",
+        help="Output format, json and ndjson output a record for each "
+        "requirement (default text).",
+    )
+
+    cli_parser.add_argument(
+        "--batch",
+        type=argparse.FileType(),
+        metavar="MANIFEST",
+        help="Report on every requirements file, URL or github:owner/repo "
+        "listed in MANIFEST (one per line), looking up each package once.",
+    )
+
+    cli_parser.add_argument(
+        "--github-org",
+        metavar="ORG",
+        help="Report on every requirements file and lockfile in every "
+        "repository of a GitHub organisation, looking up each package once.",
+    )
+
+    cli_parser.add_argument(
+        "--state",
+        metavar="FILE",
+        help="Remember what each pinned version was found to be in FILE and "
+        "don't look it up again until --state-ttl has passed.",
+    )
+
+    cli_parser.add_argument(
+        "--state-ttl",
+        type=int,
+        default=DEFAULT_STATE_TTL,
+        help="Seconds before a package in the --state file is looked up "
+        "again (default {}).".format(DEFAULT_STATE_TTL),
+    )
+
+    add_store_arguments(cli_parser)
+
+    # if there is a requirements.txt file (or a lockfile, see DEFAULT_FILES),
+    # use it by default. Otherwise print usage if there are no arguments.
     nargs = "+"
 
     if (
@@ -438,20 +2423,25 @@ def piprot():
         or "-g" in sys.argv
         or "-u" in sys.argv
         or "--url" in sys.argv
+        or "--batch" in sys.argv
+        or "--github-org" in sys.argv
     ):
         nargs = "*"
 
     default = None
-    if os.path.isfile("requirements.txt"):
-        nargs = "*"
-        default = [open("requirements.txt")]
+    for name in DEFAULT_FILES:
+        if os.path.isfile(name):
+            nargs = "*"
+            default = [open(name)]
+            break
 
     cli_parser.add_argument(
         "file",
         nargs=nargs,
         type=argparse.FileType(),
         default=default,
-        help="requirements file(s), use " "`-` for stdin",
+        help="requirements file(s) or lockfiles (Pipfile.lock, poetry.lock, "
+        "uv.lock, pyproject.toml), use `-` for stdin",
     )
 
     cli_args = cli_parser.parse_args()
@@ -459,26 +2449,59 @@ def piprot():
     if len(cli_args.file) > 1 and cli_args.verbatim:
         sys.exit("--verbatim only allowed for single requirements files")
 
+    if cli_args.format != "text" and (cli_args.verbatim or cli_args.latest):
+        sys.exit("--verbatim and --latest are only allowed with --format text")
+
     verbose = True
     if cli_args.quiet:
         verbose = False
     elif cli_args.verbatim:
         verbose = False
 
-    # call the main function to kick off the real work
-    main(
-        req_files=cli_args.file,
-        verbose=verbose,
-        outdated=cli_args.outdated,
-        latest=cli_args.latest,
-        verbatim=cli_args.verbatim,
-        repo=cli_args.github,
-        branch=cli_args.branch,
-        path=cli_args.path,
-        token=cli_args.token,
-        url=cli_args.url,
-        delay=cli_args.delay,
-    )
+    store_settings = get_store_settings(cli_args)
+
+    try:
+        if cli_args.batch or cli_args.github_org:
+            batch(
+                cli_args.batch or ["github-org:{}".format(cli_args.github_org)],
+                verbose=verbose,
+                outdated=cli_args.outdated,
+                latest=cli_args.latest,
+                token=cli_args.token,
+                delay=cli_args.delay,
+                jobs=cli_args.jobs,
+                output_format=cli_args.format,
+                engine=cli_args.engine,
+                state=cli_args.state,
+                state_ttl=cli_args.state_ttl,
+                **store_settings
+            )
+            return
+
+        # call the main function to kick off the real work
+        main(
+            req_files=cli_args.file,
+            verbose=verbose,
+            outdated=cli_args.outdated,
+            latest=cli_args.latest,
+            verbatim=cli_args.verbatim,
+            repo=cli_args.github,
+            branch=cli_args.branch,
+            path=cli_args.path,
+            all_files=cli_args.all_files,
+            token=cli_args.token,
+            url=cli_args.url,
+            delay=cli_args.delay,
+            jobs=cli_args.jobs,
+            output_format=cli_args.format,
+            engine=cli_args.engine,
+            state=cli_args.state,
+            state_ttl=cli_args.state_ttl,
+            **store_settings
+        )
+    except ImportError as e:
+        # a pyproject.toml without tomllib or tomli, see piprot.lockfiles
+        sys.exit(str(e))
 
 
 if __name__ == "__main__":
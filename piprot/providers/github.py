@@ -1,52 +1,391 @@
 """
 functions to interact with github api
+
+A token is sent in an Authorization header by a GithubSession, which wraps
+the session the other functions are given, and can also keep responses in a
+DiskCache and revalidate them with their ETag: GitHub doesn't count a 304
+against the rate limit.
 """
-from piprot.thttp import request
+from piprot.lockfiles import READABLE_LOCKFILES
+from piprot.thttp import Session
 from six import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+import datetime
 import re
 import json
 
 GITHUB_API_BASE = "https://api.github.com"
+GITHUB_RAW_BASE = "https://raw.githubusercontent.com"
+
+# requirements and constraints files, and any .txt in a requirements directory
+REQUIREMENTS_FILE = re.compile(
+    r"(^|/)([^/]*(requirements|constraints)[^/]*\.txt|requirements/[^/]+\.txt)$"
+)
+# directories that hold other projects' files rather than the repo's own
+VENDORED_DIRS = frozenset(["node_modules", "site-packages", "venv"])
+
+# the next page of a paginated API response, from its Link header
+NEXT_LINK = re.compile(r'<([^>]+)>;\s*rel="next"')
+REPOS_PER_PAGE = 100
+
+
+class GithubError(Exception):
+    """Raised when Github refuses a request, usually because of a rate limit"""
 
 
-def build_github_url(repo, branch=None, path="requirements.txt", token=None):
+def check_response(response, url):
+    """raises GithubError for a forbidden or rate limited response"""
+    if response.status not in (403, 429):
+        return
+
+    # don't leak a query string (a token, say) into the message
+    parts = urlsplit(url)
+    message = "{}://{}{} returned {}".format(
+        parts.scheme, parts.netloc, parts.path, response.status
+    )
+    headers = response.headers or {}
+    if headers.get("x-ratelimit-remaining") == "0":
+        message = "Github rate limit exceeded ({})".format(message)
+        reset = headers.get("x-ratelimit-reset", "")
+        if reset.isdigit():
+            message += ", it resets at {:%H:%M:%S}".format(
+                datetime.datetime.fromtimestamp(int(reset))
+            )
+    raise GithubError(message)
+
+
+class GithubSession(object):
     """
-    Builds a URL to a file inside a Github repository.
+    Wraps a Session for requests to GitHub. token is sent in an Authorization
+    header, to api_url and raw_url only. With a DiskCache, cache, responses
+    are stored and every request is a conditional one (use a ttl of 0), so
+    unchanged files and API responses come back as 304s.
+
+    Each repo's default branch is only looked up once per session, until a
+    file on it 404s (the branch may have been renamed).
     """
 
-    repo = re.sub(r"^http(s)?://github.com/", "", repo).strip("/")
+    def __init__(
+        self,
+        session=None,
+        token=None,
+        cache=None,
+        api_url=GITHUB_API_BASE,
+        raw_url=GITHUB_RAW_BASE,
+    ):
+        self.session = session or Session()
+        self.token = token
+        self.cache = cache
+        self.hosts = (api_url.rstrip("/") + "/", raw_url.rstrip("/") + "/")
+        # (api_url, repo) -> default branch
+        self.default_branches = {}
+
+    def get_headers(self, url, headers):
+        if self.token and url.startswith(self.hosts):
+            headers = dict(headers, Authorization="token {}".format(self.token))
+        return headers
+
+    def check_branch(self, url, response):
+        """forget the default branch of the repo a raw url is in if it 404s"""
+        if response.status == 404 and url.startswith(self.hosts[1]):
+            repo = "/".join(url[len(self.hosts[1]) :].split("/")[:2])
+            for key in [key for key in self.default_branches if key[1] == repo]:
+                del self.default_branches[key]
+        return response
+
+    def request(self, url, headers={}, **kwargs):
+        headers = self.get_headers(url, headers)
+        if self.cache is None or kwargs:
+            response = self.session.request(url, headers=headers, **kwargs)
+        else:
+            response = self.cache.request(url, self.session.request, headers=headers)
+        return self.check_branch(url, response)
+
+
+class AsyncGithubSession(GithubSession):
+    """GithubSession for a piprot.aio.AsyncSession"""
+
+    async def request(self, url, headers={}, **kwargs):
+        headers = self.get_headers(url, headers)
+        if self.cache is None or kwargs:
+            response = await self.session.request(url, headers=headers, **kwargs)
+            return self.check_branch(url, response)
+
+        cached, fresh = self.cache.get(url)
+        if cached and fresh:
+            return cached
+        response = await self.session.request(
+            url, headers=self.cache.conditional_headers(cached, headers)
+        )
+        return self.check_branch(url, self.cache.update(url, cached, response))
+
+
+def with_token(session, token, api_url=GITHUB_API_BASE, raw_url=GITHUB_RAW_BASE):
+    """returns session wrapped in a GithubSession that sends token, unless
+    there's no token or it already is one"""
+    if not token or isinstance(session, GithubSession):
+        return session
+    return GithubSession(session, token, api_url=api_url, raw_url=raw_url)
+
+
+def build_github_url(
+    repo,
+    branch=None,
+    path="requirements.txt",
+    token=None,
+    session=None,
+    api_url=GITHUB_API_BASE,
+    raw_url=GITHUB_RAW_BASE,
+):
+    """
+    Builds a URL to a file inside a Github repository. api_url and raw_url
+    can be changed to point at a Github Enterprise (or test) server.
+
+    token is only used to look up the default branch, fetch the file with a
+    GithubSession to send it.
+    """
+
+    repo = normalize_repo(repo)
 
     # args come is as 'None' instead of not being provided
     if not path:
         path = "requirements.txt"
 
     if not branch:
-        branch = get_default_branch(repo)
+        session = with_token(session, token, api_url, raw_url)
+        branch = get_default_branch(repo, session=session, api_url=api_url)
+
+    return "{}/{}/{}/{}".format(raw_url, repo, branch, path)
+
+
+async def build_github_url_async(
+    repo,
+    branch=None,
+    path="requirements.txt",
+    token=None,
+    session=None,
+    api_url=GITHUB_API_BASE,
+    raw_url=GITHUB_RAW_BASE,
+):
+    """build_github_url() with an AsyncSession"""
+    repo = normalize_repo(repo)
+    if not branch:
+        if token and not isinstance(session, GithubSession):
+            session = AsyncGithubSession(session, token, api_url=api_url)
+        branch = await get_default_branch_async(repo, session, api_url=api_url)
+    return build_github_url(
+        repo, branch, path, token, api_url=api_url, raw_url=raw_url
+    )
 
-    url = "https://raw.githubusercontent.com/{}/{}/{}".format(repo, branch, path)
 
-    if token:
-        url = "{}?token={}".format(url, token)
+def normalize_repo(repo):
+    """returns owner/repo given either that or a github.com URL"""
+    return re.sub(r"^http(s)?://github.com/", "", repo).strip("/")
 
-    return url
 
+def get_default_branch(repo, session=None, api_url=GITHUB_API_BASE):
+    """returns the name of the default branch of the repo, remembered by a
+    GithubSession"""
+    branches = getattr(session, "default_branches", {})
+    if (api_url, repo) in branches:
+        return branches[(api_url, repo)]
 
-def get_default_branch(repo):
-    """returns the name of the default branch of the repo"""
-    url = "{}/repos/{}".format(GITHUB_API_BASE, repo)
-    response = request(url)
+    url = "{}/repos/{}".format(api_url, repo)
+    response = (session or Session()).request(url)
+    check_response(response, url)
     if response.status == 200:
         api_response = response.json
+        branches[(api_url, repo)] = api_response["default_branch"]
         return api_response["default_branch"]
     else:
         return "master"
 
 
-def get_requirements_file_from_url(url):
+async def get_default_branch_async(repo, session, api_url=GITHUB_API_BASE):
+    """get_default_branch() with an AsyncSession"""
+    branches = getattr(session, "default_branches", {})
+    if (api_url, repo) in branches:
+        return branches[(api_url, repo)]
+
+    url = "{}/repos/{}".format(api_url, repo)
+    response = await session.request(url)
+    check_response(response, url)
+    if response.status == 200:
+        branches[(api_url, repo)] = response.json["default_branch"]
+        return response.json["default_branch"]
+    return "master"
+
+
+def is_ignored_dir(name):
+    """returns True for hidden and vendored directories"""
+    return name.startswith(".") or name in VENDORED_DIRS
+
+
+def is_requirements_file(path):
+    """returns True for the paths of files piprot can check: requirements and
+    constraints files, lockfiles and pyproject.toml (if it can be read)"""
+    parts = path.split("/")
+    if any(is_ignored_dir(part) for part in parts[:-1]):
+        return False
+    return parts[-1] in READABLE_LOCKFILES or bool(REQUIREMENTS_FILE.search(path))
+
+
+def fetch_tree(repo, ref, session, api_url=GITHUB_API_BASE, recursive=False):
+    """returns the Git trees API listing (a dict) of ref, a branch or a tree's
+    sha, in the repo. Empty if there's no such tree."""
+    url = "{}/repos/{}/git/trees/{}".format(api_url, repo, quote(ref, safe=""))
+    if recursive:
+        url += "?recursive=1"
+    response = session.request(url)
+    check_response(response, url)
+    if response.status != 200 or not response.json:
+        return {}
+    return response.json
+
+
+def walk_tree(repo, sha, session, api_url=GITHUB_API_BASE, prefix=""):
+    """returns the path of every file in the tree sha, listing each directory
+    with its own request. Hidden and vendored directories aren't listed."""
+    paths = []
+    for entry in fetch_tree(repo, sha, session, api_url).get("tree", []):
+        path = prefix + entry["path"]
+        if entry.get("type") == "blob":
+            paths.append(path)
+        elif entry.get("type") == "tree" and not is_ignored_dir(entry["path"]):
+            paths.extend(walk_tree(repo, entry["sha"], session, api_url, path + "/"))
+    return paths
+
+
+def get_tree(repo, branch, session=None, api_url=GITHUB_API_BASE):
+    """returns the path of every file in the repo at branch, from a single
+    Git trees request. GitHub truncates the listing of very large repos, their
+    directories are then listed one at a time (see walk_tree())."""
+    session = session or Session()
+    tree = fetch_tree(repo, branch, session, api_url, recursive=True)
+    if tree.get("truncated"):
+        return walk_tree(repo, tree["sha"], session, api_url)
+    return [
+        entry["path"] for entry in tree.get("tree", []) if entry.get("type") == "blob"
+    ]
+
+
+def find_requirements_files(repo, branch, session=None, api_url=GITHUB_API_BASE):
+    """returns the sorted paths of every requirements file and lockfile in a
+    repo (see is_requirements_file()), from one Git trees request"""
+    paths = get_tree(repo, branch, session=session, api_url=api_url)
+    return sorted(path for path in paths if is_requirements_file(path))
+
+
+def fetch_files(urls, session=None, jobs=8):
+    """returns the content of each of urls, fetched jobs at a time"""
+    session = session or Session()
+
+    def fetch(url):
+        return get_requirements_file_from_url(url, session=session).getvalue()
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(fetch, urls))
+
+
+def get_requirements_files(
+    repo,
+    branch=None,
+    token=None,
+    session=None,
+    api_url=GITHUB_API_BASE,
+    raw_url=GITHUB_RAW_BASE,
+    jobs=8,
+):
+    """
+    Finds every requirements file and lockfile in a repo with one Git trees
+    request and fetches them, jobs at a time. Returns a list of (url, content)
+    tuples, sorted by path.
+    """
+    session = with_token(session or Session(), token, api_url, raw_url)
+    repo = normalize_repo(repo)
+    if not branch:
+        branch = get_default_branch(repo, session=session, api_url=api_url)
+
+    urls = [
+        build_github_url(repo, branch, path, api_url=api_url, raw_url=raw_url)
+        for path in find_requirements_files(repo, branch, session, api_url)
+    ]
+    return list(zip(urls, fetch_files(urls, session, jobs)))
+
+
+def get_org_repos(org, session=None, api_url=GITHUB_API_BASE):
+    """returns the API listing (a dict) of every repo in a GitHub
+    organisation, following the pagination of the listing"""
+    session = session or Session()
+    url = "{}/orgs/{}/repos?per_page={}".format(api_url, org, REPOS_PER_PAGE)
+    repos = []
+    while url:
+        response = session.request(url)
+        check_response(response, url)
+        if response.status != 200:
+            raise GithubError(
+                "{} returned {}".format(url.split("?")[0], response.status)
+            )
+        repos.extend(response.json)
+        link = NEXT_LINK.search((response.headers or {}).get("link", ""))
+        url = link.group(1) if link else None
+    return repos
+
+
+def get_org_requirements_files(
+    org,
+    token=None,
+    session=None,
+    api_url=GITHUB_API_BASE,
+    raw_url=GITHUB_RAW_BASE,
+    jobs=8,
+    archived=False,
+):
+    """
+    Finds and fetches every requirements file and lockfile in every repo of
+    a GitHub organisation (skipping archived repos unless archived is True):
+    the repos are listed, each repo's tree is fetched and then all of the
+    files, each step jobs requests at a time. Returns a list of (repo, path,
+    url, content) tuples.
+    """
+    session = with_token(session or Session(), token, api_url, raw_url)
+    repos = []
+    for repo in get_org_repos(org, session, api_url):
+        if repo.get("archived") and not archived:
+            continue
+        repos.append((repo["full_name"], repo["default_branch"]))
+
+    def find(repo):
+        return find_requirements_files(repo[0], repo[1], session, api_url)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        trees = list(pool.map(find, repos))
+
+    files = [
+        (name, path, build_github_url(name, branch, path, raw_url=raw_url))
+        for (name, branch), paths in zip(repos, trees)
+        for path in paths
+    ]
+    contents = fetch_files([url for _, _, url in files], session, jobs)
+    return [file + (content,) for file, content in zip(files, contents)]
+
+
+def get_requirements_file_from_url(url, session=None):
     """fetches the requiremets from the url"""
-    response = request(url)
+    response = (session or Session()).request(url)
+    check_response(response, url)
 
     if response.status == 200:
-        return StringIO(response.content)
+        return StringIO(response.content.decode("utf-8"))
     else:
         return StringIO("")
+
+
+async def get_requirements_file_from_url_async(url, session):
+    """get_requirements_file_from_url() with an AsyncSession"""
+    response = await session.request(url)
+    check_response(response, url)
+    if response.status == 200:
+        return StringIO(response.content.decode("utf-8"))
+    return StringIO("")
@@ -0,0 +1,290 @@
+"""
+streaming parser for pip requirements files
+
+    with open("requirements.txt") as f:
+        for record in parse_requirements(f):
+            ...
+
+parse_requirements() reads one line at a time and yields a record for every
+logical line (lines ending in a backslash are joined, as pip does):
+
+- Requirement  a requirement specifier, or an -e / --editable one
+- Include      -r / --requirement and -c / --constraint
+- Option       any other pip option (--index-url, --pre, ...)
+- Comment      blank and comment-only lines
+
+Each record keeps the number of the line it starts on and its original text,
+so a file can be written back out as-is. IncludeResolver reads the files that
+-r and -c lines point at, local ones or (given a way to fetch them) URLs.
+"""
+import os
+import re
+import shlex
+import threading
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+Requirement = namedtuple(
+    "Requirement",
+    "name version specifier extras markers url hashes editable ignore "
+    "line_number text",
+)
+Include = namedtuple("Include", "path constraint ignore line_number text")
+Option = namedtuple("Option", "name value line_number text")
+Comment = namedtuple("Comment", "line_number text")
+
+INCLUDE_OPTIONS = {
+    "-r": False,
+    "--requirement": False,
+    "-c": True,
+    "--constraint": True,
+}
+EDITABLE_OPTIONS = ("-e", "--editable")
+# options that take a value, everything else is a flag
+VALUE_OPTIONS = frozenset(
+    [
+        "-r",
+        "--requirement",
+        "-c",
+        "--constraint",
+        "-e",
+        "--editable",
+        "-i",
+        "--index-url",
+        "--extra-index-url",
+        "-f",
+        "--find-links",
+        "--no-binary",
+        "--only-binary",
+        "--trusted-host",
+        "--use-feature",
+        "--hash",
+        "--config-settings",
+        "--global-option",
+    ]
+)
+
+# pip's rule, a # only starts a comment at the start of a line or after space
+COMMENT = re.compile(r"(^|\s+)#.*$")
+NAME = re.compile(
+    r"(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*"
+    r"(?:\[(?P<extras>[^\]]*)\])?\s*(?P<rest>.*)$",
+    re.S,
+)
+# a URL (https:, git+https:, file:) or a path rather than a project name
+LOCATION = re.compile(r"[A-Za-z0-9+.-]*:|[./\\~]")
+EGG = re.compile(r"#egg=([A-Za-z0-9._-]+)")
+URL = re.compile(r"^https?://")
+
+
+def canonicalize_name(name):
+    """Normalize a project name as described in PEP 503"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def logical_lines(lines):
+    """yields (line_number, text, raw) for each logical line, where text has
+    the continuations joined and raw is the original lines"""
+    parts = []
+    raw = []
+    start = 0
+    for number, line in enumerate(lines, 1):
+        text = line.rstrip("\r\n")
+        if text.endswith("\\") and not text.lstrip().startswith("#"):
+            if not parts:
+                start = number
+            parts.append(text[:-1])
+            raw.append(line)
+        elif parts:
+            parts.append(text)
+            raw.append(line)
+            yield start, "".join(parts), "".join(raw)
+            parts, raw = [], []
+        else:
+            yield number, text, line
+
+    # a continuation on the last line
+    if parts:
+        yield start, "".join(parts), "".join(raw)
+
+
+def split_options(text):
+    """returns a list of (name, value) for the options in text"""
+    tokens = shlex.split(text) if ('"' in text or "'" in text) else text.split()
+    options = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token.startswith("--"):
+            name, eq, value = token.partition("=")
+        elif token.startswith("-"):
+            name, value, eq = token[:2], token[2:], token[2:]
+        else:
+            # a stray argument, pip would refuse the line
+            continue
+
+        if not eq and name in VALUE_OPTIONS and i < len(tokens):
+            value = tokens[i]
+            i += 1
+        options.append((name, value or None))
+    return options
+
+
+def parse_specifier(spec, ignore, line_number, raw, hashes=(), editable=False):
+    """returns the Requirement for a requirement specifier (or URL)"""
+    match = None if LOCATION.match(spec) else NAME.match(spec)
+    if not match or match.group("rest").startswith("/"):
+        # a URL or a path, the name of the project isn't known
+        egg = EGG.search(spec)
+        return Requirement(
+            egg.group(1) if egg else None,
+            None,
+            "",
+            (),
+            None,
+            spec,
+            hashes,
+            editable,
+            ignore,
+            line_number,
+            raw,
+        )
+
+    rest = match.group("rest")
+    url = None
+    if rest.startswith("@"):
+        url, _, markers = rest[1:].partition(" ;")
+        url, specifier = url.strip(), ""
+    else:
+        specifier, _, markers = rest.partition(";")
+        specifier = specifier.strip()
+
+    version = None
+    if specifier.startswith("==="):
+        version = specifier[3:].strip()
+    elif specifier.startswith("==") and "," not in specifier and "*" not in specifier:
+        version = specifier[2:].strip()
+
+    extras = match.group("extras")
+    return Requirement(
+        match.group("name"),
+        version or None,
+        specifier,
+        tuple(e.strip() for e in extras.split(",") if e.strip()) if extras else (),
+        markers.strip() or None,
+        url,
+        hashes,
+        editable,
+        ignore,
+        line_number,
+        raw,
+    )
+
+
+def parse_line(line_number, text, raw):
+    """returns the record for a logical line"""
+    ignore = text.rstrip().endswith("  # norot")
+    if "#" in text:
+        text = COMMENT.sub("", text)
+    text = text.strip()
+    if not text:
+        return Comment(line_number, raw)
+
+    if text[0] == "-":
+        options = split_options(text)
+        if not options:
+            return Comment(line_number, raw)
+        name, value = options[0]
+        if name in INCLUDE_OPTIONS and value:
+            return Include(value, INCLUDE_OPTIONS[name], ignore, line_number, raw)
+        if name in EDITABLE_OPTIONS and value:
+            return parse_specifier(value, ignore, line_number, raw, editable=True)
+        return Option(name, value, line_number, raw)
+
+    # like pip, the specifier runs up to the first option (--hash ...)
+    spec, hashes = text, ()
+    if " -" in text:
+        start = text.index(" -")
+        spec = text[:start].rstrip()
+        hashes = tuple(
+            value
+            for name, value in split_options(text[start:])
+            if name == "--hash" and value
+        )
+    return parse_specifier(spec, ignore, line_number, raw, hashes)
+
+
+def parse_requirements(lines):
+    """Yields a record (see the module docstring) for each logical line of
+    lines, a requirements file or any other iterable of lines."""
+    for line_number, text, raw in logical_lines(lines):
+        yield parse_line(line_number, text, raw)
+
+
+def get_include_path(parent, path):
+    """returns the location of the file path that's included by the file at
+    parent, both can be a path or a URL. A URL's query (e.g. a token) is kept
+    for the files it includes."""
+    if not URL.match(parent):
+        return os.path.join(os.path.dirname(parent), path)
+    url = urljoin(parent, path)
+    parent_parts, parts = urlsplit(parent), urlsplit(url)
+    if parent_parts.query and not parts.query and parts.netloc == parent_parts.netloc:
+        url = urlunsplit(parts._replace(query=parent_parts.query))
+    return url
+
+
+class IncludeResolver(object):
+    """
+    Reads and parses included requirements files, each once: records are
+    cached by real path and modification time, so a file that's included
+    many times (or by many requirements files in a run) is only read again if
+    it changes. Files are closed as soon as they've been read.
+
+    URLs are read with fetch, a function that returns the file at a URL as
+    an iterable of lines, and cached for as long as the resolver is used.
+    add() gives the content of a URL up front.
+    """
+
+    def __init__(self, fetch=None):
+        self.files = {}
+        self.fetch = fetch
+        self.lock = threading.Lock()
+
+    def add(self, url, text):
+        """Use text as the content of the file at url"""
+        records = list(parse_requirements(text.splitlines(True)))
+        with self.lock:
+            self.files[url] = (None, records)
+
+    def parse(self, path):
+        """returns the list of records in the file at path (or URL)"""
+        if URL.match(path):
+            return self.parse_url(path)
+
+        path = os.path.realpath(path)
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            cached = self.files.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path) as req_file:
+            records = list(parse_requirements(req_file))
+        with self.lock:
+            self.files[path] = (mtime, records)
+        return records
+
+    def parse_url(self, url):
+        with self.lock:
+            cached = self.files.get(url)
+        if cached:
+            return cached[1]
+        if self.fetch is None:
+            raise IOError("{} can't be fetched".format(url))
+
+        records = list(parse_requirements(self.fetch(url)))
+        with self.lock:
+            self.files[url] = (None, records)
+        return records
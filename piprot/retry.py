@@ -0,0 +1,207 @@
+"""
+retries, backoff and rate limits for HTTP requests
+
+RetryingSession wraps a thttp.Session (and AsyncRetryingSession a
+piprot.aio.AsyncSession) so that:
+
+- transient failures (connection errors, timeouts, 429 and 5xx responses) are
+  retried with jittered exponential backoff
+- Retry-After and GitHub's X-RateLimit-Remaining / X-RateLimit-Reset headers
+  are honoured, holding back every request to that host until the limit
+  resets (as long as that's no more than max_wait seconds away)
+- at most max_per_host requests are in flight to each host
+"""
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+DEFAULT_RETRIES = 3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+    """
+    Decides whether, and after how long, a request should be retried.
+    Backoff delays are random between 0 and backoff * 2 ** attempt seconds
+    (capped at max_backoff), rate limits are waited out for up to max_wait
+    seconds.
+    """
+
+    def __init__(
+        self,
+        retries=DEFAULT_RETRIES,
+        backoff=0.5,
+        max_backoff=30,
+        max_wait=60,
+        max_per_host=None,
+        seed=None,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self.max_per_host = max_per_host
+        self.random = random.Random(seed)
+
+    def backoff_delay(self, attempt):
+        return self.random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)
+        )
+
+    def rate_limit_wait(self, response, now=None):
+        """returns the seconds until a rate limited response's host can be
+        asked again, or None if the response isn't rate limited"""
+        now = time.time() if now is None else now
+        headers = response.headers
+
+        if response.status in (403, 429, 503) and "retry-after" in headers:
+            retry_after = headers["retry-after"].strip()
+            if retry_after.isdigit():
+                return float(retry_after)
+            try:
+                return max(0, parsedate_to_datetime(retry_after).timestamp() - now)
+            except (TypeError, ValueError):
+                pass
+
+        if (
+            response.status in (403, 429)
+            and headers.get("x-ratelimit-remaining") == "0"
+            and headers.get("x-ratelimit-reset", "").isdigit()
+        ):
+            return max(0, int(headers["x-ratelimit-reset"]) - now)
+
+        return None
+
+    def retry_delay(self, response, attempt):
+        """returns (delay, rate_limited) for a response, delay is None if it
+        shouldn't be retried"""
+        if attempt >= self.retries:
+            return None, False
+
+        wait = self.rate_limit_wait(response)
+        if wait is not None:
+            return (wait if wait <= self.max_wait else None), True
+
+        if response.status in RETRY_STATUSES:
+            return self.backoff_delay(attempt), False
+        return None, False
+
+    def error_delay(self, attempt):
+        """returns the delay before retrying a request that raised an error,
+        None if it shouldn't be retried"""
+        if attempt >= self.retries:
+            return None
+        return self.backoff_delay(attempt)
+
+
+class Scheduler(object):
+    """Keeps the time each host is rate limited until, shared by every request
+    made through a (sync or async) retrying session."""
+
+    def __init__(self, session, policy=None):
+        self.session = session
+        self.policy = policy or RetryPolicy()
+        self.blocked = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # everything else (pool, cookiejar, timeout...) is the session's
+        if name == "session":
+            raise AttributeError(name)
+        return getattr(self.session, name)
+
+    def block(self, host, seconds):
+        with self.lock:
+            self.blocked[host] = max(self.blocked.get(host, 0), time.time() + seconds)
+
+    def wait_time(self, host):
+        with self.lock:
+            return max(0, self.blocked.get(host, 0) - time.time())
+
+
+class RetryingSession(Scheduler):
+    """A thttp.Session with retries, rate limit handling and a per-host cap
+    on concurrent requests, request() takes the same arguments."""
+
+    def __init__(self, session, policy=None):
+        super(RetryingSession, self).__init__(session, policy)
+        self.slots = {}
+
+    def slot(self, host):
+        with self.lock:
+            if host not in self.slots:
+                self.slots[host] = threading.BoundedSemaphore(
+                    self.policy.max_per_host
+                )
+            return self.slots[host]
+
+    def send(self, host, url, kwargs):
+        if not self.policy.max_per_host:
+            return self.session.request(url, **kwargs)
+        with self.slot(host):
+            return self.session.request(url, **kwargs)
+
+    def request(self, url, **kwargs):
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            time.sleep(self.wait_time(host))
+            try:
+                response = self.send(host, url, kwargs)
+            except (OSError, asyncio.TimeoutError):
+                delay = self.policy.error_delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                delay, rate_limited = self.policy.retry_delay(response, attempt)
+                if delay is None:
+                    return response
+                if rate_limited:
+                    self.block(host, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncRetryingSession(Scheduler):
+    """RetryingSession for a piprot.aio.AsyncSession"""
+
+    def __init__(self, session, policy=None):
+        super(AsyncRetryingSession, self).__init__(session, policy)
+        self.slots = {}
+
+    async def send(self, host, url, kwargs):
+        if not self.policy.max_per_host:
+            return await self.session.request(url, **kwargs)
+        if host not in self.slots:
+            self.slots[host] = asyncio.Semaphore(self.policy.max_per_host)
+        async with self.slots[host]:
+            return await self.session.request(url, **kwargs)
+
+    async def request(self, url, **kwargs):
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.wait_time(host))
+            try:
+                response = await self.send(host, url, kwargs)
+            except (OSError, asyncio.TimeoutError):
+                delay = self.policy.error_delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                delay, rate_limited = self.policy.retry_delay(response, attempt)
+                if delay is None:
+                    return response
+                if rate_limited:
+                    self.block(host, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def close(self):
+        await self.session.close()
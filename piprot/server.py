@@ -0,0 +1,213 @@
+"""
+piprot serve - check requirements over HTTP with a long-lived Checker
+
+    piprot serve --port 8080 --max-packages 5000
+
+    curl --data-binary @requirements.txt http://127.0.0.1:8080/check
+    curl 'http://127.0.0.1:8080/check?source=github:sesh/piprot'
+
+Both return the same document as `piprot --format json`. PyPI responses (up
+to --max-packages projects, each for up to --memory-ttl seconds) are kept in
+memory and shared by every request, so checks of overlapping requirements
+are mostly answered without going to PyPI.
+"""
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from piprot.cache import DEFAULT_TTL
+from piprot.piprot import (
+    REQUEST_ERRORS,
+    Checker,
+    add_store_arguments,
+    describe_error,
+    get_store_settings,
+    get_github_session,
+    get_summary,
+    load_source,
+)
+from piprot.providers.github import GITHUB_API_BASE, GITHUB_RAW_BASE, GithubError
+
+DEFAULT_PORT = 8080
+DEFAULT_MAX_PACKAGES = 10000
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class PiprotServer(ThreadingHTTPServer):
+    """
+    Answers:
+
+    - POST /check             the body is a requirements file
+    - GET /check?source=...   a github:owner/repo[@branch][:path] or URL
+    - GET /health             status and the number of projects in memory
+
+    /check takes an optional delay (in days) with the same meaning as
+    --delay. token is used for every GitHub source.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", DEFAULT_PORT),
+        checker=None,
+        token=None,
+        github_api_url=GITHUB_API_BASE,
+        github_raw_url=GITHUB_RAW_BASE,
+    ):
+        self.checker = checker or Checker(max_packages=DEFAULT_MAX_PACKAGES)
+        self.token = token
+        self.github_api_url = github_api_url
+        self.github_raw_url = github_raw_url
+        self.github = get_github_session(
+            self.checker.store, token, github_api_url, github_raw_url
+        )
+        super(PiprotServer, self).__init__(address, PiprotHandler)
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def load(self, source):
+        """Return the parsed requirements of a remote source, local files are
+        not allowed"""
+        if not source.startswith(("github:", "http://", "https://")):
+            raise ValueError("source must be github:owner/repo or a URL")
+        return load_source(
+            source,
+            token=self.token,
+            session=self.github,
+            github_api_url=self.github_api_url,
+            github_raw_url=self.github_raw_url,
+        )
+
+    def report(self, requirements, delay=None):
+        results = self.checker.check(requirements)
+        days = [r.days_behind for r in results if r.days_behind is not None]
+        summary = get_summary(sum(days), max(days + [0]), delay)
+        return dict(summary, requirements=[r.as_dict() for r in results])
+
+    def health(self):
+        responses = self.checker.store.responses
+        health = {"status": "ok", "packages": len(responses)}
+        if hasattr(responses, "hits"):
+            health.update(hits=responses.hits, misses=responses.misses)
+        return health
+
+
+class PiprotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+
+        if url.path == "/health":
+            return self.respond(200, self.server.health())
+
+        if url.path != "/check":
+            return self.respond(404, {"error": "not found"})
+        if "source" not in params:
+            return self.respond(400, {"error": "source is required"})
+
+        try:
+            requirements = self.server.load(params["source"][0])
+        except ValueError as e:
+            return self.respond(400, {"error": str(e)})
+        except GithubError as e:
+            return self.respond(502, {"error": str(e)})
+        except REQUEST_ERRORS as e:
+            return self.respond(502, {"error": describe_error(e)})
+        self.check(requirements, params)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/check":
+            return self.respond(404, {"error": "not found"})
+
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return self.respond(411, {"error": "Content-Length is required"})
+        if length > MAX_BODY_SIZE:
+            return self.respond(413, {"error": "requirements file is too large"})
+
+        try:
+            content = self.rfile.read(length).decode("utf-8")
+        except UnicodeDecodeError:
+            return self.respond(400, {"error": "requirements must be UTF-8"})
+        self.check(content, parse_qs(url.query))
+
+    def check(self, requirements, params):
+        delay = params.get("delay", [None])[0]
+        if delay is not None and not delay.isdigit():
+            return self.respond(400, {"error": "delay must be a number of days"})
+        report = self.server.report(requirements, delay)
+        self.respond(200, report)
+
+    def respond(self, status, document):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(argv=None):
+    """Parse the `piprot serve` command line and run the server until it's
+    interrupted"""
+    parser = argparse.ArgumentParser(
+        prog="piprot serve", description="Check requirements over HTTP."
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on (127.0.0.1)."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="Port to listen on ({}).".format(DEFAULT_PORT),
+    )
+    parser.add_argument(
+        "--max-packages",
+        type=int,
+        default=DEFAULT_MAX_PACKAGES,
+        help="Number of projects to keep in memory "
+        "(default {}).".format(DEFAULT_MAX_PACKAGES),
+    )
+    parser.add_argument(
+        "--memory-ttl",
+        type=int,
+        default=DEFAULT_TTL,
+        help="Seconds to keep a project in memory (default {}).".format(DEFAULT_TTL),
+    )
+    parser.add_argument(
+        "-t", "--token", help="Github personal access token for github: sources."
+    )
+    add_store_arguments(parser)
+    args = parser.parse_args(argv)
+
+    checker = Checker(
+        jobs=args.jobs,
+        engine=args.engine,
+        max_packages=args.max_packages,
+        memory_ttl=args.memory_ttl,
+        **get_store_settings(args)
+    )
+    server = PiprotServer((args.host, args.port), checker=checker, token=args.token)
+    print("piprot serving on {}".format(server.url))
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        checker.close()
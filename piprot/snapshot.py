@@ -0,0 +1,136 @@
+"""
+offline snapshots of the release data of a set of packages
+
+    piprot snapshot -o packages.db requirements.txt
+    piprot --offline packages.db requirements.txt
+
+A snapshot is a SQLite database holding just what a check needs for each
+package: its versions, the upload time of each release's first file and
+whether the release was yanked. Packages and releases are tables keyed by
+name (and version), so each lookup is an index search rather than a scan.
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+from piprot.thttp import Response
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    stable_version TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS releases (
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    upload_time TEXT,
+    yanked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, version)
+) WITHOUT ROWID;
+"""
+
+
+def get_releases(project):
+    """returns (version, upload_time, yanked) for each release in a PyPI
+    project JSON document"""
+    releases = []
+    for version, files in project.get("releases", {}).items():
+        if files:
+            yanked = all(f.get("yanked", False) for f in files)
+            releases.append((version, files[0].get("upload_time"), int(yanked)))
+        else:
+            releases.append((version, None, 0))
+    return releases
+
+
+class Snapshot(object):
+    """
+    A snapshot file, opened read-only unless create is True (which creates
+    it if needed). Packages are stored and looked up by their PEP 503 name.
+    A Snapshot can be shared between threads.
+    """
+
+    def __init__(self, path, create=False):
+        self.path = path
+        if create:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.executescript(SCHEMA)
+        else:
+            uri = "file:{}?mode=ro".format(pathname2url(os.path.abspath(path)))
+            self.db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+
+    def add(self, name, project):
+        """Store the releases of a PyPI project JSON document under name,
+        they're written to the file by save()"""
+        info = project.get("info") or {}
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO packages VALUES (?, ?)",
+                (name, info.get("stable_version")),
+            )
+            self.db.execute("DELETE FROM releases WHERE name = ?", (name,))
+            self.db.executemany(
+                "INSERT INTO releases VALUES (?, ?, ?, ?)",
+                [(name,) + release for release in get_releases(project)],
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('created', ?)",
+                (time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),),
+            )
+
+    def save(self):
+        with self.lock:
+            self.db.commit()
+
+    def get(self, name):
+        """returns a project JSON style document for name, or None if it
+        isn't in the snapshot"""
+        with self.lock:
+            package = self.db.execute(
+                "SELECT stable_version FROM packages WHERE name = ?", (name,)
+            ).fetchone()
+            if package is None:
+                return None
+            rows = self.db.execute(
+                "SELECT version, upload_time, yanked FROM releases WHERE name = ?",
+                (name,),
+            ).fetchall()
+
+        releases = {}
+        for version, upload_time, yanked in rows:
+            releases[version] = []
+            if upload_time:
+                releases[version].append(
+                    {"upload_time": upload_time, "yanked": bool(yanked)}
+                )
+        info = {"stable_version": package[0]} if package[0] else {}
+        return {"info": info, "releases": releases}
+
+    def response(self, name):
+        """returns the project JSON response for name, a 404 if it isn't in
+        the snapshot"""
+        project = self.get(name)
+        return Response(
+            None,
+            b"",
+            project,
+            200 if project is not None else 404,
+            "snapshot:{}".format(name),
+            {},
+            None,
+        )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,144 @@
+"""
+keeping the on-disk cache in step with the package index
+
+    piprot sync --cache
+
+PyPI numbers every change to a project (a release, an upload, a yank) with a
+serial that only ever goes up, and the JSON and Simple API responses for a
+project carry the serial of its last change in X-PyPI-Last-Serial. Given the
+serial the cache was last synced at, one changelog_since_serial call to the
+index's XML-RPC API lists every project that has changed since. Cached
+responses for those projects are expired (if they're older than the change)
+and the others that are known to be up to date are marked fresh, so the
+cache stays exact without looking up each package.
+
+The serial, and the time of the sync, are kept in serial.json in the cache
+directory for each index. The first sync expires everything in the cache,
+as there's no telling what changed before it.
+"""
+import json
+import os
+import tempfile
+import xmlrpc.client
+from xml.parsers.expat import ExpatError
+
+from piprot.reqfile import canonicalize_name
+
+# PyPI returns at most this many changes from one changelog_since_serial call
+CHANGELOG_LIMIT = 50000
+SERIAL_FILE = "serial.json"
+
+
+class ChangelogError(Exception):
+    pass
+
+
+def call(session, url, method, *params):
+    """returns the result of an XML-RPC call, raising ChangelogError if it
+    fails"""
+    response = session.request(
+        url,
+        data=xmlrpc.client.dumps(params, method).encode("utf-8"),
+        headers={"content-type": "text/xml"},
+        method="POST",
+    )
+    if response.status != 200:
+        raise ChangelogError("{} failed (status {})".format(method, response.status))
+    try:
+        return xmlrpc.client.loads(response.content)[0][0]
+    except (xmlrpc.client.Fault, ExpatError, IndexError) as e:
+        raise ChangelogError("{} failed ({})".format(method, e))
+
+
+def get_last_serial(session, url):
+    """returns the serial of the latest change on the index"""
+    return call(session, url, "changelog_last_serial")
+
+
+def get_changes(session, url, since, limit=CHANGELOG_LIMIT):
+    """
+    returns a ({project: serial}, last serial) tuple, with the PEP 503 name
+    of each project changed after the serial since and the serial of its
+    latest change. Only needs more than one request if there are more than
+    limit changes.
+    """
+    changed = {}
+    while True:
+        changes = call(session, url, "changelog_since_serial", since)
+        for name, _version, _timestamp, _action, serial in changes:
+            name = canonicalize_name(name)
+            changed[name] = max(changed.get(name, 0), serial)
+            since = max(since, serial)
+        if len(changes) < limit:
+            return changed, since
+
+
+def project_name(url, base_url, simple_url):
+    """returns the PEP 503 name of the project a cached url (JSON or Simple
+    API) on the index at base_url / simple_url is for, or None"""
+    for prefix in (base_url, simple_url):
+        prefix = prefix.rstrip("/") + "/"
+        if url.startswith(prefix):
+            name = url[len(prefix) :].split("/")[0].split("?")[0]
+            return canonicalize_name(name) if name else None
+    return None
+
+
+def get_serial(headers):
+    """returns the X-PyPI-Last-Serial in headers as an int, 0 if it's
+    missing"""
+    serial = (headers or {}).get("x-pypi-last-serial", "")
+    return int(serial) if serial.isdigit() else 0
+
+
+def expire_changed(cache, changed, base_url, simple_url, since=None, synced=None):
+    """
+    Expire the responses in cache, a DiskCache, for projects in changed
+    (see get_changes()) that were fetched before the change. The rest of the
+    responses from the index are marked fresh if they're known to be up to
+    date as of the serial since: the serial of their project is at least
+    since, or they were fetched (or marked fresh) after the last sync, at
+    the time synced (if known). Older responses are left to expire.
+
+    Without since (the first sync) every response from the index is expired.
+    Returns the expired urls.
+    """
+    expired = []
+    for url, headers, mtime in cache.items():
+        name = project_name(url, base_url, simple_url)
+        if name is None:
+            continue
+        serial = get_serial(headers)
+        if since is None or changed.get(name, 0) > serial:
+            cache.expire(url)
+            expired.append(url)
+        elif serial >= since or (synced is not None and mtime >= synced):
+            cache.touch(url)
+    return expired
+
+
+def load_serial(cache_dir, url):
+    """returns the (serial, time) of the last sync of the cache with the
+    index at url, (None, None) if it hasn't been synced"""
+    try:
+        with open(os.path.join(cache_dir, SERIAL_FILE)) as f:
+            synced = json.load(f)[url]
+        return synced["serial"], synced["synced"]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+
+def save_serial(cache_dir, url, serial, synced):
+    path = os.path.join(cache_dir, SERIAL_FILE)
+    try:
+        with open(path) as f:
+            serials = json.load(f)
+    except (IOError, OSError, ValueError):
+        serials = {}
+    serials[url] = {"serial": serial, "synced": synced}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(serials, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
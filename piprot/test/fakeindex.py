@@ -0,0 +1,502 @@
+"""
+A local stand-in for PyPI and GitHub, used by the tests and benchmarks so that
+they don't need the network.
+
+    with FakeIndex() as index:
+        main([req_file], index_url=index.pypi_url)
+
+FakeIndex serves:
+
+- /pypi/<name>/json             PyPI project JSON
+- /pypi/<name>/<version>/json   PyPI release JSON
+- /simple/<name>/               Simple API, PEP 691 JSON (or HTML)
+- POST /pypi                    XML-RPC changelog_last_serial and
+                                changelog_since_serial, from `changelog`
+- /github/api/repos/<owner>/<repo>           GitHub repo API
+- /github/api/repos/<owner>/<repo>/git/trees/<branch>  Git trees API
+- /github/api/orgs/<owner>/repos             an organisation's repos, paginated
+- /github/raw/<owner>/<repo>/<branch>/<path> raw.githubusercontent.com
+- /http/...                     httpbin-like endpoints for testing the HTTP
+                                clients, see http()
+
+Projects are read from files/pypi/<name>.json and GitHub repos from
+files/github/<owner>/<repo>/ (repo.json and one directory per branch) unless
+other directories, or a dict of projects, are given.
+
+Like PyPI, JSON requests for a name that isn't normalized (PEP 503) are
+redirected to the normalized name. `renames` maps old project names to new
+ones; the JSON API 404s for the old name, and /pypi/<old name> redirects to
+/pypi/<new name>.
+
+Each request can be slowed down with `latency` (seconds) and failures can be
+injected with `errors`, a dict of path -> status, and `error_rate`, the chance
+that any other request fails with a 503. An error can also be a (status,
+headers) or (status, headers, times) tuple, the latter only fails the first
+`times` requests for the path.
+
+The (lowercased) request headers of every request are kept in `request_headers`, and the
+status of each response in `statuses`. GitHub listings return `page_size`
+repos a page (or the per_page asked for), and recursive trees are truncated
+after `tree_limit` files.
+
+`changelog` is a list of PyPI changelog entries, (name, version, timestamp,
+action, serial) tuples in serial order; changelog_since_serial returns up to
+`changelog_limit` of them at a time.
+"""
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import xmlrpc.client
+from base64 import b64encode
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote
+
+FILES = os.path.join(os.path.dirname(__file__), "files")
+
+
+def canonical(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class FakeIndex(ThreadingHTTPServer):
+    daemon_threads = True
+    # benchmarks open many connections at once, don't make them retry
+    request_queue_size = 256
+
+    def __init__(
+        self,
+        projects=None,
+        pypi_dir=os.path.join(FILES, "pypi"),
+        github_dir=os.path.join(FILES, "github"),
+        latency=0,
+        errors=None,
+        error_rate=0,
+        seed=0,
+        renames=None,
+    ):
+        self.lock = threading.Lock()
+        self.renames = {canonical(k): canonical(v) for k, v in (renames or {}).items()}
+        self.projects = {}
+        if projects is not None:
+            for name, project in projects.items():
+                self.add_project(name, project)
+        self.pypi_dir = pypi_dir
+        self.github_dir = github_dir
+        self.latency = latency
+        self.errors = errors or {}
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.changelog = []
+        self.changelog_limit = 50000
+        self.page_size = None
+        self.tree_limit = None
+        self.paths = []
+        self.request_headers = []
+        self.statuses = []
+        self.thread = None
+        super(FakeIndex, self).__init__(("127.0.0.1", 0), FakeIndexHandler)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    @property
+    def pypi_url(self):
+        return self.url + "/pypi"
+
+    @property
+    def simple_url(self):
+        return self.url + "/simple"
+
+    @property
+    def github_api_url(self):
+        return self.url + "/github/api"
+
+    @property
+    def github_raw_url(self):
+        return self.url + "/github/raw"
+
+    @property
+    def requests(self):
+        return len(self.paths)
+
+    def add_project(self, name, project):
+        """add (or replace) a project, given as a PyPI project JSON dict"""
+        with self.lock:
+            self.projects[canonical(name)] = project
+
+    def project(self, name):
+        name = canonical(name)
+        with self.lock:
+            if name in self.projects:
+                return self.projects[name]
+
+        path = os.path.join(self.pypi_dir, name + ".json")
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            project = json.load(f)
+        self.add_project(name, project)
+        return project
+
+    def github_file(self, *parts):
+        path = os.path.join(self.github_dir, *parts)
+        if not os.path.realpath(path).startswith(os.path.realpath(self.github_dir)):
+            return None
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def github_tree(self, owner, repo, ref, recursive=True):
+        """returns a Git trees API listing of a branch's files, or None. ref
+        is a branch or the sha of one of its directories, <branch>:<path>.
+        Listings of more than `tree_limit` entries are truncated."""
+        root = os.path.join(self.github_dir, owner, repo, *ref.split(":"))
+        if not os.path.realpath(root).startswith(os.path.realpath(self.github_dir)):
+            return None
+        if not os.path.isdir(root):
+            return None
+        tree = []
+        if not recursive:
+            for name in sorted(os.listdir(root)):
+                if os.path.isdir(os.path.join(root, name)):
+                    sha = ref + ("/" if ":" in ref else ":") + name
+                    tree.append({"path": name, "type": "tree", "sha": sha})
+                else:
+                    tree.append({"path": name, "type": "blob"})
+            return tree, False
+        for directory, _, names in sorted(os.walk(root)):
+            for name in sorted(names):
+                path = os.path.relpath(os.path.join(directory, name), root)
+                tree.append({"path": path.replace(os.sep, "/"), "type": "blob"})
+        if self.tree_limit is not None and len(tree) > self.tree_limit:
+            return tree[: self.tree_limit], True
+        return tree, False
+
+    def github_org(self, owner, query):
+        """returns a (page of repos, query of the next page or None) tuple for
+        the repos in files/github/<owner>/, or None"""
+        directory = os.path.join(self.github_dir, owner)
+        root = os.path.realpath(self.github_dir)
+        if not os.path.realpath(directory).startswith(root):
+            return None
+        if not os.path.isdir(directory):
+            return None
+        repos = []
+        for name in sorted(os.listdir(directory)):
+            repo = self.github_file(owner, name, "repo.json")
+            if repo is not None:
+                repos.append(json.loads(repo))
+
+        params = parse_qs(query)
+        size = self.page_size or int(params.get("per_page", ["30"])[0])
+        page = int(params.get("page", ["1"])[0])
+        start = (page - 1) * size
+        next_page = None
+        if start + size < len(repos):
+            next_page = "per_page={}&page={}".format(size, page + 1)
+        return repos[start : start + size], next_page
+
+    def route(self, path, accept):
+        """returns a (status, content type, body, extra headers) tuple"""
+        parts = [p for p in path.split("?")[0].split("/") if p]
+
+        if parts[:1] == ["pypi"] and len(parts) == 2:
+            name = canonical(parts[1])
+            if name in self.renames:
+                location = {"Location": "/pypi/{}".format(self.renames[name])}
+                return 301, "text/plain", b"", location
+            if self.project(name) is None:
+                return 404, "text/plain", b"Not Found", {}
+            return 200, "text/html", b"<html></html>", {}
+
+        if parts[:1] == ["pypi"] and len(parts) in (3, 4) and parts[-1] == "json":
+            if parts[1] != canonical(parts[1]):
+                location = "/".join(["", "pypi", canonical(parts[1])] + parts[2:])
+                return 301, "text/plain", b"", {"Location": location}
+            if parts[1] in self.renames:
+                return 404, "text/plain", b"Not Found", {}
+            project = self.project(parts[1])
+            if project is None:
+                return 404, "text/plain", b"Not Found", {}
+
+            serial = {"X-PyPI-Last-Serial": str(project.get("last_serial", 0))}
+            if len(parts) == 3:
+                return 200, "application/json", json.dumps(project), serial
+
+            version = parts[2]
+            if version not in project["releases"]:
+                return 404, "text/plain", b"Not Found", {}
+            release = {
+                "info": dict(project["info"], version=version),
+                "last_serial": project.get("last_serial", 0),
+                "urls": project["releases"][version],
+            }
+            return 200, "application/json", json.dumps(release), serial
+
+        if parts[:1] == ["simple"] and len(parts) == 2:
+            project = self.project(parts[1])
+            if project is None:
+                return 404, "text/plain", b"Not Found", {}
+            return self.simple(project, accept)
+
+        if parts[:3] == ["github", "api", "repos"] and len(parts) == 5:
+            body = self.github_file(parts[3], parts[4], "repo.json")
+            if body is None:
+                return 404, "application/json", b'{"message": "Not Found"}', {}
+            return 200, "application/json", body, {}
+
+        if parts[:3] == ["github", "api", "repos"] and parts[5:7] == ["git", "trees"]:
+            if len(parts) != 8:
+                return 404, "application/json", b'{"message": "Not Found"}', {}
+            listing = self.github_tree(
+                parts[3], parts[4], unquote(parts[7]), "recursive=" in path
+            )
+            if listing is None:
+                return 404, "application/json", b'{"message": "Not Found"}', {}
+            tree, truncated = listing
+            body = {"sha": unquote(parts[7]), "tree": tree, "truncated": truncated}
+            return 200, "application/json", json.dumps(body), {}
+
+        if parts[:3] == ["github", "api", "orgs"] and parts[4:] == ["repos"]:
+            listing = self.github_org(parts[3], path.partition("?")[2])
+            if listing is None:
+                return 404, "application/json", b'{"message": "Not Found"}', {}
+            repos, next_page = listing
+            headers = {}
+            if next_page:
+                link = "{}/github/api/orgs/{}/repos?{}".format(
+                    self.url, parts[3], next_page
+                )
+                headers["Link"] = '<{}>; rel="next"'.format(link)
+            return 200, "application/json", json.dumps(repos), headers
+
+        if parts[:2] == ["github", "raw"] and len(parts) >= 6:
+            body = self.github_file(*parts[2:])
+            if body is None:
+                return 404, "text/plain", b"404: Not Found", {}
+            return 200, "text/plain; charset=utf-8", body, {}
+
+        return 404, "text/plain", b"Not Found", {}
+
+    def rpc(self, path, body):
+        """returns the response to an XML-RPC call, like route()"""
+        if path.rstrip("/") != "/pypi":
+            return 404, "text/plain", b"Not Found", {}
+
+        params, method = xmlrpc.client.loads(body)
+        with self.lock:
+            changelog = list(self.changelog)
+        if method == "changelog_last_serial":
+            result = changelog[-1][4] if changelog else 0
+        elif method == "changelog_since_serial":
+            result = [c for c in changelog if c[4] > params[0]]
+            result = result[: self.changelog_limit]
+        else:
+            fault = xmlrpc.client.Fault(1, "unknown method {}".format(method))
+            return 200, "text/xml", xmlrpc.client.dumps(fault), {}
+        body = xmlrpc.client.dumps((result,), methodresponse=True)
+        return 200, "text/xml", body, {}
+
+    def http(self, method, path, headers, body):
+        """
+        returns the response to a request to /http/, like route():
+
+        - /http/anything                 echoes the request as JSON
+        - /http/redirect-to?url=<url>    redirects to url
+        - /http/response-headers?<k>=<v> returns the query as headers
+        - /http/cookies/set?<k>=<v>      sets a cookie, /http/cookies lists them
+        - /http/basic-auth/<user>/<pw>   401s without those credentials
+        - /http/gzip                     a gzipped JSON response
+        - /http/status/<status>          a response with that status
+        - /http/delay/<seconds>          a response after a delay
+        """
+        parts = [p for p in path.split("?")[0].split("/") if p][1:]
+        args = {k: v[0] for k, v in parse_qs(path.partition("?")[2]).items()}
+
+        if parts == ["anything"]:
+            content_type = headers.get("content-type", "")
+            echo = {"method": method, "args": args, "headers": headers}
+            if content_type == "application/json":
+                echo["json"] = json.loads(body)
+            elif content_type == "application/x-www-form-urlencoded":
+                echo["form"] = parse_qs(body.decode("utf-8"))
+            return 200, "application/json", json.dumps(echo), {}
+
+        if parts == ["redirect-to"]:
+            return 302, "text/plain", b"", {"Location": args["url"]}
+
+        if parts == ["response-headers"]:
+            return 200, "application/json", json.dumps(args), args
+
+        if parts == ["cookies", "set"]:
+            cookie = "; ".join("{}={}".format(k, v) for k, v in args.items())
+            headers = {"Set-Cookie": cookie + "; Path=/", "Location": "/http/cookies"}
+            return 302, "text/plain", b"", headers
+
+        if parts == ["cookies"]:
+            cookies = SimpleCookie(headers.get("cookie", ""))
+            body = {name: morsel.value for name, morsel in cookies.items()}
+            return 200, "application/json", json.dumps(body), {}
+
+        if parts[:1] == ["basic-auth"] and len(parts) == 3:
+            credentials = "{}:{}".format(parts[1], parts[2]).encode("utf-8")
+            authorized = headers.get("authorization") == "Basic {}".format(
+                b64encode(credentials).decode("ascii")
+            )
+            body = json.dumps({"authorized": authorized})
+            return 200 if authorized else 401, "application/json", body, {}
+
+        if parts == ["gzip"]:
+            body = gzip.compress(json.dumps({"gzipped": True}).encode("utf-8"))
+            return 200, "application/json", body, {"Content-Encoding": "gzip"}
+
+        if parts[:1] == ["status"] and len(parts) == 2:
+            status = HTTPStatus(int(parts[1]))
+            return status.value, "text/plain", status.phrase, {}
+
+        if parts[:1] == ["delay"] and len(parts) == 2:
+            time.sleep(float(parts[1]))
+            return 200, "application/json", b"{}", {}
+
+        return 404, "text/plain", b"Not Found", {}
+
+    def simple(self, project, accept):
+        name = canonical(project["info"]["name"])
+        files = []
+        for release in project["releases"].values():
+            for f in release:
+                files.append(
+                    {
+                        "filename": f["filename"],
+                        "url": "/files/{}".format(f["filename"]),
+                        "hashes": {},
+                        "upload-time": f.get("upload_time_iso_8601"),
+                        "yanked": f.get("yanked", False),
+                    }
+                )
+
+        serial = {"X-PyPI-Last-Serial": str(project.get("last_serial", 0))}
+        if "application/vnd.pypi.simple.v1+json" in accept:
+            body = {
+                "meta": {"api-version": "1.1"},
+                "name": name,
+                "versions": list(project["releases"]),
+                "files": files,
+            }
+            content_type = "application/vnd.pypi.simple.v1+json"
+            return 200, content_type, json.dumps(body), serial
+
+        links = "".join(
+            '<a href="{url}">{filename}</a><br/>\n'.format(**f) for f in files
+        )
+        body = "<html><body><h1>Links for {}</h1>\n{}</body></html>".format(
+            name, links
+        )
+        return 200, "text/html", body, serial
+
+
+class FakeIndexHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.respond(body=self.rfile.read(length))
+
+    def respond(self, head=False, body=None):
+        server = self.server
+        request_headers = {k.lower(): v for k, v in self.headers.items()}
+        with server.lock:
+            server.paths.append(self.path)
+            server.request_headers.append(request_headers)
+            failed = server.error_rate and server.random.random() < server.error_rate
+            error = server.errors.get(self.path)
+            if isinstance(error, int):
+                error = (error, {})
+            if error and len(error) == 3:
+                status, error_headers, times = error
+                server.errors[self.path] = (status, error_headers, times - 1)
+                if times <= 0:
+                    error = None
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if error:
+            status, content_type, body, headers = (
+                error[0],
+                "text/plain",
+                b"Injected error",
+                error[1],
+            )
+        elif failed:
+            status, content_type, body, headers = (
+                503,
+                "text/plain",
+                b"Service Unavailable",
+                {},
+            )
+        elif self.path.startswith("/http/"):
+            status, content_type, body, headers = server.http(
+                self.command, self.path, request_headers, body or b""
+            )
+        elif body is not None:
+            status, content_type, body, headers = server.rpc(self.path, body)
+        else:
+            status, content_type, body, headers = server.route(
+                self.path, self.headers.get("Accept", "")
+            )
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+
+        with server.lock:
+            server.statuses.append(status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status in (200, 304):
+            self.send_header("ETag", etag)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+
+        if not head:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import asyncio
+import gzip
+import socket
+import unittest
+
+from piprot.aio import AsyncSession, EventLoopThread
+from piprot.test.fakeindex import FakeIndex
+
+
+class TestAsyncSession(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex(renames={"old-six": "six"})
+        self.index.start()
+        self.loop = EventLoopThread()
+        self.session = AsyncSession()
+
+    def tearDown(self):
+        self.loop.run(self.session.close())
+        self.loop.close()
+        self.index.stop()
+
+    def request(self, path, **kwargs):
+        return self.loop.run(self.session.request(self.index.url + path, **kwargs))
+
+    def test_should_return_json(self):
+        response = self.request("/pypi/six/json")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.json["info"]["name"], "six")
+        self.assertIn("x-pypi-last-serial", response.headers)
+
+    def test_should_reuse_connections(self):
+        self.request("/pypi/six/json")
+        self.request("/pypi/pytz/json")
+        key = ("http", "127.0.0.1", self.index.server_address[1])
+        self.assertEqual(len(self.session.pool[key]), 1)
+
+    def test_should_follow_redirect(self):
+        response = self.request("/pypi/Six/json")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.url, self.index.url + "/pypi/six/json")
+
+    def test_should_drop_credentials_on_redirect_to_another_host(self):
+        other = "http://localhost:{}/http/anything".format(self.index.server_address[1])
+        response = self.request(
+            "/http/redirect-to",
+            params={"url": other},
+            headers={"Authorization": "token secret"},
+        )
+        self.assertEqual(response.url, other)
+        self.assertNotIn("authorization", response.json["headers"])
+
+    def test_should_not_follow_redirect_if_redirect_false(self):
+        response = self.request("/pypi/old-six", method="HEAD", redirect=False)
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.headers["location"], "/pypi/six")
+        self.assertEqual(response.content, b"")
+
+    def test_should_return_response_for_404(self):
+        response = self.request("/pypi/missing/json")
+        self.assertEqual(response.status, 404)
+        self.assertIsNone(response.json)
+
+    def test_timeout_includes_the_tls_handshake(self):
+        # accepts connections but never answers the TLS handshake
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        url = "https://127.0.0.1:{}/".format(server.getsockname()[1])
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                self.loop.run(self.session.request(url, timeout=0.2))
+        finally:
+            server.close()
+
+    def test_should_read_chunked_responses(self):
+        reader = FakeReader(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Content-Encoding: gzip\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        body = gzip.compress(b'{"ok": true}')
+        reader.data += b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body)
+        status, headers, content, keep_alive = self.loop.run(
+            self.session.read_response(reader, "GET")
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(content, body)
+        self.assertTrue(keep_alive)
+
+
+class FakeReader(object):
+    def __init__(self, data):
+        self.data = data
+
+    async def readline(self):
+        line, sep, self.data = self.data.partition(b"\n")
+        return line + sep
+
+    async def readexactly(self, n):
+        chunk, self.data = self.data[:n], self.data[n:]
+        return chunk
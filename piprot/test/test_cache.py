@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from piprot.cache import AliasMap, DiskCache, MemoryCache, StateFile
+from piprot.thttp import Response
+
+
+def make_response(status=200, content=b'{"info": {}}', headers=None):
+    if headers is None:
+        headers = {"content-type": "application/json", "etag": '"abc"'}
+    return Response(None, content, None, status, "", headers, None)
+
+
+class FakeRequest(object):
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def __call__(self, url, headers={}):
+        self.calls.append(headers)
+        return self.responses.pop(0)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = "https://pypi.org/pypi/six/json"
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_fresh_entry_is_served_from_disk(self):
+        cache = DiskCache(self.path)
+        request = FakeRequest(make_response())
+        cache.request(self.url, request)
+        response = cache.request(self.url, request)
+
+        self.assertEqual(len(request.calls), 1)
+        self.assertEqual(response.json, {"info": {}})
+        self.assertEqual(response.status, 200)
+
+    def test_stale_entry_is_revalidated(self):
+        cache = DiskCache(self.path, ttl=0)
+        request = FakeRequest(make_response(), make_response(304, b""))
+        cache.request(self.url, request)
+        response = cache.request(self.url, request)
+
+        self.assertEqual(request.calls[1], {"If-None-Match": '"abc"'})
+        self.assertEqual(response.content, b'{"info": {}}')
+
+    def test_errors_are_not_cached(self):
+        cache = DiskCache(self.path)
+        request = FakeRequest(make_response(404, b"", {}), make_response())
+        cache.request(self.url, request)
+        cache.request(self.url, request)
+        self.assertEqual(len(request.calls), 2)
+
+    def test_oldest_entries_are_evicted(self):
+        cache = DiskCache(self.path)
+        cache.set("https://pypi.org/pypi/a/json", make_response(headers={}))
+        old = time.time() - 100
+        os.utime(cache.path_for("https://pypi.org/pypi/a/json"), (old, old))
+        cache.max_size = cache.size + 1
+        cache.set("https://pypi.org/pypi/b/json", make_response(headers={}))
+
+        self.assertFalse(os.path.exists(cache.path_for("https://pypi.org/pypi/a/json")))  # noqa
+        self.assertTrue(os.path.exists(cache.path_for("https://pypi.org/pypi/b/json")))  # noqa
+
+
+class TestAliasMap(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_aliases_are_saved(self):
+        path = os.path.join(self.path, "aliases.json")
+        aliases = AliasMap(path)
+        aliases.set("old-name", "new-name")
+        aliases.save()
+        self.assertEqual(AliasMap(path).get("old-name"), "new-name")
+
+    def test_aliases_are_not_evicted(self):
+        cache = DiskCache(self.path, max_size=0)
+        aliases = AliasMap(os.path.join(self.path, "aliases.json"))
+        aliases.set("old-name", "new-name")
+        aliases.save()
+        cache.prune()
+        self.assertTrue(os.path.exists(aliases.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestStateFile(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.path, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def record(self, state):
+        state.set(
+            "requests", "1.2.3", "2.31.0", "2013-05-25T00:00:00", "2023-05-22", 9
+        )
+
+    def test_round_trip(self):
+        state = StateFile(self.state_path)
+        self.record(state)
+        state.save()
+
+        entry = StateFile(self.state_path).get("requests", "1.2.3")
+        self.assertEqual(entry["latest_version"], "2.31.0")
+        self.assertEqual(entry["serial"], 9)
+        self.assertIsNone(StateFile(self.state_path).get("requests", "2.0.0"))
+
+    def test_expiry(self):
+        state = StateFile(self.state_path, ttl=60)
+        self.record(state)
+        self.assertIsNotNone(state.get("requests", "1.2.3"))
+        self.assertIsNone(state.get("requests", "1.2.3", now=time.time() + 61))
+
+    def test_expired_entries_are_not_saved(self):
+        state = StateFile(self.state_path, ttl=0)
+        self.record(state)
+        state.save()
+        self.assertEqual(StateFile(self.state_path).entries, {})
+
+    def test_sync(self):
+        state = StateFile(self.state_path, ttl=60)
+        self.record(state)
+        state.set("six", "1.0", "1.1", "2014-01-01", "2015-01-01", 3)
+        state.set("pytz", "1.0", "1.1", "2014-01-01", "2015-01-01", None)
+        state.set("idna", "1.0", "1.1", "2014-01-01", "2015-01-01", 1)
+        state.set("toml", "1.0", "1.1", "2014-01-01", "2015-01-01", 1)
+        for key in ("six==1.0", "idna==1.0", "toml==1.0"):
+            state.entries[key]["checked"] = 100
+        state.entries["toml==1.0"]["checked"] = 200
+
+        state.sync({"requests": 10, "six": 2}, since=2, synced=200)
+        self.assertIsNone(state.get("requests", "1.2.3"))
+        # six changed before it was checked, so it's still up to date
+        self.assertIsNotNone(state.get("six", "1.0"))
+        self.assertIsNotNone(state.get("pytz", "1.0"))
+        # idna may have changed before the last sync, toml was checked since
+        self.assertIsNone(state.get("idna", "1.0"))
+        self.assertIsNotNone(state.get("toml", "1.0"))
+
+    def test_missing_or_invalid_file(self):
+        self.assertEqual(StateFile(self.state_path).entries, {})
+        with open(self.state_path, "w") as f:
+            f.write("not json")
+        self.assertEqual(StateFile(self.state_path).entries, {})
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        evicted = []
+        cache = MemoryCache(max_size=2, on_evict=evicted.append)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.get("a")
+        cache["c"] = 3
+        self.assertEqual(evicted, ["b"])
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_expired_entries_are_missing(self):
+        evicted = []
+        cache = MemoryCache(ttl=60, on_evict=evicted.append)
+        cache["a"] = 1
+        cache.entries["a"] = (time.time() - 61, 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(evicted, ["a"])
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
@@ -1,52 +1,245 @@
 #!/usr/bin/env python
+import shutil
+import tempfile
 import unittest
 from six import StringIO
 
+from piprot.cache import DiskCache
 from piprot.thttp import request
-from piprot.piprot import parse_req_file
-from piprot.providers.github import build_github_url
+from piprot.piprot import get_url_resolver, parse_file, parse_req_file
+from piprot.providers.github import (
+    GithubError,
+    GithubSession,
+    build_github_url,
+    find_requirements_files,
+    get_default_branch,
+    get_org_repos,
+    get_org_requirements_files,
+    get_requirements_file_from_url,
+    get_requirements_files,
+    is_requirements_file,
+)
+from piprot.test.fakeindex import FakeIndex
 
 
 class TestGithubURLs(unittest.TestCase):
     def setUp(self):
-        pass
+        self.index = FakeIndex()
+        self.index.start()
+        self.urls = {
+            "api_url": self.index.github_api_url,
+            "raw_url": self.index.github_raw_url,
+        }
+        self.raw_url = self.index.github_raw_url + "/sesh/piprot"
+
+    def tearDown(self):
+        self.index.stop()
 
     def test_repo_url(self):
-        url1 = build_github_url("sesh/piprot")
-        url2 = build_github_url("sesh/piprot", "master")
+        url1 = build_github_url("sesh/piprot", **self.urls)
+        url2 = build_github_url("sesh/piprot", "master", **self.urls)
         self.assertEqual(url1, url2)
 
     def test_absolute_repo_url(self):
-        url1 = build_github_url("sesh/piprot")
-        url2 = build_github_url("https://github.com/sesh/piprot")
+        url1 = build_github_url("sesh/piprot", **self.urls)
+        url2 = build_github_url("https://github.com/sesh/piprot", **self.urls)
         self.assertEqual(url1, url2)
 
     def test_repo_url_with_branch(self):
-        url = build_github_url("sesh/piprot", "develop")
-        expected = "https://raw.githubusercontent.com/sesh/piprot/develop/requirements.txt"  # noqa
-        self.assertEqual(url, expected)
+        url = build_github_url("sesh/piprot", "develop", **self.urls)
+        self.assertEqual(url, self.raw_url + "/develop/requirements.txt")
 
     def test_repo_url_with_path(self):
-        url = build_github_url("sesh/piprot", path="requirements/_base.txt")
-        expected = "https://raw.githubusercontent.com/sesh/piprot/master/requirements/_base.txt"  # noqa
-        self.assertEqual(url, expected)
+        path = "requirements/_base.txt"
+        url = build_github_url("sesh/piprot", path=path, **self.urls)
+        self.assertEqual(url, self.raw_url + "/master/requirements/_base.txt")
 
     def test_repo_url_with_access_token(self):
-        url = build_github_url("sesh/piprot", token="SUCH-SECRET-MANY-T0KEN")
-        expected = "https://raw.githubusercontent.com/sesh/piprot/master/requirements.txt?token=SUCH-SECRET-MANY-T0KEN"  # noqa
-        self.assertEqual(url, expected)
+        # the token is sent in a header by GithubSession, not in the URL
+        token = "SUCH-SECRET-MANY-T0KEN"
+        url = build_github_url("sesh/piprot", "master", token=token, **self.urls)
+        self.assertEqual(url, self.raw_url + "/master/requirements.txt")
 
     def test_full_github_requirements_test(self):
-        url = build_github_url("sesh/piprot", branch="dc1057d95b97dd706c4c8bbe8e3733dfaaf472b8", path="requirements.txt")
-
-        expected = "https://raw.githubusercontent.com/sesh/piprot/dc1057d95b97dd706c4c8bbe8e3733dfaaf472b8/requirements.txt"  # noqa
-        self.assertEqual(url, expected)
+        sha = "dc1057d95b97dd706c4c8bbe8e3733dfaaf472b8"
+        url = build_github_url("sesh/piprot", sha, "requirements.txt", **self.urls)
+        self.assertEqual(url, self.raw_url + "/{}/requirements.txt".format(sha))
 
+        url = build_github_url("sesh/piprot", path="requirements.txt", **self.urls)
         response = request(url)
         req_file = StringIO(response.content.decode())
         requirements = parse_req_file(req_file)
         self.assertTrue("requests" in [req for req, version, ignore in requirements])
 
 
+class TestGithubFakeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.urls = {
+            "api_url": self.index.github_api_url,
+            "raw_url": self.index.github_raw_url,
+        }
+
+    def tearDown(self):
+        self.index.stop()
+
+    def test_default_branch(self):
+        branch = get_default_branch("sesh/piprot", api_url=self.index.github_api_url)
+        self.assertEqual(branch, "master")
+
+    def test_missing_repo_defaults_to_master(self):
+        branch = get_default_branch("sesh/nope", api_url=self.index.github_api_url)
+        self.assertEqual(branch, "master")
+
+    def test_requirements_file(self):
+        url = build_github_url("sesh/piprot", **self.urls)
+        requirements = parse_req_file(get_requirements_file_from_url(url))
+        self.assertEqual(requirements[0], ("requests", "2.4.3", False))
+
+    def test_default_branch_is_cached(self):
+        session = GithubSession(**self.urls)
+        for _ in range(2):
+            get_default_branch("sesh/piprot", session, self.index.github_api_url)
+        self.assertEqual(self.index.requests, 1)
+
+        # a 404 on the branch (it might have been renamed) forgets it
+        url = build_github_url(
+            "sesh/piprot", path="missing.txt", session=session, **self.urls
+        )
+        get_requirements_file_from_url(url, session=session)
+        get_default_branch("sesh/piprot", session, self.index.github_api_url)
+        self.assertEqual(self.index.requests, 3)
+
+    def test_is_requirements_file(self):
+        for path in [
+            "requirements.txt",
+            "requirements/prod.txt",
+            "docs/requirements-docs.txt",
+            "constraints.txt",
+            "poetry.lock",
+            "service/pyproject.toml",
+        ]:
+            self.assertTrue(is_requirements_file(path), path)
+        for path in [
+            "README.txt",
+            "requirements.in",
+            ".tox/py3/requirements.txt",
+            "node_modules/x/requirements.txt",
+        ]:
+            self.assertFalse(is_requirements_file(path), path)
+
+    def test_requirements_files(self):
+        files = get_requirements_files("sesh/piprot", **self.urls)
+        self.assertEqual(
+            [url for url, _ in files],
+            [
+                self.index.github_raw_url + "/sesh/piprot/master/requirements.txt",
+                self.index.github_raw_url + "/sesh/piprot/master/requirements/dev.txt",
+            ],
+        )
+        self.assertIn("requests==2.4.3", files[0][1])
+        # the default branch, the tree and the two files
+        self.assertEqual(self.index.requests, 4)
+
+    def test_truncated_trees_are_walked(self):
+        self.index.tree_limit = 1
+        self.assertEqual(
+            find_requirements_files(
+                "sesh/piprot", "master", api_url=self.index.github_api_url
+            ),
+            ["requirements.txt", "requirements/dev.txt"],
+        )
+        # the truncated tree, then the root and requirements directories
+        self.assertEqual(self.index.requests, 3)
+
+    def test_remote_includes(self):
+        path = "requirements/dev.txt"
+        url = build_github_url("sesh/piprot", "master", path, **self.urls)
+        req_file = get_requirements_file_from_url(url)
+        requirements = parse_file(req_file, url, resolver=get_url_resolver())
+        self.assertEqual(
+            [req for req, _, _ in requirements], ["requests", "six", "piprot", "pytz"]
+        )
+
+    def test_rate_limited(self):
+        self.index.errors["/github/api/repos/sesh/piprot"] = (
+            403,
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"},
+        )
+        with self.assertRaises(GithubError) as cm:
+            get_default_branch("sesh/piprot", api_url=self.index.github_api_url)
+        self.assertIn("rate limit", str(cm.exception))
+
+    def test_forbidden_requirements_file(self):
+        url = build_github_url("sesh/piprot", "master", token="secret", **self.urls)
+        self.index.errors["/github/raw/sesh/piprot/master/requirements.txt"] = 403
+        session = GithubSession(token="secret", **self.urls)
+        with self.assertRaises(GithubError) as cm:
+            get_requirements_file_from_url(url, session=session)
+        self.assertNotIn("secret", str(cm.exception))
+
+
+class TestGithubSession(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.urls = {
+            "api_url": self.index.github_api_url,
+            "raw_url": self.index.github_raw_url,
+        }
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.index.stop()
+        shutil.rmtree(self.path)
+
+    def test_token_is_sent_to_github_only(self):
+        session = GithubSession(token="secret", **self.urls)
+        url = build_github_url("sesh/piprot", session=session, **self.urls)
+        get_requirements_file_from_url(url, session=session)
+        session.request(self.index.pypi_url + "/six/json")
+
+        authorization = [h.get("authorization") for h in self.index.request_headers]
+        self.assertEqual(authorization, ["token secret", "token secret", None])
+        self.assertNotIn("token=", "".join(self.index.paths))
+
+    def test_conditional_requests(self):
+        session = GithubSession(cache=DiskCache(self.path, ttl=0), **self.urls)
+        url = build_github_url("sesh/piprot", "master", **self.urls)
+        first = get_requirements_file_from_url(url, session=session).getvalue()
+        second = get_requirements_file_from_url(url, session=session).getvalue()
+        self.assertEqual(first, second)
+        self.assertEqual(self.index.statuses, [200, 304])
+        self.assertIn("if-none-match", self.index.request_headers[1])
+
+    def test_org_repos_are_paginated(self):
+        self.index.page_size = 1
+        repos = get_org_repos("sesh", api_url=self.index.github_api_url)
+        self.assertEqual(
+            [repo["full_name"] for repo in repos],
+            ["sesh/old", "sesh/piprot", "sesh/thttp"],
+        )
+        self.assertEqual(self.index.requests, 3)
+
+    def test_missing_org(self):
+        with self.assertRaises(GithubError):
+            get_org_repos("nobody", api_url=self.index.github_api_url)
+
+    def test_org_requirements_files(self):
+        files = get_org_requirements_files("sesh", **self.urls)
+        self.assertEqual(
+            [(repo, path) for repo, path, _, _ in files],
+            [
+                ("sesh/piprot", "requirements.txt"),
+                ("sesh/piprot", "requirements/dev.txt"),
+                ("sesh/thttp", "requirements.txt"),
+            ],
+        )
+        self.assertIn("six==1.8.0", files[2][3])
+        # the listing, two trees and three files, no default branch lookups
+        self.assertEqual(self.index.requests, 6)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+import os
+import unittest
+from six import StringIO
+from unittest import mock
+
+from piprot.lockfiles import (
+    get_lockfile_parser,
+    parse_package_lock,
+    parse_pipfile_lock,
+    parse_pyproject,
+)
+from piprot.piprot import parse_file, piprot
+
+LOCKFILES = os.path.join(os.path.dirname(__file__), "files", "lockfiles")
+
+
+def lockfile(name):
+    return open(os.path.join(LOCKFILES, name))
+
+
+class TestLockfiles(unittest.TestCase):
+    def test_pipfile_lock(self):
+        with lockfile("Pipfile.lock") as f:
+            packages = parse_pipfile_lock(f)
+        self.assertEqual(
+            packages,
+            [
+                ("requests", "2.31.0", False),
+                ("six", "1.16.0", False),
+                ("pytz", "2013.7", False),
+            ],
+        )
+
+    def test_poetry_lock(self):
+        with lockfile("poetry.lock") as f:
+            packages = parse_package_lock(f)
+        # local-lib is a directory, [metadata.files] isn't a package
+        self.assertEqual(
+            [name for name, _, _ in packages], ["requests", "six", "pytz"]
+        )
+        self.assertEqual(packages[2], ("pytz", "2013.7", False))
+
+    def test_uv_lock(self):
+        with lockfile("uv.lock") as f:
+            packages = parse_package_lock(f)
+        # the project itself and git sources can't be looked up
+        self.assertEqual(
+            packages, [("requests", "2.31.0", False), ("six", "1.16.0", False)]
+        )
+
+    def test_pyproject(self):
+        with lockfile("pyproject.toml") as f:
+            packages = parse_pyproject(f)
+        # six>=1.0 isn't pinned, Six==1.16.0 is
+        self.assertEqual(
+            packages,
+            [
+                ("requests", "2.31.0", False),
+                ("pytz", "2013.7", False),
+                ("Six", "1.16.0", False),
+            ],
+        )
+
+    @mock.patch("piprot.lockfiles.tomllib", None)
+    def test_pyproject_without_a_toml_parser(self):
+        with lockfile("pyproject.toml") as f:
+            with self.assertRaises(ImportError) as cm:
+                parse_pyproject(f)
+        self.assertIn("pip install tomli", str(cm.exception))
+
+        argv = ["piprot", os.path.join(LOCKFILES, "pyproject.toml")]
+        with mock.patch("sys.argv", argv):
+            with self.assertRaises(SystemExit) as cm:
+                piprot()
+        self.assertIn("pip install tomli", str(cm.exception.code))
+
+    def test_packages_are_deduplicated(self):
+        lock = StringIO(
+            '[[package]]\nname = "Six"\nversion = "1.16.0"\n\n'
+            '[[package]]\nname = "six"\nversion = "1.15.0"\n'
+        )
+        self.assertEqual(parse_package_lock(lock), [("Six", "1.16.0", False)])
+
+    def test_detection(self):
+        self.assertIs(get_lockfile_parser("a/b/poetry.lock"), parse_package_lock)
+        self.assertIs(
+            get_lockfile_parser("https://example.com/Pipfile.lock?token=x"),
+            parse_pipfile_lock,
+        )
+        self.assertIsNone(get_lockfile_parser("requirements.txt"))
+
+    def test_parse_file(self):
+        with lockfile("uv.lock") as f:
+            self.assertEqual(len(parse_file(f)), 2)
+        self.assertEqual(
+            parse_file(StringIO("requests==1.2.3\n")), [("requests", "1.2.3", False)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 import os
+import shutil
+import tempfile
 import unittest
 from six import StringIO
 
 from piprot.piprot import parse_req_file
+from piprot.reqfile import IncludeResolver
 
 
 class TestRequirementsParser(unittest.TestCase):
@@ -76,6 +79,84 @@ class TestRequirementsParser(unittest.TestCase):
             comments = [x[1] for x in d if not x[0]]
             self.assertTrue("# Development Requirements\n" in comments)
 
+    def test_hashed_requirements(self):
+        f = StringIO(
+            "requests==2.31.0 \\\n"
+            "    --hash=sha256:aaa \\\n"
+            "    --hash=sha256:bbb\n"
+            "    # via -r requirements.in\n"
+            'six===1.16.0 ; python_version >= "3"\n'
+            "django>=1.5\n"
+        )
+        d = parse_req_file(f)
+        self.assertEqual(d, [("requests", "2.31.0", False), ("six", "1.16.0", False)])
+
+    def write_files(self, files):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, content in files.items():
+            with open(os.path.join(directory, name), "w") as f:
+                f.write(content)
+        return directory
+
+    def test_requirement_options(self):
+        directory = self.write_files(
+            {
+                "requirements.txt": "--requirement base.txt\n-c constraints.txt\n",
+                "base.txt": "requests==1.2.3\n",
+                "constraints.txt": "six==1.0.0\n",
+            }
+        )
+        with open(os.path.join(directory, "requirements.txt")) as f:
+            d = parse_req_file(f)
+        self.assertEqual(d, [("requests", "1.2.3", False)])
+
+    def test_constraints(self):
+        directory = self.write_files(
+            {
+                "requirements.txt": "Django>=1.5\nsix\nrequests\n-c constraints.txt\n",
+                "constraints.txt": "django==1.5.4\nrequests==1.2.3\n",
+            }
+        )
+        with open(os.path.join(directory, "requirements.txt")) as f:
+            d = parse_req_file(f)
+        self.assertEqual(d, [("Django", "1.5.4", False), ("requests", "1.2.3", False)])
+
+    def test_include_cycle(self):
+        directory = self.write_files(
+            {
+                "a.txt": "-r b.txt\nrequests==1.2.3\n",
+                "b.txt": "-r a.txt\nsix==1.0.0\n",
+            }
+        )
+        with open(os.path.join(directory, "a.txt")) as f:
+            d = parse_req_file(f)
+        self.assertEqual(d, [("six", "1.0.0", False), ("requests", "1.2.3", False)])
+
+    def test_shared_includes_are_read_once(self):
+        directory = self.write_files(
+            {
+                "dev.txt": "-r base.txt\n-r test.txt\n",
+                "prod.txt": "-r base.txt\n",
+                "test.txt": "-r base.txt\nmock==1.0\n",
+                "base.txt": "requests==1.2.3\n",
+            }
+        )
+        resolver = IncludeResolver()
+        results = []
+        for name in ("dev.txt", "prod.txt"):
+            with open(os.path.join(directory, name)) as f:
+                results.append(parse_req_file(f, resolver=resolver))
+
+        self.assertEqual(
+            results,
+            [
+                [("requests", "1.2.3", False), ("mock", "1.0", False)],
+                [("requests", "1.2.3", False)],
+            ],
+        )
+        self.assertEqual(len(resolver.files), 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,55 @@
 #!/usr/bin/env python
+import contextlib
+import io
+import json
+import os
+import socket
+import shutil
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-from piprot.piprot import main
+from piprot.cache import AliasMap
+from piprot.reqfile import IncludeResolver
+from piprot.piprot import (
+    batch,
+    Checker,
+    get_root_files,
+    get_version_and_release_date,
+    load_config,
+    main,
+    PackageStore,
+)
+from piprot.test.fakeindex import FakeIndex
+from piprot.thttp import Response
+
+
+def closed_port_url():
+    """returns the url of a local port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return "http://127.0.0.1:{}".format(sock.getsockname()[1])
+
+
+def lookup(store, requirement, version=None):
+    """returns the response store.stream() yields for a single requirement"""
+    ((_, _, response),) = store.stream([(requirement, version)])
+    return response
+
+
+class FakeSession(object):
+    """answers requests from a dict of url -> json, 404ing everything else"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.urls = []
+
+    def request(self, url, headers={}, **kwargs):
+        self.urls.append(url)
+        if url not in self.documents:
+            return Response(None, b"", None, 404, url, {}, None)
+        return Response(None, b"{}", self.documents[url], 200, url, {}, None)
 
 
 class TestRequirementsParser(unittest.TestCase):
@@ -14,5 +62,650 @@ class TestRequirementsParser(unittest.TestCase):
                 main([f])
 
 
+class TestRootFiles(unittest.TestCase):
+    def test_included_files_are_skipped(self):
+        resolver = IncludeResolver()
+        base = "https://example.com/"
+        files = [
+            (base + "a.txt", "six==1.0\n"),
+            (base + "b.txt", "-r a.txt\n"),
+            (base + "c.txt", "-r d.txt\n"),
+            (base + "d.txt", "-r c.txt\n"),
+        ]
+        for url, content in files:
+            resolver.add(url, content)
+        self.assertEqual(
+            [url for url, _ in get_root_files(files, resolver)],
+            [base + "b.txt", base + "c.txt"],
+        )
+
+
+class TestMainFakeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+
+    def tearDown(self):
+        self.index.stop()
+
+    def run_main(self, *args, **kwargs):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                main(*args, **kwargs)
+            except SystemExit:
+                pass
+        return output.getvalue()
+
+    def test_requirements_file(self):
+        with open("piprot/test/files/test-requirements.txt") as f:
+            output = self.run_main([f], index_url=self.index.url, verbose=True)
+        self.assertIn("requests (1.2.3) is ", output)
+        self.assertIn("Ignoring updates for piprot.", output)
+        self.assertEqual(self.index.requests, 4)
+
+    def test_lockfile(self):
+        with open("piprot/test/files/lockfiles/poetry.lock") as f:
+            output = self.run_main([f], index_url=self.index.url, verbose=True)
+        self.assertIn("requests (2.31.0) is ", output)
+        self.assertIn("pytz (2013.7) is ", output)
+        self.assertEqual(self.index.requests, 3)
+
+    def test_state_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "state.json")
+        outputs = []
+        for _ in range(2):
+            with open("piprot/test/files/test-requirements.txt") as f:
+                outputs.append(
+                    self.run_main(
+                        [f], index_url=self.index.url, verbose=True, state=path
+                    )
+                )
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(self.index.requests, 4)
+
+        with open(path) as f:
+            entries = json.load(f)["packages"]
+        self.assertIsInstance(entries["requests==1.2.3"]["serial"], int)
+
+        # only a changed pin is looked up again
+        changed = os.path.join(directory, "requirements.txt")
+        with open(changed, "w") as f:
+            f.write("pytz==2015.4\nrequests==2.0.0\n")
+        with open(changed) as f:
+            self.run_main([f], index_url=self.index.url, state=path)
+        self.assertEqual(self.index.requests, 5)
+
+    def test_state_file_expiry(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "state.json")
+        for _ in range(2):
+            with open("piprot/test/files/pytz_req.txt") as f:
+                self.run_main([f], index_url=self.index.url, state=path, state_ttl=0)
+        self.assertEqual(self.index.requests, 2)
+
+    def test_asyncio_engine(self):
+        outputs = []
+        for engine, slim in [("threads", False), ("asyncio", False), ("asyncio", True)]:
+            with open("piprot/test/files/test-requirements.txt") as f:
+                outputs.append(
+                    self.run_main(
+                        [f],
+                        index_url=self.index.url,
+                        verbose=True,
+                        engine=engine,
+                        slim=slim,
+                    )
+                )
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+        self.assertIn("requests (1.2.3) is ", outputs[0])
+
+    def test_slim_requirements_file(self):
+        with open("piprot/test/files/test-requirements.txt") as f:
+            slim = self.run_main([f], index_url=self.index.url, slim=True)
+        with open("piprot/test/files/test-requirements.txt") as f:
+            full = self.run_main([f], index_url=self.index.url)
+        self.assertEqual(slim, full)
+
+    def test_github_repo(self):
+        output = self.run_main(
+            [],
+            repo="sesh/piprot",
+            verbose=True,
+            index_url=self.index.pypi_url,
+            github_api_url=self.index.github_api_url,
+            github_raw_url=self.index.github_raw_url,
+        )
+        self.assertIn("six (1.8.0) is ", output)
+
+    def test_github_repo_all_files(self):
+        output = self.run_main(
+            [],
+            repo="sesh/piprot",
+            all_files=True,
+            verbose=True,
+            index_url=self.index.pypi_url,
+            github_api_url=self.index.github_api_url,
+            github_raw_url=self.index.github_raw_url,
+        )
+        self.assertIn("six (1.8.0) is ", output)
+        self.assertIn("pytz (2015.4) is ", output)
+        # requirements.txt is included by requirements/dev.txt, it's only
+        # reported through it
+        self.assertEqual(output.count("requests ("), 1)
+        self.assertEqual(output.count("six ("), 1)
+        pypi_paths = [p for p in self.index.paths if p.startswith("/pypi/")]
+        self.assertEqual(len(pypi_paths), 3)
+
+    def test_ndjson_records(self):
+        with open("piprot/test/files/test-requirements.txt") as f:
+            output = self.run_main(
+                [f], index_url=self.index.url, output_format="ndjson"
+            )
+        records = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(
+            [r["package"] for r in records],
+            ["ipython", "pytz", "Django", "requests", "piprot"],
+        )
+        requests = records[3]
+        self.assertEqual(requests["version"], "1.2.3")
+        self.assertEqual(requests["version_date"][:10], "2013-05-25")
+        self.assertTrue(requests["days_behind"] > 0)
+        self.assertFalse(requests["ignored"])
+        self.assertIsNone(requests["error"])
+        self.assertTrue(records[4]["ignored"])
+        self.assertIsNone(records[4]["latest_version"])
+
+    def test_json_document(self):
+        self.index.errors["/pypi/django/json"] = 500
+        with open("piprot/test/files/test-requirements.txt") as f:
+            output = self.run_main([f], index_url=self.index.url, output_format="json")
+        report = json.loads(output)
+        self.assertTrue(report["out_of_date"])
+        self.assertEqual(len(report["requirements"]), 5)
+        django = report["requirements"][2]
+        self.assertEqual(django["error"], "lookup failed (status 500)")
+        self.assertEqual(
+            report["days_out_of_date"],
+            sum(r["days_behind"] or 0 for r in report["requirements"]),
+        )
+
+    def test_errors_are_reported(self):
+        self.index.errors["/pypi/pytz/json"] = 500
+        with open("piprot/test/files/pytz_req.txt") as f:
+            output = self.run_main([f], index_url=self.index.simple_url, verbatim=True)
+        self.assertIn("pytz==2015.4  # Error checking latest version", output)
+
+    def test_verbatim_constrained_requirement(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        files = {
+            "requirements.txt": "Django>=1.5\n-c constraints.txt\n",
+            "constraints.txt": "django==1.5.4\n",
+        }
+        for name, content in files.items():
+            with open(os.path.join(directory, name), "w") as f:
+                f.write(content)
+        with open(os.path.join(directory, "requirements.txt")) as f:
+            output = self.run_main([f], index_url=self.index.url, verbatim=True)
+        self.assertIn("Django>=1.5  # Latest ", output)
+        self.assertNotIn("==1.5.4", output)
+
+    def test_unreachable_url(self):
+        with self.assertRaises(SystemExit) as cm:
+            main([], url=closed_port_url() + "/requirements.txt", retries=0)
+        self.assertIn("Failed to fetch the requirements", str(cm.exception.code))
+
+
+class TestChecker(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.checker = Checker(index_url=self.index.pypi_url)
+
+    def tearDown(self):
+        self.checker.close()
+        self.index.stop()
+
+    def test_check_returns_results(self):
+        results = self.checker.check(
+            ["requests==1.2.3", "six==1.8.0", "missing==1.0", "piprot==0.8.2  # norot"]
+        )
+        self.assertEqual(
+            [r.package for r in results], ["requests", "six", "missing", "piprot"]
+        )
+        requests = results[0]
+        self.assertEqual(requests.version_date.date().isoformat(), "2013-05-25")
+        self.assertTrue(requests.out_of_date)
+        self.assertTrue(requests.days_behind > 0)
+        self.assertEqual(results[2].error, "not found on the package index")
+        self.assertIsNone(results[2].days_behind)
+        self.assertTrue(results[3].ignored)
+
+    def test_connection_errors_are_reported(self):
+        checker = Checker(index_url=closed_port_url() + "/pypi", retries=0)
+        results = checker.check(["six==1.8.0", "pytz==2015.4"])
+        checker.close()
+        self.assertTrue(results[0].error.startswith("lookup failed ("))
+        self.assertIsNone(results[1].latest_version)
+
+    def test_failed_lookups_are_not_kept(self):
+        checker = Checker(index_url=self.index.pypi_url, max_packages=100, retries=0)
+        self.index.errors["/pypi/six/json"] = (503, {}, 1)
+        self.assertEqual(
+            checker.check(["six==1.8.0"])[0].error, "lookup failed (status 503)"
+        )
+        results = checker.check(["six==1.8.0"])
+        checker.close()
+        self.assertIsNone(results[0].error)
+        self.assertEqual(results[0].latest_version, "1.17.0")
+
+    def test_concurrent_slim_checks(self):
+        checker = Checker(index_url=self.index.pypi_url, slim=True, max_packages=100)
+        self.index.latency = 0.05
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(checker.check, ["requests==2.1.0"]) for _ in "abcd"]
+            results = [future.result()[0] for future in futures]
+        checker.close()
+        self.assertEqual([r.error for r in results], [None] * 4)
+
+    def test_responses_are_kept_between_checks(self):
+        self.checker.check("requests==1.2.3\nsix==1.8.0\n")
+        requests = self.index.requests
+        results = self.checker.check(["six==1.8.0"])
+        self.assertEqual(results[0].latest_version, "1.17.0")
+        self.assertEqual(self.index.requests, requests)
+
+        self.checker.clear()
+        self.checker.check(["six==1.8.0"])
+        self.assertEqual(self.index.requests, requests + 1)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.manifest = tempfile.NamedTemporaryFile(
+            "w", suffix=".txt", dir="piprot/test/files", delete=False
+        )
+        self.manifest.write(
+            "# the same packages show up in several sources\n"
+            "test-requirements.txt\n"
+            "pytz_req.txt\n"
+            "\n"
+            "github:sesh/piprot\n"
+        )
+        self.manifest.close()
+
+    def tearDown(self):
+        self.index.stop()
+        os.remove(self.manifest.name)
+
+    def run_batch(self, **kwargs):
+        output = io.StringIO()
+        with open(self.manifest.name) as manifest:
+            with contextlib.redirect_stdout(output):
+                with self.assertRaises(SystemExit):
+                    batch(
+                        manifest,
+                        index_url=self.index.pypi_url,
+                        github_api_url=self.index.github_api_url,
+                        github_raw_url=self.index.github_raw_url,
+                        **kwargs
+                    )
+        return output.getvalue()
+
+    def test_reports_each_source(self):
+        output = self.run_batch(verbose=True)
+        sources = [line for line in output.splitlines() if line.startswith("# ")]
+        self.assertEqual(len(sources), 3)
+        self.assertTrue(sources[0].endswith("test-requirements.txt"))
+        self.assertEqual(sources[2], "# github:sesh/piprot")
+        self.assertEqual(output.count("pytz (2015.4) is "), 2)
+        self.assertEqual(output.count("requests ("), 2)
+
+    def test_json_records_have_sources(self):
+        report = json.loads(self.run_batch(output_format="json"))
+        self.assertEqual(len(report["sources"]), 3)
+        self.assertEqual(report["requirements"][-1]["source"], "github:sesh/piprot")
+        self.assertTrue(report["out_of_date"])
+
+    def test_diagnostics_are_written_to_stderr(self):
+        with open(self.manifest.name, "a") as manifest:
+            manifest.write("missing-requirements.txt\n")
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            report = json.loads(self.run_batch(output_format="json"))
+        self.assertEqual(len(report["sources"]), 4)
+        self.assertIn("Failed to open ", errors.getvalue())
+
+    def test_asyncio_engine(self):
+        output = self.run_batch(engine="asyncio")
+        self.assertEqual(output, self.run_batch())
+        self.assertIn("# github:sesh/piprot", output)
+        self.assertIn("six (1.8.0) is ", self.run_batch(verbose=True))
+
+    def test_packages_are_fetched_once(self):
+        self.run_batch()
+        json_paths = [p for p in self.index.paths if p.endswith("/json")]
+        self.assertEqual(len(json_paths), len(set(json_paths)))
+        self.assertIn("/pypi/pytz/json", json_paths)
+        self.assertIn("/pypi/six/json", json_paths)
+
+    def test_github_org(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with self.assertRaises(SystemExit):
+                batch(
+                    ["github-org:sesh"],
+                    verbose=True,
+                    index_url=self.index.pypi_url,
+                    github_api_url=self.index.github_api_url,
+                    github_raw_url=self.index.github_raw_url,
+                )
+        sources = [
+            line for line in output.getvalue().splitlines() if line.startswith("# ")
+        ]
+        self.assertEqual(
+            sources,
+            [
+                "# github:sesh/piprot:requirements.txt",
+                "# github:sesh/piprot:requirements/dev.txt",
+                "# github:sesh/thttp:requirements.txt",
+            ],
+        )
+        json_paths = [p for p in self.index.paths if p.endswith("/json")]
+        self.assertEqual(len(json_paths), len(set(json_paths)))
+
+
+class TestNameResolution(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex(renames={"old-six": "six"})
+        self.index.start()
+
+    def tearDown(self):
+        self.index.stop()
+
+    def test_names_are_normalized_before_lookup(self):
+        store = PackageStore(base_url=self.index.pypi_url)
+        self.assertEqual(lookup(store, "PyTZ").status, 200)
+        self.assertEqual(self.index.paths, ["/pypi/pytz/json"])
+
+    def test_renamed_projects_are_remembered(self):
+        aliases = AliasMap()
+        store = PackageStore(base_url=self.index.pypi_url, aliases=aliases)
+        self.assertEqual(lookup(store, "Old_Six").status, 200)
+        self.assertEqual(aliases.get("old-six"), "six")
+        self.assertEqual(len(self.index.paths), 3)
+
+        store = PackageStore(base_url=self.index.pypi_url, aliases=aliases)
+        lookup(store, "old-six")
+        self.assertEqual(self.index.paths[3:], ["/pypi/six/json"])
+
+    def test_missing_response_does_not_crash(self):
+        response = Response(None, b"", None, 404, "", {}, None)
+        self.assertEqual(
+            get_version_and_release_date("nope", response=response), (None, None)
+        )
+
+
+class TestIndexRouting(unittest.TestCase):
+    def setUp(self):
+        self.public = FakeIndex()
+        self.private = FakeIndex(
+            projects={
+                "acme-utils": {
+                    "info": {"name": "acme-utils"},
+                    "releases": {
+                        "1.0": [
+                            {
+                                "filename": "acme-utils-1.0.tar.gz",
+                                "upload_time": "2020-01-01T00:00:00",
+                            }
+                        ]
+                    },
+                }
+            },
+            pypi_dir=os.path.join(tempfile.gettempdir(), "piprot-no-such-dir"),
+        )
+        self.public.start()
+        self.private.start()
+
+    def tearDown(self):
+        self.public.stop()
+        self.private.stop()
+
+    def test_extra_index_is_used_after_a_404(self):
+        store = PackageStore(
+            base_url=self.public.pypi_url, extra_index_urls=[self.private.url]
+        )
+        self.assertEqual(lookup(store, "six").status, 200)
+        self.assertEqual(lookup(store, "acme-utils").status, 200)
+        self.assertEqual(
+            self.public.paths,
+            ["/pypi/six/json", "/pypi/acme-utils/json", "/pypi/acme-utils"],
+        )
+        self.assertEqual(self.private.paths, ["/pypi/acme-utils/json"])
+
+    def test_routed_packages_skip_the_other_indexes(self):
+        for slim in (False, True):
+            store = PackageStore(
+                base_url=self.public.pypi_url,
+                routes={"Acme_*": self.private.simple_url},
+                slim=slim,
+            )
+            response = lookup(store, "acme-utils", "1.0")
+            version, _ = get_version_and_release_date(
+                "acme-utils", "1.0", response=response
+            )
+            self.assertEqual(version, "1.0")
+        self.assertEqual(self.public.paths, [])
+
+    def test_config_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ini", delete=False) as f:
+            f.write(
+                "[piprot]\n"
+                "index-url = https://mirror.example.com/pypi\n"
+                "extra-index-url =\n"
+                "    https://one.example.com\n"
+                "    https://two.example.com\n"
+                "[routes]\n"
+                "acme-* = https://one.example.com\n"
+            )
+        try:
+            config = load_config(f.name)
+        finally:
+            os.remove(f.name)
+        self.assertEqual(
+            config,
+            {
+                "index_url": "https://mirror.example.com/pypi",
+                "extra_index_urls": [
+                    "https://one.example.com",
+                    "https://two.example.com",
+                ],
+                "routes": {"acme-*": "https://one.example.com"},
+            },
+        )
+
+
+class TestPackageStore(unittest.TestCase):
+    def test_fetches_each_package_once(self):
+        store = PackageStore()
+        ok = Response(None, b"", None, 200, "", {}, None)
+        with mock.patch.object(store.session, "request", return_value=ok) as request:
+            lookup(store, "pytz")
+            lookup(store, "pytz")
+            lookup(store, "PyTZ")
+            self.assertEqual(request.call_count, 1)
+
+    def test_main_shares_store_across_files(self):
+        store = PackageStore()
+        with mock.patch.object(store, "fetch", wraps=store.fetch) as fetch:
+            with self.assertRaises(SystemExit):
+                with open("piprot/test/files/pytz_req.txt") as f1, open(
+                    "piprot/test/files/pytz_req.txt"
+                ) as f2:
+                    main([f1, f2], store=store)
+            self.assertEqual(fetch.call_count, 1)
+            self.assertEqual(len(store.responses), 1)
+
+    def test_stream_keeps_one_response_per_package(self):
+        store = PackageStore()
+        requirements = [
+            ("six", "1.0"),
+            ("pytz", None),
+            ("Six", "1.1"),
+            ("requests", None),
+        ]
+        fake_request = mock.Mock(
+            side_effect=lambda url, headers={}: Response(
+                None, b"", None, 200, url, {}, None
+            )
+        )
+        with mock.patch.object(store.session, "request", fake_request):
+            list(store.stream(requirements, jobs=4))
+        self.assertEqual(
+            {key: response.url for key, response in store.responses.items()},
+            {
+                "six": "https://pypi.org/pypi/six/json",
+                "pytz": "https://pypi.org/pypi/pytz/json",
+                "requests": "https://pypi.org/pypi/requests/json",
+            },
+        )
+
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession(
+            {
+                "https://pypi.org/pypi/{}/json".format(name): {"info": {}}
+                for name in ("six", "pytz", "requests")
+            }
+        )
+        self.store = PackageStore(session=self.session)
+        self.requirements = [
+            ("six", "1.0"),
+            ("pytz", "2015.4"),
+            ("Six", "1.1"),
+            ("requests", "2.0"),
+            ("missing", "0.1"),
+        ]
+
+    def test_results_are_in_input_order(self):
+        for jobs in (1, 4):
+            results = list(self.store.stream(self.requirements, jobs=jobs))
+            self.assertEqual([(r, v) for r, v, _ in results], self.requirements)
+            self.assertEqual(
+                [response.status for _, _, response in results],
+                [200, 200, 200, 200, 404],
+            )
+        # four projects, plus a HEAD to check whether "missing" was renamed.
+        # Failures aren't kept, so "missing" is looked up on each pass
+        self.assertEqual(len(self.session.urls), 7)
+
+    def test_asyncio_engine(self):
+        with FakeIndex() as index:
+            store = PackageStore(base_url=index.pypi_url)
+            requirements = [(r.lower(), v) for r, v in self.requirements]
+            results = list(store.stream(requirements, jobs=4, engine="asyncio"))
+            store.close()
+            self.assertEqual([(r, v) for r, v, _ in results], requirements)
+            self.assertEqual(
+                [response.status for _, _, response in results],
+                [200, 200, 200, 200, 404],
+            )
+            self.assertEqual(results[0][2].json["info"]["name"], "six")
+            self.assertEqual(index.requests, 5)
+
+    def test_responses_are_released_after_last_use(self):
+        stream = self.store.stream(self.requirements, jobs=1, release=True)
+        next(stream)
+        self.assertIn("six", self.store.responses)
+        _, _, response = next(stream)
+        self.assertNotIn("pytz", self.store.responses)
+        self.assertEqual(response.status, 200)
+        next(stream)
+        self.assertNotIn("six", self.store.responses)
+
+
+class TestSlimPackageStore(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession(
+            {
+                "https://pypi.org/simple/six/": {
+                    "name": "six",
+                    "versions": ["1.9.0", "1.10.0", "2.0.0b1"],
+                },
+                "https://pypi.org/pypi/six/1.9.0/json": {
+                    "urls": [{"upload_time": "2015-01-02T09:51:00"}]
+                },
+                "https://pypi.org/pypi/six/1.10.0/json": {
+                    "urls": [{"upload_time": "2015-10-07T01:30:00"}]
+                },
+            }
+        )
+        self.store = PackageStore(session=self.session, slim=True)
+
+    def test_only_needed_releases_are_fetched(self):
+        list(self.store.stream([("six", "1.10.0")]))
+        self.assertEqual(
+            self.session.urls,
+            [
+                "https://pypi.org/simple/six/",
+                "https://pypi.org/pypi/six/1.10.0/json",
+            ],
+        )
+
+    def test_release_dates(self):
+        response = lookup(self.store, "six", "1.9.0")
+        latest, latest_date = get_version_and_release_date("six", response=response)
+        pinned, pinned_date = get_version_and_release_date(
+            "six", "1.9.0", response=response
+        )
+        self.assertEqual((latest, pinned), ("1.10.0", "1.9.0"))
+        self.assertEqual((latest_date - pinned_date).days, 277)
+
+    def test_versions_added_after_the_first_fetch(self):
+        lookup(self.store, "six")
+        lookup(self.store, "six", "1.9.0")
+        lookup(self.store, "six", "1.9.0")
+        self.assertEqual(len(self.session.urls), 3)
+
+    def test_falls_back_to_project_json(self):
+        self.session.request = mock.Mock(
+            side_effect=[
+                Response(None, b"<html>", None, 200, "", {}, None),
+                Response(None, b"{}", {"info": {}}, 200, "", {}, None),
+            ]
+        )
+        response = lookup(self.store, "six")
+        self.assertEqual(response.json, {"info": {}})
+
+    def test_versions_from_file_names(self):
+        # PEP 691 responses from indexes without PEP 700 don't list versions
+        self.session.documents["https://pypi.org/simple/six/"] = {
+            "name": "six",
+            "files": [
+                {"filename": "six-1.9.0.tar.gz"},
+                {"filename": "six-1.9.0-py2.py3-none-any.whl"},
+                {"filename": "six-1.10.0.zip"},
+            ],
+        }
+        response = lookup(self.store, "six", "1.9.0")
+        self.assertEqual(list(response.json["releases"]), ["1.9.0", "1.10.0"])
+        self.assertEqual(len(self.session.urls), 3)
+
+    def test_falls_back_to_project_json_without_versions(self):
+        self.session.documents["https://pypi.org/simple/six/"] = {"name": "six"}
+        self.session.documents["https://pypi.org/pypi/six/json"] = {"info": {}}
+        response = lookup(self.store, "six")
+        self.assertEqual(response.json, {"info": {}})
+
+
 if __name__ == "__main__":
     unittest.main()
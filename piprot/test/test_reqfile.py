@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+import os
+import tempfile
+import unittest
+from six import StringIO
+
+from piprot.reqfile import (
+    Comment,
+    Include,
+    IncludeResolver,
+    Option,
+    Requirement,
+    logical_lines,
+    parse_requirements,
+)
+
+
+def parse(text):
+    return list(parse_requirements(StringIO(text)))
+
+
+class TestLogicalLines(unittest.TestCase):
+    def test_continuations_are_joined(self):
+        lines = list(logical_lines(["a==1 \\\n", "  --hash=x\n", "b==2\n"]))
+        self.assertEqual(lines[0][:2], (1, "a==1   --hash=x"))
+        self.assertEqual(lines[0][2], "a==1 \\\n  --hash=x\n")
+        self.assertEqual(lines[1][:2], (3, "b==2"))
+
+    def test_comments_do_not_continue(self):
+        lines = list(logical_lines(["# a comment \\\n", "b==2\n"]))
+        self.assertEqual([number for number, _, _ in lines], [1, 2])
+
+    def test_continuation_on_the_last_line(self):
+        lines = list(logical_lines(["a==1 \\\n"]))
+        self.assertEqual(lines, [(1, "a==1 ", "a==1 \\\n")])
+
+
+class TestParseRequirements(unittest.TestCase):
+    def test_pinned(self):
+        (record,) = parse("requests[security, socks]==2.31.0\n")
+        self.assertIsInstance(record, Requirement)
+        self.assertEqual(record.name, "requests")
+        self.assertEqual(record.version, "2.31.0")
+        self.assertEqual(record.extras, ("security", "socks"))
+
+    def test_arbitrary_equality(self):
+        (record,) = parse("Django===1.5.1")
+        self.assertEqual(record.version, "1.5.1")
+
+    def test_not_pinned(self):
+        for line in ("foo>=1.0", "foo==1.*", "foo==1.0,!=1.0.1", "foo"):
+            (record,) = parse(line)
+            self.assertEqual(record.name, "foo")
+            self.assertIsNone(record.version, line)
+
+    def test_markers(self):
+        (record,) = parse('six==1.0 ; python_version < "3.8"  # norot')
+        self.assertEqual(record.version, "1.0")
+        self.assertEqual(record.markers, 'python_version < "3.8"')
+        self.assertTrue(record.ignore)
+
+    def test_hashes(self):
+        (record, comment) = parse(
+            "requests==2.31.0 \\\n"
+            "    --hash=sha256:aaa \\\n"
+            "    --hash sha256:bbb\n"
+            "    # via -r requirements.in\n"
+        )
+        self.assertEqual(record.version, "2.31.0")
+        self.assertEqual(record.hashes, ("sha256:aaa", "sha256:bbb"))
+        self.assertEqual(record.line_number, 1)
+        self.assertIsInstance(comment, Comment)
+        self.assertEqual(comment.line_number, 4)
+
+    def test_includes(self):
+        records = parse(
+            "-r base.txt\n-rdev.txt\n--requirement test.txt\n"
+            "--requirement=docs.txt\n-c constraints.txt\n"
+            '--constraint "more constraints.txt"\n'
+        )
+        self.assertTrue(all(isinstance(r, Include) for r in records))
+        self.assertEqual(
+            [(r.path, r.constraint) for r in records],
+            [
+                ("base.txt", False),
+                ("dev.txt", False),
+                ("test.txt", False),
+                ("docs.txt", False),
+                ("constraints.txt", True),
+                ("more constraints.txt", True),
+            ],
+        )
+
+    def test_editable(self):
+        (vcs, local) = parse(
+            "-e git+https://github.com/sesh/piprot.git#egg=piprot\n--editable .\n"
+        )
+        self.assertTrue(vcs.editable)
+        self.assertEqual(vcs.name, "piprot")
+        self.assertIsNone(vcs.version)
+        self.assertIsNone(local.name)
+        self.assertEqual(local.url, ".")
+
+    def test_urls(self):
+        (direct, plain) = parse(
+            "pkg @ https://example.com/pkg.zip ; sys_platform == 'linux'\n"
+            "https://example.com/other.zip#egg=other\n"
+        )
+        self.assertEqual(direct.name, "pkg")
+        self.assertEqual(direct.url, "https://example.com/pkg.zip")
+        self.assertEqual(direct.markers, "sys_platform == 'linux'")
+        self.assertEqual(plain.name, "other")
+        self.assertIsNone(plain.version)
+
+    def test_options(self):
+        (index, pre) = parse("--index-url https://example.com/simple\n--pre\n")
+        self.assertIsInstance(index, Option)
+        self.assertEqual(index.name, "--index-url")
+        self.assertEqual(index.value, "https://example.com/simple")
+        self.assertEqual((pre.name, pre.value), ("--pre", None))
+
+    def test_is_lazy(self):
+        def lines():
+            yield "a==1\n"
+            raise AssertionError("read too far")
+
+        records = parse_requirements(lines())
+        self.assertEqual(next(records).name, "a")
+
+
+class TestIncludeResolver(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def write(self, content, mtime):
+        with open(self.path, "w") as f:
+            f.write(content)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_files_are_parsed_once(self):
+        resolver = IncludeResolver()
+        self.write("a==1\n", 1000)
+        records = resolver.parse(self.path)
+        self.assertIs(resolver.parse(self.path), records)
+
+    def test_changed_files_are_parsed_again(self):
+        resolver = IncludeResolver()
+        self.write("a==1\n", 1000)
+        resolver.parse(self.path)
+        self.write("a==2\n", 2000)
+        self.assertEqual(resolver.parse(self.path)[0].version, "2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+import socket
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from urllib.error import URLError
+
+from piprot.aio import AsyncSession, EventLoopThread
+from piprot.piprot import build_store
+from piprot.retry import AsyncRetryingSession, RetryingSession, RetryPolicy
+from piprot.test.fakeindex import FakeIndex
+from piprot.thttp import Response, Session
+
+
+def response(status, headers=None):
+    return Response(None, b"", None, status, "https://pypi.org", headers or {}, None)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(retries=3, seed=0)
+
+    def test_retry_after_seconds(self):
+        wait = self.policy.rate_limit_wait(response(429, {"retry-after": "7"}))
+        self.assertEqual(wait, 7)
+
+    def test_retry_after_date(self):
+        now = time.time()
+        headers = {"retry-after": formatdate(now + 30, usegmt=True)}
+        wait = self.policy.rate_limit_wait(response(503, headers), now)
+        self.assertAlmostEqual(wait, 30, delta=1)
+
+    def test_github_rate_limit(self):
+        now = time.time()
+        headers = {
+            "x-ratelimit-remaining": "0",
+            "x-ratelimit-reset": str(int(now) + 20),
+        }
+        wait = self.policy.rate_limit_wait(response(403, headers), now)
+        self.assertAlmostEqual(wait, 20, delta=1)
+
+    def test_forbidden_is_not_rate_limited(self):
+        self.assertIsNone(self.policy.rate_limit_wait(response(403)))
+        self.assertEqual(self.policy.retry_delay(response(403), 0), (None, False))
+
+    def test_retries_server_errors(self):
+        delay, rate_limited = self.policy.retry_delay(response(503), 0)
+        self.assertTrue(0 <= delay <= self.policy.backoff)
+        self.assertFalse(rate_limited)
+
+    def test_does_not_retry_not_found(self):
+        self.assertEqual(self.policy.retry_delay(response(404), 0), (None, False))
+
+    def test_gives_up_after_retries(self):
+        self.assertIsNone(self.policy.retry_delay(response(503), 3)[0])
+        self.assertIsNone(self.policy.error_delay(3))
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for attempt in range(10):
+            self.assertLessEqual(policy.backoff_delay(attempt), 5)
+
+    def test_long_rate_limits_are_not_waited_out(self):
+        delay = self.policy.retry_delay(response(429, {"retry-after": "3600"}), 0)
+        self.assertEqual(delay, (None, True))
+
+
+class TestRetryingSession(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.url = self.index.pypi_url + "/requests/json"
+        self.policy = RetryPolicy(retries=3, backoff=0.01)
+        self.session = RetryingSession(Session(), self.policy)
+
+    def tearDown(self):
+        self.session.close()
+        self.index.stop()
+
+    def test_retries_transient_errors(self):
+        self.index.errors["/pypi/requests/json"] = (503, {}, 2)
+        response = self.session.request(self.url)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.index.requests, 3)
+
+    def test_returns_the_last_error(self):
+        self.index.errors["/pypi/requests/json"] = 502
+        response = self.session.request(self.url)
+        self.assertEqual(response.status, 502)
+        self.assertEqual(self.index.requests, 4)
+
+    def test_waits_for_retry_after(self):
+        self.index.errors["/pypi/requests/json"] = (429, {"Retry-After": "1"}, 1)
+        start = time.time()
+        response = self.session.request(self.url)
+        self.assertEqual(response.status, 200)
+        self.assertGreaterEqual(time.time() - start, 1)
+
+    def test_connection_errors(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        url = "http://127.0.0.1:{}/".format(sock.getsockname()[1])
+        sock.close()
+        with self.assertRaises(URLError):
+            self.session.request(url)
+
+    def test_max_per_host(self):
+        self.index.latency = 0.1
+        self.policy.max_per_host = 1
+        threads = [
+            threading.Thread(target=self.session.request, args=(self.url,))
+            for _ in range(4)
+        ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+    def test_async(self):
+        self.index.errors["/pypi/requests/json"] = (500, {}, 1)
+        loop = EventLoopThread()
+        session = AsyncRetryingSession(AsyncSession(), self.policy)
+        try:
+            response = loop.run(session.request(self.url))
+        finally:
+            loop.run(session.close())
+            loop.close()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.index.requests, 2)
+
+    def test_store(self):
+        self.index.errors["/pypi/requests/json"] = (503, {}, 1)
+        store = build_store(index_url=self.index.pypi_url, retries=2)
+        try:
+            self.assertEqual(store.fetch("requests").status, 200)
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+import json
+import threading
+import unittest
+from urllib.request import urlopen
+
+from piprot.piprot import Checker
+from piprot.server import PiprotServer
+from piprot.test.fakeindex import FakeIndex
+from piprot.thttp import Session
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.server = PiprotServer(
+            ("127.0.0.1", 0),
+            checker=Checker(index_url=self.index.pypi_url, max_packages=100),
+            github_api_url=self.index.github_api_url,
+            github_raw_url=self.index.github_raw_url,
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.checker.close()
+        self.index.stop()
+
+    def post(self, content, query=""):
+        with urlopen(self.server.url + "/check" + query, content.encode()) as f:
+            return json.loads(f.read())
+
+    def test_check_requirements_file(self):
+        report = self.post("requests==1.2.3\nsix==1.8.0\n")
+        self.assertTrue(report["out_of_date"])
+        self.assertEqual(
+            [r["package"] for r in report["requirements"]], ["requests", "six"]
+        )
+
+    def test_responses_are_shared_between_requests(self):
+        self.post("requests==1.2.3\nsix==1.8.0\n")
+        requests = self.index.requests
+        report = self.post("six==1.9.0\n", query="?delay=10000")
+        self.assertFalse(report["out_of_date"])
+        self.assertEqual(self.index.requests, requests)
+
+        health = self.session.request(self.server.url + "/health").json
+        self.assertEqual(health["packages"], 2)
+        self.assertEqual(health["hits"], 1)
+
+    def test_check_github_source(self):
+        response = self.session.request(
+            self.server.url + "/check?source=github:sesh/piprot"
+        )
+        self.assertEqual(response.status, 200)
+        packages = [r["package"] for r in response.json["requirements"]]
+        self.assertEqual(packages, ["requests", "six", "piprot"])
+
+    def test_local_files_are_not_allowed(self):
+        response = self.session.request(
+            self.server.url + "/check?source=/etc/passwd"
+        )
+        self.assertEqual(response.status, 400)
+        self.assertEqual(json.loads(response.content)["error"][:6], "source")
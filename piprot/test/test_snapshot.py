@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from piprot.piprot import main, write_snapshot
+from piprot.snapshot import Snapshot
+from piprot.test.fakeindex import FakeIndex
+
+REQUIREMENTS = "piprot/test/files/test-requirements.txt"
+
+PROJECT = {
+    "info": {"name": "demo"},
+    "releases": {
+        "1.0": [{"upload_time": "2013-05-25T12:00:00", "yanked": False}],
+        "1.1": [
+            {"upload_time": "2013-06-01T12:00:00", "yanked": True},
+            {"upload_time": "2013-06-02T12:00:00", "yanked": True},
+        ],
+        "2.0": [],
+    },
+}
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "snapshot.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        snapshot = Snapshot(self.path, create=True)
+        snapshot.add("demo", PROJECT)
+        snapshot.save()
+        snapshot.close()
+
+        snapshot = Snapshot(self.path)
+        self.addCleanup(snapshot.close)
+        releases = snapshot.get("demo")["releases"]
+        self.assertEqual(
+            releases["1.0"], [{"upload_time": "2013-05-25T12:00:00", "yanked": False}]
+        )
+        self.assertEqual(
+            releases["1.1"], [{"upload_time": "2013-06-01T12:00:00", "yanked": True}]
+        )
+        self.assertEqual(releases["2.0"], [])
+        self.assertEqual(snapshot.response("demo").status, 200)
+        self.assertEqual(snapshot.response("missing").status, 404)
+        self.assertEqual(len(snapshot), 1)
+
+    def test_packages_are_replaced(self):
+        snapshot = Snapshot(self.path, create=True)
+        self.addCleanup(snapshot.close)
+        snapshot.add("demo", PROJECT)
+        snapshot.add("demo", {"info": {}, "releases": {"3.0": []}})
+        self.assertEqual(list(snapshot.get("demo")["releases"]), ["3.0"])
+
+    def test_read_only(self):
+        Snapshot(self.path, create=True).close()
+        snapshot = Snapshot(self.path)
+        self.addCleanup(snapshot.close)
+        with self.assertRaises(Exception):
+            snapshot.add("demo", PROJECT)
+
+
+class TestOffline(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "snapshot.db")
+
+    def tearDown(self):
+        self.index.stop()
+        shutil.rmtree(self.directory)
+
+    def run_main(self, **kwargs):
+        output = io.StringIO()
+        with open(REQUIREMENTS) as f, contextlib.redirect_stdout(output):
+            try:
+                main([f], verbose=True, **kwargs)
+            except SystemExit:
+                pass
+        return output.getvalue()
+
+    def test_offline(self):
+        saved, missing = write_snapshot(
+            self.path,
+            ["requests", "Django", "ipython", "pytz", "piprot", "nope"],
+            index_url=self.index.url,
+        )
+        self.assertEqual((saved, missing), (5, ["nope"]))
+
+        online = self.run_main(index_url=self.index.url)
+        requests = self.index.requests
+        for engine in ("threads", "asyncio"):
+            self.assertEqual(self.run_main(offline=self.path, engine=engine), online)
+        self.assertEqual(self.index.requests, requests)
+
+    def test_missing_packages(self):
+        write_snapshot(self.path, ["requests"], index_url=self.index.url)
+        output = self.run_main(offline=self.path)
+        self.assertIn("requests (1.2.3) is ", output)
+        self.assertIn("Django isn't on PyPI", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
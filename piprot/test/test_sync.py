@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from piprot.piprot import build_store, sync, sync_cache
+from piprot.sync import ChangelogError, get_changes, load_serial, project_name
+from piprot.test.fakeindex import FakeIndex
+
+
+def make_project(name, serial):
+    upload = {
+        "filename": "{}-1.0.tar.gz".format(name),
+        "upload_time": "2020-01-01T00:00:00",
+        "upload_time_iso_8601": "2020-01-01T00:00:00.000000Z",
+        "yanked": False,
+    }
+    return {
+        "info": {"name": name, "version": "1.0"},
+        "last_serial": serial,
+        "releases": {"1.0": [upload]},
+    }
+
+
+class TestChangelog(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.store = build_store(index_url=self.index.url, retries=0)
+
+    def tearDown(self):
+        self.store.close()
+        self.index.stop()
+
+    def test_changes(self):
+        self.index.changelog = [
+            ("requests", "2.0", 0, "new release", 5),
+            ("Django", "1.0", 0, "remove file", 6),
+            ("requests", "2.1", 0, "new release", 7),
+        ]
+        changed, serial = get_changes(self.store.session, self.store.base_url, 5)
+        self.assertEqual(changed, {"django": 6, "requests": 7})
+        self.assertEqual(serial, 7)
+        self.assertEqual(self.index.requests, 1)
+
+    def test_changes_are_paged(self):
+        self.index.changelog = [("pytz", "1", 0, "new release", s) for s in range(5)]
+        self.index.changelog_limit = 2
+        changed, serial = get_changes(
+            self.store.session, self.store.base_url, -1, limit=2
+        )
+        self.assertEqual(changed, {"pytz": 4})
+        self.assertEqual(serial, 4)
+        self.assertEqual(self.index.requests, 3)
+
+    def test_errors(self):
+        self.index.errors["/pypi"] = 500
+        with self.assertRaises(ChangelogError):
+            get_changes(self.store.session, self.store.base_url, 0)
+
+    def test_project_name(self):
+        base, simple = "https://pypi.org/pypi", "https://pypi.org/simple"
+        self.assertEqual(
+            project_name(base + "/Zope.Interface/json", base, simple),
+            "zope-interface",
+        )
+        self.assertEqual(project_name(base + "/six/1.0/json", base, simple), "six")
+        self.assertEqual(project_name(simple + "/six/", base, simple), "six")
+        self.assertIsNone(project_name("https://example.com/six/", base, simple))
+
+
+class TestSyncCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index = FakeIndex(
+            projects={
+                "alpha": make_project("alpha", 10),
+                "beta": make_project("beta", 20),
+            }
+        )
+        self.index.changelog = [("beta", "1.0", 0, "new release", 20)]
+        self.index.start()
+        self.store = build_store(cache_dir=self.path, index_url=self.index.url)
+        self.urls = [
+            self.store.base_url + "/{}/json".format(name) for name in ("alpha", "beta")
+        ]
+
+    def tearDown(self):
+        self.store.close()
+        self.index.stop()
+        shutil.rmtree(self.path)
+
+    def fresh(self, url):
+        return self.store.cache.get(url)[1]
+
+    def test_first_sync_records_the_serial(self):
+        self.assertEqual(sync_cache(self.store), (20, None, []))
+        self.assertEqual(load_serial(self.path, self.store.base_url)[0], 20)
+
+    def test_first_sync_expires_the_cache(self):
+        # alpha changes (at 15) after it's cached, but before the first sync
+        self.store.fetch("alpha")
+        self.index.add_project("alpha", make_project("alpha", 15))
+        self.index.changelog.insert(0, ("alpha", "1.1", 0, "new release", 15))
+
+        self.assertEqual(sync_cache(self.store), (20, None, self.urls[:1]))
+        self.assertFalse(self.fresh(self.urls[0]))
+        self.assertEqual(sync_cache(self.store), (20, {}, []))
+        self.assertFalse(self.fresh(self.urls[0]))
+
+        # fetched after the last sync, so it's up to date
+        self.store.fetch("alpha")
+        self.assertEqual(sync_cache(self.store), (20, {}, []))
+        self.assertTrue(self.fresh(self.urls[0]))
+
+    def test_responses_older_than_since_are_left_alone(self):
+        self.store.fetch("alpha")
+        path = self.store.cache.entries()[0][2]
+        os.utime(path, (1000, 1000))
+        # alpha's serial (10) is before 20 and there's no earlier sync
+        self.assertEqual(sync_cache(self.store, since=20), (20, {}, []))
+        self.assertEqual(os.path.getmtime(path), 1000)
+
+    def test_expires_changed_projects(self):
+        sync_cache(self.store)
+        for name in ("alpha", "beta"):
+            self.store.fetch(name)
+        for url in self.urls:
+            self.store.cache.expire(url)
+
+        self.index.add_project("alpha", make_project("alpha", 21))
+        self.index.changelog.append(("alpha", "1.1", 0, "new release", 21))
+        serial, changed, expired = sync_cache(self.store)
+
+        self.assertEqual(serial, 21)
+        self.assertEqual(changed, {"alpha": 21})
+        self.assertEqual(expired, self.urls[:1])
+        self.assertFalse(self.fresh(self.urls[0]))
+        # beta hasn't changed, its response is good for another ttl
+        self.assertTrue(self.fresh(self.urls[1]))
+        self.assertEqual(load_serial(self.path, self.store.base_url)[0], 21)
+
+    def test_responses_newer_than_the_change_are_kept(self):
+        sync_cache(self.store)
+        self.index.add_project("alpha", make_project("alpha", 21))
+        self.index.changelog.append(("alpha", "1.1", 0, "new release", 21))
+        self.store.fetch("alpha")
+
+        self.assertEqual(sync_cache(self.store)[2], [])
+        self.assertTrue(self.fresh(self.urls[0]))
+
+    def test_refresh(self):
+        self.store.fetch("alpha")
+        self.index.changelog.append(("alpha", "1.1", 0, "new release", 21))
+        requests = self.index.requests
+
+        sync_cache(self.store, since=20, refresh=True)
+        self.assertTrue(self.fresh(self.urls[0]))
+        # the changelog, then alpha again
+        self.assertEqual(self.index.requests, requests + 2)
+
+    def test_command(self):
+        self.index.changelog.append(("alpha", "1.1", 0, "new release", 21))
+        args = ["--cache-dir", self.path, "-i", self.index.url]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sync(args)
+            sync(args + ["--since", "20"])
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                "Recorded serial 21, 0 cached responses expired",
+                "Synced to serial 21: 1 changed projects, 0 cached responses expired",
+            ],
+        )
+        self.assertTrue(os.path.isfile(os.path.join(self.path, "serial.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+import os
+import socket
+import ssl
+import unittest
+from urllib.error import URLError
+
+from piprot.test.fakeindex import FILES, FakeIndex
+from piprot.thttp import Session, request
+
+
+class TestRequest(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.url = self.index.url + "/http"
+
+    def tearDown(self):
+        self.index.stop()
+
+    def test_cannot_provide_json_and_data(self):
+        with self.assertRaises(Exception):
+            request(
+                self.url + "/anything",
+                json={"name": "Brenton"},
+                data="This is some form data",
+            )
+
+    def test_should_fail_if_json_or_data_and_not_p_method(self):
+        with self.assertRaises(Exception):
+            request(self.url + "/anything", json={"name": "Brenton"})
+
+        with self.assertRaises(Exception):
+            request(self.url + "/anything", json={"name": "Brenton"}, method="HEAD")
+
+    def test_should_set_content_type_for_json_request(self):
+        response = request(
+            self.url + "/anything", json={"name": "Brenton"}, method="POST"
+        )
+        self.assertEqual(response.request.headers["Content-type"], "application/json")
+        self.assertEqual(response.json["json"], {"name": "Brenton"})
+
+    def test_should_work(self):
+        response = request(self.url + "/anything")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.json["method"], "GET")
+
+    def test_should_create_url_from_params(self):
+        response = request(
+            self.url + "/anything",
+            params={"name": "brenton", "library": "tiny-request"},
+        )
+        self.assertEqual(
+            response.url, self.url + "/anything?name=brenton&library=tiny-request"
+        )
+        self.assertEqual(response.json["args"]["library"], "tiny-request")
+
+    def test_should_return_headers(self):
+        response = request(
+            self.url + "/response-headers", params={"Test-Header": "value"}
+        )
+        self.assertEqual(response.headers["test-header"], "value")
+
+    def test_should_populate_json(self):
+        response = request(self.url + "/anything")
+        self.assertTrue("headers" in response.json)
+
+    def test_should_return_response_for_404(self):
+        response = request(self.url + "/404")
+        self.assertEqual(response.status, 404)
+        self.assertTrue("text/plain" in response.headers["content-type"])
+
+    def test_should_fail_with_bad_ssl(self):
+        with TLSIndex() as index:
+            with self.assertRaises(URLError):
+                request(index.https_url + "/http/anything")
+
+    def test_should_load_bad_ssl_with_verify_false(self):
+        with TLSIndex() as index:
+            response = request(index.https_url + "/http/anything", verify=False)
+        self.assertEqual(response.status, 200)
+
+    def test_should_form_encode_non_json_post_requests(self):
+        response = request(
+            self.url + "/anything", data={"name": "test-user"}, method="POST"
+        )
+        self.assertEqual(response.json["form"]["name"], ["test-user"])
+
+    def test_should_follow_redirect(self):
+        response = request(
+            self.url + "/redirect-to", params={"url": self.url + "/anything"}
+        )
+        self.assertEqual(response.url, self.url + "/anything")
+        self.assertEqual(response.status, 200)
+
+    def test_should_not_follow_redirect_if_redirect_false(self):
+        response = request(
+            self.url + "/redirect-to",
+            params={"url": self.url + "/anything"},
+            redirect=False,
+        )
+        self.assertEqual(response.status, 302)
+
+    def test_cookies(self):
+        response = request(
+            self.url + "/cookies/set", params={"cookie": "test"}, redirect=False
+        )
+        response = request(self.url + "/cookies", cookiejar=response.cookiejar)
+        self.assertEqual(response.json["cookie"], "test")
+
+    def test_basic_auth(self):
+        response = request(
+            self.url + "/basic-auth/user/passwd", basic_auth=("user", "passwd")
+        )
+        self.assertEqual(response.json["authorized"], True)
+
+        response = request(self.url + "/basic-auth/user/passwd")
+        self.assertEqual(response.status, 401)
+
+    def test_should_handle_gzip(self):
+        response = request(self.url + "/gzip", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.json["gzipped"], True)
+
+    def test_should_handle_gzip_error(self):
+        response = request(
+            self.url + "/status/418", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.content, b"I'm a Teapot")
+
+    def test_should_timeout(self):
+        with self.assertRaises((TimeoutError, socket.timeout)):
+            request(self.url + "/delay/1", timeout=0.2)
+
+    def test_should_handle_head_requests(self):
+        response = request(self.url + "/anything", method="HEAD")
+        self.assertTrue(response.content == b"")
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeIndex()
+        self.index.start()
+        self.url = self.index.url + "/http"
+
+    def tearDown(self):
+        self.index.stop()
+
+    def test_should_reuse_connections(self):
+        with Session() as session:
+            session.request(self.url + "/anything")
+            response = session.request(self.url + "/anything")
+            self.assertEqual(response.status, 200)
+            key = ("http", "127.0.0.1", self.index.server_address[1])
+            self.assertEqual(len(session.pool[key]), 1)
+
+    def test_should_follow_redirect(self):
+        with Session() as session:
+            response = session.request(
+                self.url + "/redirect-to", params={"url": self.url + "/anything"}
+            )
+            self.assertEqual(response.url, self.url + "/anything")
+            self.assertEqual(response.status, 200)
+
+    def test_should_drop_credentials_on_redirect_to_another_host(self):
+        other = "http://localhost:{}/http/anything".format(self.index.server_address[1])
+        headers = {"Authorization": "token secret", "Cookie": "session=secret"}
+        with Session() as session:
+            response = session.request(
+                self.url + "/redirect-to", params={"url": other}, headers=headers
+            )
+            self.assertEqual(response.url, other)
+            self.assertNotIn("authorization", response.json["headers"])
+            self.assertNotIn("cookie", response.json["headers"])
+
+            response = session.request(
+                self.url + "/redirect-to",
+                params={"url": self.url + "/anything"},
+                headers=headers,
+            )
+            self.assertEqual(response.json["headers"]["authorization"], "token secret")
+
+    def test_should_not_follow_redirect_if_redirect_false(self):
+        with Session() as session:
+            response = session.request(
+                self.url + "/redirect-to",
+                params={"url": self.url + "/anything"},
+                redirect=False,
+            )
+            self.assertEqual(response.status, 302)
+
+    def test_should_keep_cookies(self):
+        with Session() as session:
+            session.request(
+                self.url + "/cookies/set", params={"cookie": "test"}, redirect=False
+            )
+            response = session.request(self.url + "/cookies")
+            self.assertEqual(response.json["cookie"], "test")
+
+    def test_should_handle_gzip(self):
+        with Session() as session:
+            response = session.request(
+                self.url + "/gzip", headers={"Accept-Encoding": "gzip"}
+            )
+            self.assertEqual(response.json["gzipped"], True)
+
+    def test_should_fail_with_bad_ssl(self):
+        with TLSIndex() as index, Session() as session:
+            with self.assertRaises(URLError):
+                session.request(index.https_url + "/http/anything")
+
+
+class TLSIndex(FakeIndex):
+    """a FakeIndex served over TLS with a self-signed certificate"""
+
+    def __init__(self, *args, **kwargs):
+        super(TLSIndex, self).__init__(*args, **kwargs)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(os.path.join(FILES, "tls", "keycert.pem"))
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def https_url(self):
+        return "https://127.0.0.1:{}".format(self.server_address[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
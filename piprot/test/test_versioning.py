@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 import unittest
 
-from piprot.piprot import parse_version
+from piprot.piprot import get_latest_version, parse_version
 
 
 class TestRequirementsParser(unittest.TestCase):
@@ -45,8 +45,8 @@ class TestRequirementsParser(unittest.TestCase):
             # 42: regex
             ("2014.12.24", [2014, 12, 24]),
             ("2013-12-31", [2013, 12, 31]),
-            # 45: Kombu
-            ("3.0.17-20140602", [3, 0, 17, 20140602]),
+            # 45: Kombu, a PEP 440 post release (3.0.17.post20140602)
+            ("3.0.17-20140602", [3, 0, 17]),
             (
                 "1234567",
                 [
@@ -60,3 +60,49 @@ class TestRequirementsParser(unittest.TestCase):
 
         for version, parts in version_examples:
             self.assertEqual(parse_version(version).parts, parts)
+
+    def test_pep440_ordering(self):
+        ordered = [
+            "1.0.dev1",
+            "1.0a1",
+            "1.0a2.dev1",
+            "1.0a2",
+            "1.0b1",
+            "1.0rc1",
+            "1.0",
+            "1.0+local.1",
+            "1.0.post1.dev1",
+            "1.0.post1",
+            "1.1",
+            "1!0.1",
+        ]
+        versions = [parse_version(v) for v in ordered]
+        self.assertEqual(sorted(reversed(versions)), versions)
+
+    def test_prereleases(self):
+        self.assertTrue(parse_version("1.0rc1").is_prerelease())
+        self.assertTrue(parse_version("1.0.dev3").is_prerelease())
+        self.assertFalse(parse_version("1.0.post1").is_prerelease())
+        self.assertFalse(parse_version("2015.4").is_prerelease())
+
+    def test_trailing_zeros_are_equal(self):
+        self.assertEqual(parse_version("3.2"), parse_version("3.2.0"))
+
+    def test_hyphenated_post_releases(self):
+        self.assertEqual(parse_version("1.0-1"), parse_version("1.0.post1"))
+        self.assertTrue(parse_version("1.0-1") < parse_version("1.0.1"))
+        self.assertEqual(str(parse_version("1.0-1")), "1.0-1")
+        self.assertTrue(parse_version("3.0.17-20140602") < parse_version("3.0.18"))
+
+    def test_versions_are_immutable(self):
+        v1 = parse_version("3.2")
+        v2 = parse_version("3.2.1")
+        self.assertTrue(v1 < v2)
+        self.assertEqual(v1.parts, [3, 2])
+        with self.assertRaises(AttributeError):
+            v1.version = "4.0"
+
+    def test_latest_version(self):
+        self.assertEqual(get_latest_version(["1.0", "1.10", "1.9", "2.0b1"]), "1.10")
+        self.assertEqual(get_latest_version(["2.0b1", "2.0a1"]), "2.0b1")
+        self.assertEqual(get_latest_version([]), None)
@@ -6,7 +6,9 @@ https://github.com/sesh/thttp
 """
 
 import gzip
+import http.client
 import ssl
+import threading
 import json as json_lib
 
 from base64 import b64encode
@@ -14,10 +16,12 @@ from collections import namedtuple
 
 from http.cookiejar import CookieJar
 from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urljoin, urlsplit
 from urllib.request import (
     Request,
     build_opener,
+    getproxies,
+    proxy_bypass,
     HTTPRedirectHandler,
     HTTPSHandler,
     HTTPCookieProcessor,
@@ -32,6 +36,73 @@ class NoRedirect(HTTPRedirectHandler):
         return None
 
 
+def prepare_request(url, params, json, data, headers, method, basic_auth):
+    """
+    Returns the (url, data, headers, method) to send for the given request
+    arguments, see request() for details.
+    """
+    method = method.upper()
+    headers = {k.lower(): v for k, v in headers.items()}  # lowercase headers
+
+    if params:
+        url += "?" + urlencode(params)  # build URL from query parameters
+
+    if json and data:
+        raise Exception("Cannot provide both json and data parameters")
+
+    if method not in ["POST", "PATCH", "PUT"] and (json or data):
+        raise Exception(
+            "Request method must POST, PATCH or PUT if json or data is provided"
+        )
+
+    if json:  # if we have json, dump it to a string and put it in our data variable
+        headers["content-type"] = "application/json"
+        data = json_lib.dumps(json).encode("utf-8")
+    elif data and not isinstance(data, bytes):  # bytes are sent as they are
+        data = urlencode(data).encode()
+
+    if basic_auth and len(basic_auth) == 2 and "authorization" not in headers:
+        username, password = basic_auth
+        headers[
+            "authorization"
+        ] = f'Basic {b64encode(f"{username}:{password}".encode()).decode("ascii")}'
+
+    return url, data, headers, method
+
+
+def decode_content(headers, content):
+    """
+    Returns (content, json) with the content gunzipped and decoded as JSON
+    based on the (lowercased) response headers.
+    """
+    if "gzip" in headers.get("content-encoding", ""):
+        content = gzip.decompress(content)
+
+    content_type = headers.get("content-type", "").lower().split(";")[0].strip()
+    json = (
+        json_lib.loads(content)
+        if (content_type == "application/json" or content_type.endswith("+json"))
+        and content
+        else None
+    )
+    return content, json
+
+
+def redirect_headers(headers, url, location):
+    """
+    Returns the headers to send when a request for url is redirected to
+    location. The credentials (authorization and cookie) are dropped when
+    location is on another host.
+    """
+    headers = dict(headers)
+    netloc = urlsplit(location).netloc
+    if netloc != urlsplit(url).netloc:
+        headers.pop("authorization", None)
+        headers.pop("cookie", None)
+    headers["host"] = netloc
+    return headers
+
+
 def request(
     url,
     params={},
@@ -56,35 +127,13 @@ def request(
         - url (final url, after any redirects)
         - cookiejar
     """
-    method = method.upper()
-    headers = {k.lower(): v for k, v in headers.items()}  # lowercase headers
-
-    if params:
-        url += "?" + urlencode(params)  # build URL from query parameters
-
-    if json and data:
-        raise Exception("Cannot provide both json and data parameters")
-
-    if method not in ["POST", "PATCH", "PUT"] and (json or data):
-        raise Exception(
-            "Request method must POST, PATCH or PUT if json or data is provided"
-        )
+    url, data, headers, method = prepare_request(
+        url, params, json, data, headers, method, basic_auth
+    )
 
     if not timeout:
         timeout = 60
 
-    if json:  # if we have json, dump it to a string and put it in our data variable
-        headers["content-type"] = "application/json"
-        data = json_lib.dumps(json).encode("utf-8")
-    elif data:
-        data = urlencode(data).encode()
-
-    if basic_auth and len(basic_auth) == 2 and "authorization" not in headers:
-        username, password = basic_auth
-        headers[
-            "authorization"
-        ] = f'Basic {b64encode(f"{username}:{password}".encode()).decode("ascii")}'
-
     if not cookiejar:
         cookiejar = CookieJar()
 
@@ -108,152 +157,175 @@ def request(
         with opener.open(req, timeout=timeout) as resp:
             status, content, resp_url = (resp.getcode(), resp.read(), resp.geturl())
             headers = {k.lower(): v for k, v in list(resp.info().items())}
-
-            if "gzip" in headers.get("content-encoding", ""):
-                content = gzip.decompress(content)
-
-            json = (
-                json_lib.loads(content)
-                if "application/json" in headers.get("content-type", "").lower()
-                and content
-                else None
-            )
+            content, json = decode_content(headers, content)
     except HTTPError as e:
         status, content, resp_url = (e.code, e.read(), e.geturl())
         headers = {k.lower(): v for k, v in list(e.headers.items())}
-
-        if "gzip" in headers.get("content-encoding", ""):
-            content = gzip.decompress(content)
-
-        json = (
-            json_lib.loads(content)
-            if "application/json" in headers.get("content-type", "").lower() and content
-            else None
-        )
+        content, json = decode_content(headers, content)
 
     return Response(req, content, json, status, resp_url, headers, cookiejar)
 
 
-import unittest
-
+class Session:
+    """
+    Makes requests over persistent (keep-alive) connections that are pooled
+    per host and share a single SSL context and cookiejar.
 
-class RequestTestCase(unittest.TestCase):
-    def test_cannot_provide_json_and_data(self):
-        with self.assertRaises(Exception):
-            request(
-                "https://httpbingo.org/post",
-                json={"name": "Brenton"},
-                data="This is some form data",
-            )
+    Session.request() takes the same arguments as request() (except verify,
+    which is set on the session) and returns the same Response tuple. It is
+    safe to share a session between threads, each request borrows an idle
+    connection from the pool (or opens a new one) and returns it when the
+    response has been read.
 
-    def test_should_fail_if_json_or_data_and_not_p_method(self):
-        with self.assertRaises(Exception):
-            request("https://httpbingo.org/post", json={"name": "Brenton"})
+    Requests that need to go through a proxy are passed to request().
+    """
 
-        with self.assertRaises(Exception):
-            request(
-                "https://httpbingo.org/post", json={"name": "Brenton"}, method="HEAD"
+    max_redirects = 10
+    max_idle = 10
+
+    def __init__(self, verify=True, timeout=None, cookiejar=None):
+        self.verify = verify
+        self.timeout = timeout or 60
+        self.cookiejar = cookiejar if cookiejar is not None else CookieJar()
+        self.ctx = ssl.create_default_context()
+        if not verify:  # ignore ssl errors
+            self.ctx.check_hostname = False
+            self.ctx.verify_mode = ssl.CERT_NONE
+        self.pool = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            pool, self.pool = self.pool, {}
+        for connections in pool.values():
+            for conn in connections:
+                conn.close()
+
+    def get_connection(self, key, timeout):
+        with self.lock:
+            idle = self.pool.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(
+                host, port, timeout=timeout, context=self.ctx
+            )
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def release_connection(self, key, conn):
+        with self.lock:
+            idle = self.pool.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def send(self, req, timeout):
+        """
+        Sends a urllib Request over a pooled connection, returning
+        (status, content, headers, http.client.HTTPResponse). A reused
+        connection that has been closed by the server is retried once on a
+        fresh connection.
+        """
+        parts = urlsplit(req.full_url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        selector = parts.path or "/"
+        if parts.query:
+            selector += "?" + parts.query
+
+        while True:
+            conn, reused = self.get_connection(key, timeout)
+            try:
+                conn.request(
+                    req.get_method(), selector, req.data, dict(req.header_items())
+                )
+                resp = conn.getresponse()
+                content = resp.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                conn.close()
+                if reused:
+                    continue
+                raise URLError(e)
+            except OSError as e:
+                conn.close()
+                if isinstance(e, TimeoutError):
+                    raise
+                raise URLError(e)
+            break
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self.release_connection(key, conn)
+
+        headers = {k.lower(): v for k, v in resp.getheaders()}
+        return resp.status, content, headers, resp
+
+    def request(
+        self,
+        url,
+        params={},
+        json=None,
+        data=None,
+        headers={},
+        method="GET",
+        redirect=True,
+        basic_auth=None,
+        timeout=None,
+    ):
+        timeout = timeout or self.timeout
+
+        parts = urlsplit(url)
+        if parts.scheme in getproxies() and not proxy_bypass(parts.hostname):
+            return request(
+                url,
+                params=params,
+                json=json,
+                data=data,
+                headers=headers,
+                method=method,
+                verify=self.verify,
+                redirect=redirect,
+                cookiejar=self.cookiejar,
+                basic_auth=basic_auth,
+                timeout=timeout,
             )
 
-    def test_should_set_content_type_for_json_request(self):
-        response = request(
-            "https://httpbingo.org/post", json={"name": "Brenton"}, method="POST"
-        )
-        self.assertEqual(response.request.headers["Content-type"], "application/json")
-
-    def test_should_work(self):
-        response = request("https://httpbingo.org/get")
-        self.assertEqual(response.status, 200)
-
-    def test_should_create_url_from_params(self):
-        response = request(
-            "https://httpbingo.org/get",
-            params={"name": "brenton", "library": "tiny-request"},
-        )
-        self.assertEqual(
-            response.url, "https://httpbingo.org/get?name=brenton&library=tiny-request"
-        )
-
-    def test_should_return_headers(self):
-        response = request(
-            "https://httpbingo.org/response-headers", params={"Test-Header": "value"}
-        )
-        self.assertEqual(response.headers["test-header"], "value")
-
-    def test_should_populate_json(self):
-        response = request("https://httpbingo.org/json")
-        self.assertTrue("slideshow" in response.json)
-
-    def test_should_return_response_for_404(self):
-        response = request("https://httpbingo.org/404")
-        self.assertEqual(response.status, 404)
-        self.assertTrue("text/plain" in response.headers["content-type"])
-
-    def test_should_fail_with_bad_ssl(self):
-        with self.assertRaises(URLError):
-            response = request("https://expired.badssl.com/")
-
-    def test_should_load_bad_ssl_with_verify_false(self):
-        response = request("https://expired.badssl.com/", verify=False)
-        self.assertEqual(response.status, 200)
-
-    def test_should_form_encode_non_json_post_requests(self):
-        response = request(
-            "https://httpbingo.org/post", data={"name": "test-user"}, method="POST"
-        )
-        self.assertEqual(response.json["form"]["name"], ["test-user"])
-
-    def test_should_follow_redirect(self):
-        response = request(
-            "https://httpbingo.org/redirect-to",
-            params={"url": "https://duckduckgo.com/"},
-        )
-        self.assertEqual(response.url, "https://duckduckgo.com/")
-        self.assertEqual(response.status, 200)
-
-    def test_should_not_follow_redirect_if_redirect_false(self):
-        response = request(
-            "https://httpbingo.org/redirect-to",
-            params={"url": "https://duckduckgo.com/"},
-            redirect=False,
-        )
-        self.assertEqual(response.status, 302)
-
-    def test_cookies(self):
-        response = request(
-            "https://httpbingo.org/cookies/set",
-            params={"cookie": "test"},
-            redirect=False,
-        )
-        response = request(
-            "https://httpbingo.org/cookies", cookiejar=response.cookiejar
-        )
-        self.assertEqual(response.json["cookie"], "test")
-
-    def test_basic_auth(self):
-        response = request(
-            "http://httpbingo.org/basic-auth/user/passwd", basic_auth=("user", "passwd")
-        )
-        self.assertEqual(response.json["authorized"], True)
-
-    def test_should_handle_gzip(self):
-        response = request(
-            "http://httpbingo.org/gzip", headers={"Accept-Encoding": "gzip"}
-        )
-        self.assertEqual(response.json["gzipped"], True)
-
-    def test_should_handle_gzip_error(self):
-        response = request(
-            "http://httpbingo.org/status/418", headers={"Accept-Encoding": "gzip"}
+        url, data, headers, method = prepare_request(
+            url, params, json, data, headers, method, basic_auth
         )
-        self.assertEqual(response.content, b"I'm a teapot!")
-
-    def test_should_timeout(self):
-        import socket
-
-        with self.assertRaises((TimeoutError, socket.timeout)):
-            response = request("http://httpbingo.org/delay/3", timeout=1)
-
-    def test_should_handle_head_requests(self):
-        response = request("http://httpbingo.org/head", method="HEAD")
-        self.assertTrue(response.content == b"")
+        headers.setdefault("user-agent", "Python-thttp")
+        headers.setdefault("host", urlsplit(url).netloc)
+        if data is not None:
+            headers.setdefault("content-type", "application/x-www-form-urlencoded")
+
+        for _ in range(self.max_redirects + 1):
+            req = Request(url, data=data, headers=headers, method=method)
+            self.cookiejar.add_cookie_header(req)
+            status, content, resp_headers, resp = self.send(req, timeout)
+            self.cookiejar.extract_cookies(resp, req)
+
+            if not (redirect and status in (301, 302, 303, 307, 308)):
+                break
+            if "location" not in resp_headers:
+                break
+
+            location = urljoin(url, resp_headers["location"])
+            headers = redirect_headers(headers, url, location)
+            url = location
+            if status in (301, 302, 303) and method not in ("GET", "HEAD"):
+                method, data = "GET", None
+                headers.pop("content-type", None)
+
+        content, json = decode_content(resp_headers, content)
+        return Response(req, content, json, status, url, resp_headers, self.cookiejar)